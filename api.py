@@ -7,6 +7,7 @@ from typing import Any, List, Optional
 from dotenv import load_dotenv
 import os
 import json
+import numpy as np
 from langchain_ollama import ChatOllama
 from fastapi import Request
 from datetime import datetime
@@ -14,7 +15,7 @@ from datetime import datetime
 # API prompts
 from prompts.pref_explainer import build_explain_prompt
 
-from data.aws.ec2 import fetch_ec2_instances, summarize_cost_by_region
+from data.aws.ec2 import fetch_ec2_instances, summarize_cost_by_region, MAX_RECOMMENDATIONS
 from data.aws.s3 import fetch_s3_data
 from app.nodes.generate_recommendations import generate_recommendations, get_recommendations_and_prompt, generate_s3_recommendations_legacy
 from app.nodes.generate_response import stream_response
@@ -92,7 +93,8 @@ def analyze_ec2_resources(user_id: str, region: str, rules: dict, specific_insta
         analysis_type = "specific instances"
     else:
         print(f"[API] Analyzing all running instances (will limit to top 5 recommendations)")
-        ec2_data = fetch_ec2_instances(region=region)
+        # Only the top 5 are reported, so stop fetching metrics once they are settled
+        ec2_data = fetch_ec2_instances(region=region, top_k=MAX_RECOMMENDATIONS, rules=rules)
         analysis_type = "all instances"
     
     if not ec2_data:
@@ -114,15 +116,15 @@ def analyze_ec2_resources(user_id: str, region: str, rules: dict, specific_insta
     
     if not recommendations:
         # Check if we have instances with low CPU usage that might need attention
-        low_cpu_instances = [inst for inst in ec2_data if inst.get("AverageCPU", 100) < 10]
+        low_cpu_instances = ec2_data.take(np.flatnonzero(ec2_data.numeric["average_cpu"] < 10)[:5])  # Limit to top 5
         
         if low_cpu_instances:
             # Generate a helpful response for low CPU instances in key points format
             response_text = f"## **EC2 Cost Optimization Analysis - Low CPU Usage Instances**\n\n"
             response_text += f"**Key Points:**\n\n"
             
-            for inst in low_cpu_instances[:5]:  # Limit to top 5
-                response_text += f"• **Instance {inst['InstanceId']}** ({inst['InstanceType']}): {inst.get('AverageCPU', 0)}% CPU usage\n"
+            for inst in low_cpu_instances:
+                response_text += f"• **Instance {inst.instance_id}** ({inst.instance_type}): {inst.average_cpu}% CPU usage\n"
             
             response_text += f"\n**Recommendation:** Consider these optimization strategies:\n"
             response_text += f"• **Stop during non-business hours** - Save the full monthly compute cost\n"
@@ -217,17 +219,19 @@ def generate_ec2_recommendation_markdown(recommendation: dict) -> str:
     return markdown
 
 def analyze_s3_resources(user_id: str, region: str, rules: dict, specific_bucket_names: list = None) -> dict:
-    """Analyze S3 resources and return detailed recommendations (limited to first 10 buckets)"""
+    """Analyze S3 resources and return detailed recommendations"""
     print(f"\n[API] Starting S3 resource analysis for user {user_id} in region {region}")
+    # Age histogram edges at the user's transition days, so bytes past each one are exact
+    transition_days = [rule["days"] for rule in rules.get("transitions", [])]
     
     if specific_bucket_names:
         print(f"[API] Analyzing specific buckets: {specific_bucket_names}")
-        s3_data = fetch_s3_data(region=region, bucket_names=specific_bucket_names)
+        s3_data = fetch_s3_data(region=region, bucket_names=specific_bucket_names, age_edges=transition_days)
         analysis_type = "specific buckets"
     else:
-        print(f"[API] Analyzing first 10 buckets")
-        s3_data = fetch_s3_data(region=region)
-        analysis_type = "first 10 buckets"
+        print(f"[API] Analyzing all buckets")
+        s3_data = fetch_s3_data(region=region, age_edges=transition_days)
+        analysis_type = "all buckets"
     
     if not s3_data:
         if specific_bucket_names:
@@ -735,7 +739,7 @@ async def stream_analysis(req: AnalyzeStreamRequest):
             ec2_data = fetch_ec2_instances(instance_ids=specific_instance_ids, region=req.region)
         else:
             print(f"Stream: Analyzing all EC2 instances")
-            ec2_data = fetch_ec2_instances(region=req.region)
+            ec2_data = fetch_ec2_instances(region=req.region, top_k=MAX_RECOMMENDATIONS, rules=rules)
             
         if ec2_data:
             result = get_recommendations_and_prompt(ec2_data, rules)
@@ -747,12 +751,13 @@ async def stream_analysis(req: AnalyzeStreamRequest):
                 prompt = f"EC2 analysis complete for region `{req.region}`. No optimization recommendations are required at this time."
     elif service_type == "s3":
         specific_bucket_names = specific_resources.get("s3_buckets", [])
+        transition_days = [rule["days"] for rule in rules.get("transitions", [])]
         if specific_bucket_names:
             print(f"Stream: Analyzing specific S3 buckets: {specific_bucket_names}")
-            s3_data = fetch_s3_data(region=req.region, bucket_names=specific_bucket_names)
+            s3_data = fetch_s3_data(region=req.region, bucket_names=specific_bucket_names, age_edges=transition_days)
         else:
             print(f"Stream: Analyzing all S3 buckets")
-            s3_data = fetch_s3_data(region=req.region)
+            s3_data = fetch_s3_data(region=req.region, age_edges=transition_days)
             
         if s3_data:
             print(f"Stream: Generating S3 recommendations")
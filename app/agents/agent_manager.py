@@ -115,7 +115,8 @@ class AgentManager:
             "get_instance_status": ["status", "state", "check", "info", "details"],
             "list_instances": ["list", "show", "all instances", "running instances"],
             "delete_schedule": ["delete schedule", "remove schedule", "cancel schedule"],
-            "list_schedules": ["list schedules", "show schedules", "scheduled"]
+            "list_schedules": ["list schedules", "show schedules", "scheduled"],
+            "suggest_schedules": ["suggest schedule", "idle hours", "idle window", "when idle", "recommend schedule"]
         }
         
         # Find best matching action
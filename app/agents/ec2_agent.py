@@ -3,14 +3,15 @@ EC2 Agent for fo.ai
 Provides AI agent tools for EC2 instance management
 """
 
-import boto3
 from typing import Dict, Any, List, Optional
 from datetime import datetime, time, timedelta
 import json
 import re
 from botocore.exceptions import ClientError, NoCredentialsError
 from .base_agent import BaseAgent
-from data.aws.settings import get_boto3_client
+from data.aws.settings import get_boto3_client, get_caller_identity
+from data.aws.ec2 import get_dynamic_ec2_pricing, get_instance_os, collect_ec2_inventory
+from data.aws.idle_schedules import suggest_idle_schedules, IDLE_LOOKBACK_DAYS
 
 class EC2Agent(BaseAgent):
     """
@@ -65,7 +66,8 @@ class EC2Agent(BaseAgent):
                 "description": "Schedule an EC2 instance to shutdown at a specific time",
                 "parameters": {
                     "instance_id": {"type": "string", "required": True, "description": "EC2 instance ID"},
-                    "time_period": {"type": "string", "required": True, "description": "Time period (e.g., '6 PM', 'non-business hours', 'weekend')"},
+                    "time_period": {"type": "string", "required": False, "description": "Time period (e.g., '6 PM', 'non-business hours', 'weekend')"},
+                    "schedule": {"type": "object", "required": False, "description": "Explicit schedule, e.g. a suggest_schedules shutdown_parameters schedule"},
                     "schedule_name": {"type": "string", "required": False, "description": "Custom name for the schedule"}
                 },
                 "help": "Creates a schedule to automatically shutdown an EC2 instance. Supports natural language time descriptions."
@@ -75,11 +77,21 @@ class EC2Agent(BaseAgent):
                 "description": "Schedule an EC2 instance to start at a specific time",
                 "parameters": {
                     "instance_id": {"type": "string", "required": True, "description": "EC2 instance ID"},
-                    "time_period": {"type": "string", "required": True, "description": "Time period (e.g., '8 AM', 'business hours')"},
+                    "time_period": {"type": "string", "required": False, "description": "Time period (e.g., '8 AM', 'business hours')"},
+                    "schedule": {"type": "object", "required": False, "description": "Explicit schedule, e.g. a suggest_schedules startup_parameters schedule"},
                     "schedule_name": {"type": "string", "required": False, "description": "Custom name for the schedule"}
                 },
                 "help": "Creates a schedule to automatically start an EC2 instance. Supports natural language time descriptions."
             },
+            {
+                "name": "suggest_schedules",
+                "description": "Suggest stop/start schedules from the instance's idle hours",
+                "parameters": {
+                    "instance_id": {"type": "string", "required": True, "description": "EC2 instance ID"},
+                    "days": {"type": "integer", "required": False, "description": "Days of hourly CPU history to mine", "default": IDLE_LOOKBACK_DAYS}
+                },
+                "help": "Folds hourly CPU into a 7x24 hour-of-week profile and proposes cron stop/start schedules for windows that are idle every week, with hours and dollars saved."
+            },
             {
                 "name": "get_instance_status",
                 "description": "Get the current status of an EC2 instance",
@@ -133,6 +145,11 @@ class EC2Agent(BaseAgent):
             if param not in parameters or parameters[param] is None:
                 return False
         
+        # Schedules need either a time description or an explicit schedule
+        if action_name in ("schedule_shutdown", "schedule_startup"):
+            if not parameters.get('time_period') and not parameters.get('schedule'):
+                return False
+        
         # Validate instance_id format if present
         if 'instance_id' in parameters:
             if not self._validate_instance_id(parameters['instance_id']):
@@ -163,6 +180,8 @@ class EC2Agent(BaseAgent):
                 result = self._schedule_shutdown(parameters)
             elif action_name == "schedule_startup":
                 result = self._schedule_startup(parameters)
+            elif action_name == "suggest_schedules":
+                result = self._suggest_schedules(parameters)
             elif action_name == "get_instance_status":
                 result = self._get_instance_status(parameters)
             elif action_name == "list_instances":
@@ -350,7 +369,7 @@ class EC2Agent(BaseAgent):
             response = self.lambda_client.create_function(
                 FunctionName=function_name,
                 Runtime='python3.9',
-                Role=f'arn:aws:iam::{boto3.client("sts").get_caller_identity()["Account"]}:role/foai-lambda-ec2-role',
+                Role=f'arn:aws:iam::{get_caller_identity()["Account"]}:role/foai-lambda-ec2-role',
                 Handler='index.lambda_handler',
                 Code={'ZipFile': lambda_code.encode()},
                 Description=f'fo.ai {action} action for {instance_id}',
@@ -380,6 +399,8 @@ class EC2Agent(BaseAgent):
         elif schedule_data['type'] == 'weekly':
             start_hour, start_minute = map(int, schedule_data['start_time'].split(':'))
             cron_expression = f"cron({start_minute} {start_hour} ? * {','.join(schedule_data['days'])} *)"
+        elif schedule_data['type'] == 'cron':
+            cron_expression = schedule_data['cron_expression']
         else:  # specific time
             hour, minute = map(int, schedule_data['time'].split(':'))
             cron_expression = f"cron({minute} {hour} * * ? *)"
@@ -408,11 +429,10 @@ class EC2Agent(BaseAgent):
     def _schedule_shutdown(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Schedule an EC2 instance shutdown"""
         instance_id = parameters['instance_id']
-        time_period = parameters['time_period']
         schedule_name = parameters.get('schedule_name', f"shutdown-{instance_id}")
         
-        # Parse time period
-        schedule_data = self._parse_time_period(time_period)
+        # Use an explicit (e.g. mined) schedule, else parse the time period
+        schedule_data = parameters.get('schedule') or self._parse_time_period(parameters['time_period'])
         
         # Create Lambda function
         lambda_result = self._create_lambda_function(instance_id, "stop", schedule_data)
@@ -452,11 +472,10 @@ class EC2Agent(BaseAgent):
     def _schedule_startup(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Schedule an EC2 instance startup"""
         instance_id = parameters['instance_id']
-        time_period = parameters['time_period']
         schedule_name = parameters.get('schedule_name', f"startup-{instance_id}")
         
-        # Parse time period
-        schedule_data = self._parse_time_period(time_period)
+        # Use an explicit (e.g. mined) schedule, else parse the time period
+        schedule_data = parameters.get('schedule') or self._parse_time_period(parameters['time_period'])
         
         # Create Lambda function
         lambda_result = self._create_lambda_function(instance_id, "start", schedule_data)
@@ -493,33 +512,84 @@ class EC2Agent(BaseAgent):
             "cloudwatch_rule": rule_result['rule_name']
         }
     
+    def _suggest_schedules(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """Propose stop/start schedules from an instance's recurring idle hours"""
+        instance_id = parameters['instance_id']
+        days = int(parameters.get('days') or IDLE_LOOKBACK_DAYS)
+        
+        try:
+            response = self.ec2_client.describe_instances(InstanceIds=[instance_id])
+            instance = response['Reservations'][0]['Instances'][0]
+        except (ClientError, IndexError) as e:
+            return {
+                "success": False,
+                "error": f"Failed to describe instance: {e}"
+            }
+        
+        hourly_cost = get_dynamic_ec2_pricing(instance['InstanceType'], self.region, get_instance_os(instance))
+        proposals = suggest_idle_schedules(
+            [{"InstanceId": instance_id, "InstanceType": instance['InstanceType'], "region": self.region,
+              "estimated_hourly_cost": hourly_cost}],
+            days=days
+        )
+        proposal = proposals.get(instance_id)
+        if not proposal:
+            return {
+                "success": True,
+                "message": f"No recurring idle window found for {instance_id} in the last {days} days",
+                "instance_id": instance_id,
+                "schedules": []
+            }
+        if proposal['AlwaysIdle']:
+            return {
+                "success": True,
+                "message": f"{instance_id} was idle for the whole week - consider stopping it instead of scheduling",
+                "instance_id": instance_id,
+                "monthly_savings": proposal['MonthlySavings'],
+                "schedules": []
+            }
+        
+        best = proposal['Schedules'][0]
+        return {
+            "success": True,
+            "message": (f"{instance_id} is idle {proposal['IdleHoursPerWeek']}h/week; scheduling "
+                        f"{best['description']} saves {best['hours_per_week']}h/week (${best['monthly_savings']:.2f}/month)"),
+            "instance_id": instance_id,
+            "idle_hours_per_week": proposal['IdleHoursPerWeek'],
+            "monthly_savings": proposal['MonthlySavings'],
+            "schedules": proposal['Schedules'],
+            "shutdown_parameters": proposal['shutdown_parameters'],
+            "startup_parameters": proposal['startup_parameters']
+        }
+    
     def _get_instance_status(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Get the current status of an EC2 instance"""
         instance_id = parameters['instance_id']
         
         try:
-            response = self.ec2_client.describe_instances(
-                InstanceIds=[instance_id]
-            )
+            # Inventory only: describe + cached on-demand price, no metrics or Pricing API calls
+            inventory = collect_ec2_inventory(region=self.region, instance_ids=[instance_id], states=None)
             
-            if not response['Reservations']:
+            if not inventory:
                 return {
                     "success": False,
                     "error": f"Instance {instance_id} not found",
                     "instance_id": instance_id
                 }
             
-            instance = response['Reservations'][0]['Instances'][0]
+            instance = inventory.record(0)
             
             return {
                 "success": True,
                 "instance_id": instance_id,
-                "state": instance['State']['Name'],
-                "instance_type": instance['InstanceType'],
-                "availability_zone": instance['Placement']['AvailabilityZone'],
-                "launch_time": instance['LaunchTime'].isoformat(),
-                "public_ip": instance.get('PublicIpAddress'),
-                "private_ip": instance.get('PrivateIpAddress')
+                "state": instance.state,
+                "instance_type": instance.instance_type,
+                "availability_zone": instance.availability_zone,
+                "launch_time": instance.launch_time,
+                "public_ip": instance.public_ip or None,
+                "private_ip": instance.private_ip or None,
+                "hourly_cost": instance.hourly_cost,
+                "monthly_cost": instance.monthly_cost
             }
             
         except ClientError as e:
@@ -531,32 +601,33 @@ class EC2Agent(BaseAgent):
     
     def _list_instances(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """List EC2 instances with optional filtering"""
-        filters = []
-        
-        if 'state' in parameters:
-            filters.append({'Name': 'instance-state-name', 'Values': [parameters['state']]})
-        
-        if 'instance_type' in parameters:
-            filters.append({'Name': 'instance-type', 'Values': [parameters['instance_type']]})
+        state = parameters.get('state')
         
         try:
-            response = self.ec2_client.describe_instances(Filters=filters)
+            # All pages, with on-demand cost from the cached price catalog
+            inventory = collect_ec2_inventory(
+                region=self.region,
+                states=[state] if state else None,
+                instance_type=parameters.get('instance_type')
+            )
             
-            instances = []
-            for reservation in response['Reservations']:
-                for instance in reservation['Instances']:
-                    instances.append({
-                        "instance_id": instance['InstanceId'],
-                        "state": instance['State']['Name'],
-                        "instance_type": instance['InstanceType'],
-                        "availability_zone": instance['Placement']['AvailabilityZone'],
-                        "launch_time": instance['LaunchTime'].isoformat()
-                    })
+            instances = [
+                {
+                    "instance_id": instance.instance_id,
+                    "state": instance.state,
+                    "instance_type": instance.instance_type,
+                    "availability_zone": instance.availability_zone,
+                    "launch_time": instance.launch_time,
+                    "monthly_cost": instance.monthly_cost
+                }
+                for instance in inventory
+            ]
             
             return {
                 "success": True,
                 "instances": instances,
-                "count": len(instances)
+                "count": len(instances),
+                "total_monthly_cost": inventory.total('monthly_cost')
             }
             
         except ClientError as e:
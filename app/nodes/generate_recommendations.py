@@ -1,12 +1,23 @@
 
-from typing import List, Dict
+from typing import List, Dict, Union
+from collections import defaultdict
 from datetime import datetime, timedelta
 import json
+import numpy as np
+from data.aws.fleet import Fleet, InstanceRecord
+from data.aws.instance_catalog import get_instance_type_details
+from data.aws.ec2 import get_downsized_instance_type, apply_recommendation_rules
+from data.aws.price_matrix import reprice_fleet, PRICING_PREFERENCE_KEYS
+from data.aws.s3_stats import bytes_older_than
 from app.state import CostState
 from memory.preferences import get_user_preferences
 
-def generate_recommendations(instances: List[Dict], rules: Dict = None) -> List[Dict]:
-    """Generate EC2 cost optimization recommendations"""
+def generate_recommendations(instances: Union[Fleet, List[Dict]], rules: Dict = None) -> List[Dict]:
+    """
+    Generate EC2 cost optimization recommendations.
+    Rules are applied column-wise on the Fleet; dicts are only built for the returned top 5.
+    When instances span several accounts (org scan), the top 5 are kept per account.
+    """
     if rules is None:
         rules = get_user_preferences("default_user")
     
@@ -14,116 +25,115 @@ def generate_recommendations(instances: List[Dict], rules: Dict = None) -> List[
     print(f"[EC2] Rules: CPU threshold={rules.get('cpu_threshold', 10)}%, "
           f"Min uptime={rules.get('min_uptime_hours', 24)}h, "
           f"Min savings=${rules.get('min_savings_usd', 5)}")
-    
-    recommendations = []
-    skipped_cpu = 0
-    skipped_uptime = 0
-    skipped_savings = 0
-    skipped_tags = 0
-    total_analyzed = 0
-    total_savings_potential = 0
-
-    for instance in instances:
-        total_analyzed += 1
-        instance_id = instance.get("InstanceId")
-        instance_type = instance.get("InstanceType", "unknown")
-        cpu = instance.get("CurrentCPU", 100)
-        avg_cpu = instance.get("AverageCPU", 100)
-        uptime = instance.get("UptimeHours", 0)
-        monthly_cost = instance.get("estimated_monthly_cost", 0.0)
-        savings = instance.get("EstimatedSavings", 0.0)
-        savings_reason = instance.get("SavingsReason", "No reason provided")
-        tags = instance.get("Tags", [])
-        availability_zone = instance.get("AvailabilityZone", "unknown")
-
-        print(f"[EC2] Analyzing {instance_id} ({instance_type})...")
-        print(f"  [CPU] Current: {cpu}%, 7-day avg: {avg_cpu}%")
-        print(f"  [COST] Monthly: ${monthly_cost:.2f}")
-        print(f"  [SAVINGS] Potential: ${savings:.2f}/month")
-        print(f"  [ZONE] {availability_zone}, Uptime: {uptime}h")
-
-        # Check CPU threshold
-        if avg_cpu > rules.get("cpu_threshold", 10):
-            print(f"  [SKIP] CPU threshold exceeded ({avg_cpu}% > {rules.get('cpu_threshold', 10)}%)")
-            skipped_cpu += 1
-            continue
 
-        # Check uptime threshold
-        if uptime < rules.get("min_uptime_hours", 24):
-            print(f"  [SKIP] Uptime threshold not met ({uptime}h < {rules.get('min_uptime_hours', 24)}h)")
-            skipped_uptime += 1
-            continue
+    fleet = Fleet.from_any(instances)
+    # Pricing preferences re-price the whole fleet column-wise before the rules run
+    pricing_preferences = {key: rules[key] for key in PRICING_PREFERENCE_KEYS if key in rules}
+    if pricing_preferences and fleet:
+        fleet = reprice_fleet(fleet, **pricing_preferences)
+    savings = fleet.numeric["estimated_savings"]
 
-        # Check savings threshold
-        min_savings_threshold = rules.get("min_savings_usd", 5)
-        if savings < min_savings_threshold:
-            if avg_cpu < 10:
-                print(f"  [OVERRIDE] Low savings (${savings:.2f}) but low CPU ({avg_cpu}%) - including recommendation")
-            else:
-                print(f"  [SKIP] Savings threshold not met (${savings:.2f} < ${min_savings_threshold})")
-                skipped_savings += 1
-                continue
+    # Same rule order as before: CPU, then uptime, then savings (low CPU overrides low savings), then tags
+    masks = apply_recommendation_rules(fleet, rules)
+    over_cpu, low_uptime, low_savings, overridden = (
+        masks["over_cpu"], masks["low_uptime"], masks["low_savings"], masks["overridden"]
+    )
+    skipped_tags = int(masks["excluded_tags"].sum())
+    candidates = np.flatnonzero(masks["eligible"])
 
-        # Check excluded tags
-        excluded = False
-        for tag in tags:
-            kv = f"{tag.get('Key')}={tag.get('Value')}"
-            if kv in rules.get("excluded_tags", []):
-                print(f"  [SKIP] Excluded tag match: {kv}")
-                excluded = True
-                skipped_tags += 1
-                break
+    total_savings_potential = float(savings[candidates].sum())
+    if overridden.any():
+        print(f"  [OVERRIDE] {int(overridden.sum())} low-savings instances kept because of low CPU (<10%)")
 
-        if excluded:
-            continue
+    # Sort and limit to top 5 recommendations (per account when several accounts were scanned)
+    ranked = candidates[np.argsort(-savings[candidates], kind="stable")]
+    account_codes = fleet.codes["account_id"][ranked]
+    if len(np.unique(account_codes)) > 1:
+        per_account = defaultdict(int)
+        selected = []
+        for i, code in zip(ranked, account_codes):
+            if per_account[code] < 5:
+                per_account[code] += 1
+                selected.append(i)
+        print(f"  [ACCOUNTS] Top recommendations kept for {len(per_account)} accounts")
+    else:
+        selected = ranked[:5]
 
-        # Create recommendation details
+    recommendations = []
+    for i in selected:
+        instance = fleet.record(int(i))
         recommendation_details = {
-            "InstanceId": instance_id,
-            "InstanceType": instance_type,
-            "AvailabilityZone": availability_zone,
-            "CurrentCPU": cpu,
-            "AverageCPU": avg_cpu,
-            "estimated_monthly_cost": monthly_cost,
-            "EstimatedSavings": savings,
-            "SavingsReason": savings_reason,
-            "UptimeHours": uptime,
-            "Tags": tags,
+            "InstanceId": instance.instance_id,
+            "AccountId": instance.account_id,
+            "InstanceType": instance.instance_type,
+            "AvailabilityZone": instance.availability_zone,
+            "CurrentCPU": instance.current_cpu,
+            "AverageCPU": instance.average_cpu,
+            "estimated_monthly_cost": instance.monthly_cost,
+            "EstimatedSavings": instance.estimated_savings,
+            "SavingsReason": instance.savings_reason or "No reason provided",
+            "UptimeHours": instance.uptime_hours,
+            "Tags": [{"Key": key, "Value": value} for key, value in instance.tags],
+            "InstanceTypeDetails": _instance_type_details(instance),
             "Recommendation": generate_detailed_ec2_recommendation(instance),
-            "Priority": "High" if savings > monthly_cost * 0.5 else "Medium" if savings > monthly_cost * 0.25 else "Low"
+            "Priority": "High" if instance.estimated_savings > instance.monthly_cost * 0.5 else "Medium" if instance.estimated_savings > instance.monthly_cost * 0.25 else "Low"
         }
-
         recommendations.append(recommendation_details)
-        total_savings_potential += savings
-        
-        print(f"  [RECOMMENDATION] Added to optimization list")
+
+        print(f"[EC2] {instance.instance_id} ({instance.instance_type}) in {instance.availability_zone}")
+        print(f"  [CPU] Current: {instance.current_cpu}%, 7-day avg: {instance.average_cpu}%")
+        print(f"  [SAVINGS] Potential: ${instance.estimated_savings:.2f}/month of ${instance.monthly_cost:.2f}")
         print(f"  [PRIORITY] {recommendation_details['Priority']}")
         print(f"  [ACTION] {recommendation_details['Recommendation']['Action']}")
-
-    # Sort and limit to top 5 recommendations
-    recommendations.sort(key=lambda x: x.get("EstimatedSavings", 0), reverse=True)
-    recommendations = recommendations[:5]
     
     print(f"\n[EC2] Analysis Summary:")
-    print(f"  [INFO] Total instances analyzed: {total_analyzed}")
+    print(f"  [INFO] Total instances analyzed: {len(fleet)}")
     print(f"  [SUCCESS] Top {len(recommendations)} recommendations generated")
     print(f"  [SAVINGS] Total potential: ${total_savings_potential:.2f}/month")
-    print(f"  [SKIPPED] CPU threshold: {skipped_cpu}, Uptime: {skipped_uptime}, Savings: {skipped_savings}, Tags: {skipped_tags}")
+    print(f"  [SKIPPED] CPU threshold: {int(over_cpu.sum())}, Uptime: {int(low_uptime.sum())}, Savings: {int(low_savings.sum())}, Tags: {skipped_tags}")
     
     return recommendations
 
-def generate_detailed_ec2_recommendation(instance: Dict) -> Dict:
+def _instance_type_details(instance: InstanceRecord) -> Dict:
+    """Catalog specs for the instance's type ({} if the catalog is unavailable)"""
+    region = instance.region if instance.region not in (None, "unknown") else None
+    try:
+        return get_instance_type_details(instance.instance_type, region)
+    except Exception as e:
+        print(f"[EC2] Instance type details unavailable for {instance.instance_type}: {e}")
+        return {}
+
+def generate_detailed_ec2_recommendation(instance: Union[InstanceRecord, Dict]) -> Dict:
     """Generate detailed recommendation based on instance characteristics"""
-    instance_type = instance.get("InstanceType", "")
-    avg_cpu = instance.get("AverageCPU", 0)
-    monthly_cost = instance.get("estimated_monthly_cost", 0)
-    savings = instance.get("EstimatedSavings", 0)
+    if isinstance(instance, InstanceRecord):
+        instance_type = instance.instance_type
+        avg_cpu = instance.average_cpu
+        monthly_cost = instance.monthly_cost
+        savings = instance.estimated_savings
+        region = instance.region
+        savings_reason = instance.savings_reason
+        recommended_type = instance.recommended_type
+        cpu_percentile = instance.cpu_percentile
+    else:
+        instance_type = instance.get("InstanceType", "")
+        avg_cpu = instance.get("AverageCPU", 0)
+        monthly_cost = instance.get("estimated_monthly_cost", 0)
+        savings = instance.get("EstimatedSavings", 0)
+        region = instance.get("region")
+        savings_reason = instance.get("SavingsReason", "")
+        recommended_type = instance.get("RecommendedInstanceType", "")
+        cpu_percentile = instance.get("CPUPercentile", 0)
     
     # Estimate savings for very low CPU instances
     if savings == 0 and avg_cpu < 10 and monthly_cost > 0:
         savings = monthly_cost
     
-    if instance_type.startswith(('t3.', 't2.')) and avg_cpu < 10:
+    if recommended_type and savings_reason.startswith("Rightsize"):
+        action = f"Rightsize to {recommended_type}"
+        reason = (f"Hourly CPU at the rightsizing percentile is {cpu_percentile}% (7-day average {avg_cpu}%) - "
+                  f"{recommended_type} still covers it with headroom")
+        impact = "High" if savings > monthly_cost * 0.25 else "Medium"
+    elif instance_type.startswith(('t3.', 't2.')) and avg_cpu < 10:
         action = "Stop the instance during non-business hours"
         reason = f"Very low CPU usage ({avg_cpu}%) on T-series instance"
         impact = "High"
@@ -140,17 +150,27 @@ def generate_detailed_ec2_recommendation(instance: Dict) -> Dict:
         reason = f"CPU usage ({avg_cpu}%) is within normal range"
         impact = "Low"
     
+    target_type = recommended_type if action.startswith("Rightsize") else ""
+    if "downsiz" in action.lower():
+        try:
+            target_type = get_downsized_instance_type(instance_type, region if region not in (None, "unknown") else None)
+        except Exception as e:
+            print(f"[EC2] Could not resolve a smaller type for {instance_type}: {e}")
+        if target_type:
+            action = f"{action} ({instance_type} -> {target_type})"
+    
     savings_percentage = (savings / monthly_cost) * 100 if monthly_cost > 0 else 0
     
     return {
         "Action": action,
+        "TargetInstanceType": target_type,
         "Reason": reason,
         "Impact": impact,
         "EstimatedSavings": savings,
         "SavingsPercentage": savings_percentage
     }
 
-def get_recommendations_and_prompt(instances: List[Dict], rules: Dict = None) -> Dict:
+def get_recommendations_and_prompt(instances: Union[Fleet, List[Dict]], rules: Dict = None) -> Dict:
     """Generate recommendations and format them for LLM prompt"""
     if rules is None:
         rules = get_user_preferences("default_user")
@@ -173,8 +193,21 @@ def get_recommendations_and_prompt(instances: List[Dict], rules: Dict = None) ->
     prompt_lines.append(f"**Key Points:**")
     prompt_lines.append(f"")
     
+    # Group key points by account when several accounts were scanned
+    accounts = list(dict.fromkeys(r.get('AccountId') for r in recommendations))
+    multi_account = len(accounts) > 1
+    if multi_account:
+        recommendations = sorted(recommendations, key=lambda r: accounts.index(r.get('AccountId')))
+    current_account = None
+
     # Add key points for each instance
     for i, r in enumerate(recommendations, 1):
+        if multi_account and r.get('AccountId') != current_account:
+            current_account = r.get('AccountId')
+            account_savings = sum(x.get('EstimatedSavings', 0) for x in recommendations if x.get('AccountId') == current_account)
+            prompt_lines.append(f"### **Account {current_account or 'unknown'}** (potential savings: ${account_savings:.2f}/month)")
+            prompt_lines.append(f"")
+
         instance_id = r['InstanceId']
         instance_type = r['InstanceType']
         availability_zone = r.get('AvailabilityZone', 'unknown')
@@ -319,11 +352,18 @@ def generate_s3_recommendations_legacy(buckets_data: List[Dict], rules: Dict = N
         most_recent_modified_date = datetime.min
         
         print(f"  [DATE] Analyzing last modified dates...")
-        for group_name, modified_str in last_modified_group.items():
-            modified_dt = parse_custom_datetime(modified_str)
-            if modified_dt > most_recent_modified_date:
-                most_recent_modified_date = modified_dt
-            print(f"    - {group_name}: {modified_str} ({modified_dt.strftime('%Y-%m-%d')})")
+        last_modified_at = object_stats.get("LastModifiedAt")
+        if last_modified_at:
+            # Newest object in the bucket as ISO 8601; the group strings are only for display
+            most_recent_modified_date = datetime.fromisoformat(last_modified_at).astimezone().replace(tzinfo=None)
+            for group_name, modified_str in last_modified_group.items():
+                print(f"    - {group_name}: {modified_str}")
+        else:
+            for group_name, modified_str in last_modified_group.items():
+                modified_dt = parse_custom_datetime(modified_str)
+                if modified_dt > most_recent_modified_date:
+                    most_recent_modified_date = modified_dt
+                print(f"    - {group_name}: {modified_str} ({modified_dt.strftime('%Y-%m-%d')})")
 
         if most_recent_modified_date == datetime.min:
             print(f"  [SKIP] No valid last modified timestamps found")
@@ -363,6 +403,10 @@ def generate_s3_recommendations_legacy(buckets_data: List[Dict], rules: Dict = N
             # Get STANDARD object details
             standard_objects_count = objects_by_storage_class.get('STANDARD', 0)
             standard_objects_size_gb = size_by_storage_class.get('STANDARD', 0) / (1024**3)
+            # Exact STANDARD bytes already past the transition age; None when the stats carry
+            # no histogram edge at transition_days (fetch_s3_data age_edges), so nothing is approximated
+            eligible_bytes = bytes_older_than(object_stats, transition_days)
+            eligible_size_gb = eligible_bytes / (1024**3) if eligible_bytes is not None else None
             
             # Create recommendation based on target storage class
             if target_storage_class == "IA":
@@ -378,6 +422,9 @@ def generate_s3_recommendations_legacy(buckets_data: List[Dict], rules: Dict = N
                 action = f"Add lifecycle rule to transition STANDARD objects older than {transition_days} days to {target_storage_class} storage class"
                 reason = f"Bucket '{bucket_name}' has {standard_objects_count:,} STANDARD objects ({standard_objects_size_gb:.2f} GB) that haven't been modified in {days_since_last_modified} days. Based on your preferences, STANDARD objects older than {transition_days} days should be moved to {target_storage_class} storage."
             
+            if eligible_size_gb is not None:
+                reason += f" {eligible_size_gb:.2f} GB of STANDARD data is already older than {transition_days} days."
+            
             # Calculate impact based on savings percentage
             current_cost = cost_analysis.get('CurrentMonthlyCost', 0)
             potential_savings = cost_analysis.get('PotentialSavings', 0)
@@ -392,6 +439,7 @@ def generate_s3_recommendations_legacy(buckets_data: List[Dict], rules: Dict = N
             
             recommendation_details = {
                 "BucketName": bucket_name,
+                "AccountId": bucket.get("AccountId"),
                 "BasicInfo": basic_info,
                 "ObjectStatistics": object_stats,
                 "CostAnalysis": cost_analysis,
@@ -411,6 +459,7 @@ def generate_s3_recommendations_legacy(buckets_data: List[Dict], rules: Dict = N
                     "LastModifiedDate": most_recent_date.strftime('%Y-%m-%d'),
                     "StandardObjectsCount": standard_objects_count,
                     "StandardObjectsSizeGB": standard_objects_size_gb,
+                    "StandardSizeGBPastTransition": eligible_size_gb,
                     "CurrentStorageClassDistribution": objects_by_storage_class
                 }
             }
@@ -2,6 +2,7 @@
 from langchain_ollama import ChatOllama
 from langchain_core.prompts import PromptTemplate
 from app.state import CostState
+from data.aws.fleet import Fleet
 import pprint
 import os
 from dotenv import load_dotenv
@@ -137,6 +138,8 @@ def generate_response(state: CostState) -> CostState:
     """Generate a natural language response using the LLM"""
     query = state.get("query", "")
     ec2_data = state.get("ec2_data", [])
+    if isinstance(ec2_data, Fleet):
+        ec2_data = ec2_data.to_dicts()
     s3_data = state.get("s3_data", [])
     service_type = state.get("service_type", "general")
     
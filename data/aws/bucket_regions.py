@@ -0,0 +1,118 @@
+"""
+Persistent S3 bucket -> region map for fo.ai
+Buckets practically never move, so each bucket's region is resolved once (from the
+BucketRegion that ListBuckets returns, or GetBucketLocation) and kept in SQLite per
+account. Scans filter by region and pick regional clients before any per-bucket call.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+BUCKET_REGION_STORE_ENABLED = os.getenv("BUCKET_REGION_STORE_ENABLED", "True").lower() == "true"
+BUCKET_REGION_STORE_PATH = os.getenv("BUCKET_REGION_STORE_PATH", ".foai/bucket_regions.db")
+# Stored regions older than this are looked up again (a deleted bucket's name can be reused elsewhere)
+BUCKET_REGION_TTL_SECONDS = int(os.getenv("BUCKET_REGION_TTL_SECONDS", "604800"))
+
+_SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS bucket_regions (
+    account_id TEXT NOT NULL,
+    bucket_name TEXT NOT NULL,
+    region TEXT NOT NULL,
+    resolved_at INTEGER NOT NULL,
+    PRIMARY KEY (account_id, bucket_name)
+) WITHOUT ROWID;
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Per-thread connection to the store, creating the database on first use"""
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        store_dir = os.path.dirname(BUCKET_REGION_STORE_PATH)
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+        conn = sqlite3.connect(BUCKET_REGION_STORE_PATH, timeout=30)
+        with _schema_lock:
+            if not _schema_ready:
+                conn.executescript(_SCHEMA)
+                _schema_ready = True
+        _local.conn = conn
+    return conn
+
+
+def _chunks(items: List[str], size: int = 500) -> Iterable[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def load_bucket_regions(account_id: str, bucket_names: List[str], now: Optional[float] = None) -> Dict[str, str]:
+    """bucket_name -> region for the given buckets whose stored region is still fresh"""
+    conn = _get_connection()
+    oldest = int((now or time.time()) - BUCKET_REGION_TTL_SECONDS)
+    regions = {}
+    for chunk in _chunks(list(bucket_names)):
+        placeholders = ",".join("?" * len(chunk))
+        for bucket_name, region in conn.execute(
+            f"SELECT bucket_name, region FROM bucket_regions WHERE account_id = ? AND resolved_at >= ? "
+            f"AND bucket_name IN ({placeholders})",
+            [account_id or "", oldest, *chunk],
+        ):
+            regions[bucket_name] = region
+    return regions
+
+
+def save_bucket_regions(account_id: str, regions: Dict[str, str]):
+    """Store freshly resolved bucket_name -> region entries"""
+    if not regions:
+        return
+    conn = _get_connection()
+    resolved_at = int(time.time())
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO bucket_regions VALUES (?, ?, ?, ?)",
+            [(account_id or "", bucket_name, region, resolved_at) for bucket_name, region in regions.items()],
+        )
+
+
+def forget_bucket_regions(account_id: str, bucket_names: List[str]):
+    """Drop stored regions (e.g. after a redirect showed one is wrong)"""
+    conn = _get_connection()
+    with conn:
+        conn.executemany(
+            "DELETE FROM bucket_regions WHERE account_id = ? AND bucket_name = ?",
+            [(account_id or "", bucket_name) for bucket_name in bucket_names],
+        )
+
+
+def clear_bucket_region_store(account_id: Optional[str] = None):
+    """Forget stored bucket regions (all, or one account)"""
+    conn = _get_connection()
+    with conn:
+        if account_id:
+            conn.execute("DELETE FROM bucket_regions WHERE account_id = ?", (account_id,))
+        else:
+            conn.execute("DELETE FROM bucket_regions")
+    print("[S3] Bucket region store cleared")
+
+
+def get_bucket_region_store_stats() -> dict:
+    """Get bucket region map statistics"""
+    conn = _get_connection()
+    accounts, buckets = conn.execute(
+        "SELECT COUNT(DISTINCT account_id), COUNT(*) FROM bucket_regions"
+    ).fetchone()
+    return {
+        "path": BUCKET_REGION_STORE_PATH,
+        "accounts": accounts,
+        "buckets": buckets,
+        "ttl_seconds": BUCKET_REGION_TTL_SECONDS,
+    }
@@ -1,20 +1,37 @@
 from datetime import datetime, timedelta
 from datetime import datetime, timedelta, timezone
-import boto3
 from data.aws.settings import get_boto3_client
 import os 
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from data.aws import metrics_store
+from data.aws.rate_limiter import AWSThrottledError, call_with_backoff, raise_if_throttled
 
 DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 
-def fetch_cpu_utilization(instance_id: str, period_minutes: int = 60) -> float:
-    cloudwatch = get_boto3_client("cloudwatch")
+# GetMetricData limits: 500 queries and 100,800 datapoints per request
+METRIC_DATA_MAX_QUERIES = 500
+METRIC_DATA_MAX_DATAPOINTS = 100800
+HOURLY_PERIOD_SECONDS = 3600
+DAILY_PERIOD_SECONDS = 86400
+CPU_METRIC_NAME = "CPUUtilization"
+MEMORY_METRIC_NAMESPACE = os.getenv("MEMORY_METRIC_NAMESPACE", "CWAgent")
+MEMORY_METRIC_NAME = os.getenv("MEMORY_METRIC_NAME", "mem_used_percent")
+# Two-phase fetches: daily averages for the fleet, hourly detail only near the CPU threshold
+TIERED_METRICS_ENABLED = os.getenv("TIERED_METRICS_ENABLED", "True").lower() == "true"
+# Percentage points above the CPU threshold that still get hourly detail
+TIERED_METRICS_MARGIN = float(os.getenv("TIERED_METRICS_MARGIN", "15"))
+
+def fetch_cpu_utilization(instance_id: str, period_minutes: int = 60, region: str = None) -> float:
+    cloudwatch = get_boto3_client("cloudwatch", region=region)
 
     end_time = datetime.utcnow()
     start_time = end_time - timedelta(minutes=period_minutes)
 
     try:
-        response = cloudwatch.get_metric_statistics(
+        response = call_with_backoff(
+            cloudwatch.get_metric_statistics,
             Namespace='AWS/EC2',
             MetricName='CPUUtilization',
             Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
@@ -32,16 +49,18 @@ def fetch_cpu_utilization(instance_id: str, period_minutes: int = 60) -> float:
             return 0.0  # No data = treat as low usage
 
     except Exception as e:
+        raise_if_throttled(e)
         print(f"[ERROR] CloudWatch fetch failed for {instance_id}: {e}")
         return -1.0
 
-def get_avg_cpu_over_days(instance_id: str, days: int = 7) -> float:
-    cloudwatch = boto3.client("cloudwatch")
+def get_avg_cpu_over_days(instance_id: str, days: int = 7, region: str = None) -> float:
+    cloudwatch = get_boto3_client("cloudwatch", region=region)
     now = datetime.now(timezone.utc)
     start_time = now - timedelta(days=days)
 
     try:
-        response = cloudwatch.get_metric_statistics(
+        response = call_with_backoff(
+            cloudwatch.get_metric_statistics,
             Namespace='AWS/EC2',
             MetricName='CPUUtilization',
             Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
@@ -61,20 +80,250 @@ def get_avg_cpu_over_days(instance_id: str, days: int = 7) -> float:
         return round(avg_cpu, 2)
 
     except Exception as e:
+        raise_if_throttled(e)
         print(f"[ERROR] CloudWatch fetch failed for {instance_id}: {e}")
         return -1
-    
-def get_cpu_metrics(instance_id: str, region: str = None) -> dict:
+
+def _summarize_hourly_series(series: List[Tuple[datetime, float]], now: datetime) -> dict:
+    """Turn an hourly CPU series into the 7-day average / current value pair"""
+    if not series:
+        # Same conventions as the single-instance fetchers: -1 = no history, 0.0 = idle now
+        return {"AverageCPU": -1, "CurrentCPU": 0.0, "HourlySeries": []}
+
+    avg_cpu = round(sum(value for _, value in series) / len(series), 2)
+    last_ts, last_value = series[-1]
+    current = round(last_value, 2) if now - last_ts <= timedelta(hours=2) else 0.0
+    return {"AverageCPU": avg_cpu, "CurrentCPU": current, "HourlySeries": series}
+
+def _fetch_hourly_cpu_series(cloudwatch, instance_ids: List[str], start_time: datetime, end_time: datetime,
+                             namespace: str = 'AWS/EC2', metric_name: str = CPU_METRIC_NAME,
+                             unit: Optional[str] = 'Percent',
+                             period: int = HOURLY_PERIOD_SECONDS) -> Tuple[Dict[str, list], set]:
+    """
+    Hourly CPUUtilization series via GetMetricData, up to 500 instances per request
+    (fewer for long windows, to stay under the per-request datapoint limit).
+    namespace / metric_name select another per-instance metric (e.g. CWAgent memory);
+    period selects another resolution (e.g. DAILY_PERIOD_SECONDS).
+    Returns (instance_id -> [(timestamp, value), ...], set of instance_ids whose batch failed).
+    """
+    series = {}
+    failed = set()
+    points_per_series = max(int((end_time - start_time).total_seconds() / period), 1)
+    batch_size = max(min(METRIC_DATA_MAX_QUERIES, METRIC_DATA_MAX_DATAPOINTS // points_per_series), 1)
+
+    for batch_start in range(0, len(instance_ids), batch_size):
+        batch = instance_ids[batch_start:batch_start + batch_size]
+        queries = [
+            {
+                'Id': f"cpu{i}",
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': namespace,
+                        'MetricName': metric_name,
+                        'Dimensions': [{'Name': 'InstanceId', 'Value': instance_id}],
+                    },
+                    'Period': period,
+                    'Stat': 'Average',
+                    **({'Unit': unit} if unit else {}),
+                },
+                'ReturnData': True,
+            }
+            for i, instance_id in enumerate(batch)
+        ]
+        series_by_id = {f"cpu{i}": [] for i in range(len(batch))}
+
+        def read_batch():
+            batch_series = {query_id: [] for query_id in series_by_id}
+            paginator = cloudwatch.get_paginator('get_metric_data')
+            for page in paginator.paginate(
+                MetricDataQueries=queries,
+                StartTime=start_time,
+                EndTime=end_time,
+                ScanBy='TimestampAscending'
+            ):
+                for result in page.get('MetricDataResults', []):
+                    batch_series[result['Id']].extend(zip(result.get('Timestamps', []), result.get('Values', [])))
+            return batch_series
+
+        try:
+            # A throttled batch is re-read from the start, so partial pages never mix in
+            series_by_id = call_with_backoff(read_batch)
+        except Exception as e:
+            # Throttling propagates: a missing series would otherwise read as an idle instance
+            raise_if_throttled(e)
+            print(f"[ERROR] CloudWatch batch fetch failed for {len(batch)} instances: {e}")
+            failed.update(batch)
+            continue
+
+        for i, instance_id in enumerate(batch):
+            series[instance_id] = sorted(series_by_id[f"cpu{i}"])
+
+    return series, failed
+
+def _fetch_hourly_cpu_series_incremental(cloudwatch, instance_ids: List[str], window_start: datetime, now: datetime,
+                                         period: int = HOURLY_PERIOD_SECONDS) -> Tuple[Dict[str, list], set]:
+    """
+    Serve hourly CPU series from the local metrics store, fetching only what it lacks:
+    nothing for series fetched within METRICS_FRESHNESS_SECONDS, the tail since the last
+    fetch for older ones, and the full window for new instances or longer windows.
+    Daily series (period=DAILY_PERIOD_SECONDS) are stored and refreshed the same way.
+    """
+    state = metrics_store.get_series_state(instance_ids, CPU_METRIC_NAME, period)
+    window_start_ts = int(window_start.timestamp())
+    now_ts = int(now.timestamp())
+
+    fetch_groups = defaultdict(list)  # fetch start (epoch seconds) -> instance_ids
+    for instance_id, series_state in state.items():
+        covered = series_state["covered_from"] is not None and series_state["covered_from"] <= window_start_ts
+        if not covered:
+            fetch_groups[window_start_ts].append(instance_id)
+            continue
+        if now_ts - series_state["fetched_at"] < metrics_store.METRICS_FRESHNESS_SECONDS:
+            continue
+        # Re-read the period that was still partial at the last fetch (plus one for ingestion delay)
+        tail_start = (series_state["fetched_at"] // period - 1) * period
+        fetch_groups[max(tail_start, window_start_ts)].append(instance_id)
+
+    failed = set()
+    for start_ts, group in sorted(fetch_groups.items()):
+        start_time = datetime.fromtimestamp(start_ts, tz=timezone.utc)
+        fetched, group_failed = _fetch_hourly_cpu_series(cloudwatch, group, start_time, now, period=period)
+        failed.update(group_failed)
+        if fetched:
+            metrics_store.store_series(CPU_METRIC_NAME, period, fetched, requested_from=start_time)
+
+    fetched_count = sum(len(group) for group in fetch_groups.values())
+    print(f"[CLOUDWATCH] Metrics store: {len(instance_ids) - fetched_count} series fresh, "
+          f"{fetched_count} fetched in {len(fetch_groups)} window(s)")
+
+    series = metrics_store.load_series(instance_ids, CPU_METRIC_NAME, period, window_start)
+    return series, failed
+
+def _fetch_cpu_series(cloudwatch, instance_ids: List[str], window_start: datetime, now: datetime,
+                      period: int = HOURLY_PERIOD_SECONDS) -> Tuple[Dict[str, list], set]:
+    """CPU series at `period` resolution, through the metrics store when it is enabled"""
+    if metrics_store.METRICS_STORE_ENABLED:
+        try:
+            return _fetch_hourly_cpu_series_incremental(cloudwatch, instance_ids, window_start, now, period=period)
+        except AWSThrottledError:
+            raise
+        except Exception as e:
+            print(f"[CLOUDWATCH] Metrics store unavailable, fetching directly: {e}")
+    return _fetch_hourly_cpu_series(cloudwatch, instance_ids, window_start, now, period=period)
+
+def fetch_fleet_daily_cpu(instance_ids: List[str], region: str = None, days: int = 7) -> Dict[str, dict]:
+    """
+    Coarse pass: daily average CPU for a whole fleet (days datapoints per instance instead
+    of days * 24). The window starts at a UTC midnight so daily buckets line up between runs.
+    Returns, per instance: {"AverageCPU": mean of the daily averages (-1 = no data),
+    "CurrentCPU": latest daily average, "DailySeries": [(timestamp, value), ...]}
+    """
+    instance_ids = list(dict.fromkeys(instance_ids))
+    if not instance_ids:
+        return {}
+    cloudwatch = get_boto3_client("cloudwatch", region=region)
+    now = datetime.now(timezone.utc)
+    window_start = (now - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    series, failed = _fetch_cpu_series(cloudwatch, instance_ids, window_start, now, period=DAILY_PERIOD_SECONDS)
+
+    results = {}
+    for instance_id in instance_ids:
+        daily = series.get(instance_id, [])
+        if not daily:
+            results[instance_id] = {"AverageCPU": -1, "CurrentCPU": -1.0 if instance_id in failed else 0.0, "DailySeries": []}
+            continue
+        results[instance_id] = {
+            "AverageCPU": round(sum(value for _, value in daily) / len(daily), 2),
+            "CurrentCPU": round(daily[-1][1], 2),
+            "DailySeries": daily,
+        }
+    return results
+
+def fetch_fleet_cpu_metrics(instance_ids: List[str], region: str = None, days: int = 7,
+                            cpu_threshold: Optional[float] = None,
+                            margin: float = TIERED_METRICS_MARGIN) -> Dict[str, dict]:
+    """
+    Batched CPU metrics for a whole fleet using GetMetricData.
+    Packs up to 500 instance queries per request and, when the local metrics store is
+    enabled, only fetches datapoints it doesn't already have. Returns, per instance:
+    {"AverageCPU": 7-day avg, "CurrentCPU": last hourly avg, "HourlySeries": [(timestamp, value), ...],
+     "Resolution": "hourly" or "daily"}
+
+    With cpu_threshold (and TIERED_METRICS_ENABLED), a daily-average pass runs over the whole
+    fleet first and only instances averaging below cpu_threshold + margin get hourly detail.
+    The rest keep their daily figures: CurrentCPU is the latest daily average and
+    HourlySeries is empty, so percentile and schedule analysis skip them.
+    """
+    results = {}
+    instance_ids = list(dict.fromkeys(instance_ids))
+    if not instance_ids:
+        return results
+
+    detail_ids = instance_ids
+    if cpu_threshold is not None and TIERED_METRICS_ENABLED:
+        coarse = fetch_fleet_daily_cpu(instance_ids, region=region, days=days)
+        limit = cpu_threshold + margin
+        detail_ids = [instance_id for instance_id in instance_ids if 0 <= coarse[instance_id]["AverageCPU"] < limit]
+        for instance_id, metrics in coarse.items():
+            results[instance_id] = {"AverageCPU": metrics["AverageCPU"], "CurrentCPU": metrics["CurrentCPU"],
+                                    "HourlySeries": [], "Resolution": "daily"}
+        print(f"[CLOUDWATCH] Tiered metrics: {len(detail_ids)}/{len(instance_ids)} instances below "
+              f"{limit:g}% daily CPU get hourly detail (~{len(instance_ids) * days + len(detail_ids) * days * 24} "
+              f"datapoints instead of {len(instance_ids) * days * 24})")
+        if not detail_ids:
+            return results
+
+    cloudwatch = get_boto3_client("cloudwatch", region=region)
+    now = datetime.now(timezone.utc)
+    window_start = now - timedelta(days=days)
+    series, failed = _fetch_cpu_series(cloudwatch, detail_ids, window_start, now)
+
+    for instance_id in detail_ids:
+        instance_series = series.get(instance_id, [])
+        if instance_id in failed and not instance_series:
+            results[instance_id] = {"AverageCPU": -1, "CurrentCPU": -1.0, "HourlySeries": []}
+        else:
+            results[instance_id] = _summarize_hourly_series(instance_series, now)
+        results[instance_id]["Resolution"] = "hourly"
+
+    if DEBUG:
+        print(f"[CLOUDWATCH] CPU metrics ready for {len(instance_ids)} instances "
+              f"({len(detail_ids)} hourly, {len(failed)} failed)")
+    return results
+
+def fetch_fleet_memory_series(instance_ids: List[str], region: str = None, days: int = 7) -> Dict[str, list]:
+    """
+    Hourly memory utilization (CloudWatch agent mem_used_percent) per instance, where the
+    agent publishes it with an InstanceId dimension. Instances without data are omitted.
+    """
+    instance_ids = list(dict.fromkeys(instance_ids))
+    if not instance_ids:
+        return {}
+    cloudwatch = get_boto3_client("cloudwatch", region=region)
+    now = datetime.now(timezone.utc)
+    series, _ = _fetch_hourly_cpu_series(
+        cloudwatch, instance_ids, now - timedelta(days=days), now,
+        namespace=MEMORY_METRIC_NAMESPACE, metric_name=MEMORY_METRIC_NAME, unit=None
+    )
+    return {instance_id: values for instance_id, values in series.items() if values}
+
+def get_cpu_metrics(instance_id: str, region: str = None, fleet_metrics: Optional[Dict[str, dict]] = None,
+                    cpu_threshold: Optional[float] = None) -> dict:
     """
     Unified CPU metrics fetcher for recommendation engine.
     Returns: avg over 7d, current hourly avg, and uptime hours.
+    Looks the instance up in a fetch_fleet_cpu_metrics result when one is passed,
+    otherwise fetches a single-instance batch (two-phase when cpu_threshold is given).
+    Resolution says whether the figures are hourly or daily (busy instances in a tiered fetch).
     Note: EstimatedSavings should be calculated separately based on instance type and pricing.
     """
-    avg_cpu = get_avg_cpu_over_days(instance_id)
-    current = fetch_cpu_utilization(instance_id)
+    if fleet_metrics is None or instance_id not in fleet_metrics:
+        fleet_metrics = fetch_fleet_cpu_metrics([instance_id], region=region, cpu_threshold=cpu_threshold)
+    metrics = fleet_metrics[instance_id]
 
     return {
-        "AverageCPU": avg_cpu,
-        "CurrentCPU": current,
+        "AverageCPU": metrics["AverageCPU"],
+        "CurrentCPU": metrics["CurrentCPU"],
+        "Resolution": metrics.get("Resolution", "hourly"),
         "UptimeHours": 140  # Placeholder — could be fetched from instance later
     }
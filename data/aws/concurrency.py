@@ -0,0 +1,104 @@
+"""
+Concurrency helpers for fo.ai AWS collectors
+Bounded thread pools, per-service concurrency limits and stage timing.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import copy_context
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+ENRICHMENT_WORKERS = int(os.getenv("ENRICHMENT_WORKERS", "16"))
+
+# Max in-flight calls per AWS service, across all worker threads
+SERVICE_CONCURRENCY = {
+    "cloudwatch": int(os.getenv("CLOUDWATCH_CONCURRENCY", "8")),
+    "pricing": int(os.getenv("PRICING_CONCURRENCY", "4")),
+    "ec2": int(os.getenv("EC2_CONCURRENCY", "8")),
+    "s3": int(os.getenv("S3_CONCURRENCY", "16")),
+}
+DEFAULT_SERVICE_CONCURRENCY = 8
+
+_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_semaphores_lock = threading.Lock()
+
+
+def _get_semaphore(service: str) -> threading.BoundedSemaphore:
+    with _semaphores_lock:
+        semaphore = _semaphores.get(service)
+        if semaphore is None:
+            limit = SERVICE_CONCURRENCY.get(service, DEFAULT_SERVICE_CONCURRENCY)
+            semaphore = threading.BoundedSemaphore(max(limit, 1))
+            _semaphores[service] = semaphore
+        return semaphore
+
+
+@contextmanager
+def service_slot(service: str):
+    """Hold one of the service's concurrency slots for the duration of the block"""
+    semaphore = _get_semaphore(service)
+    semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def submit_in_context(executor: ThreadPoolExecutor, fn: Callable[..., R], *args, **kwargs) -> Future:
+    """
+    Submit fn so it runs with a copy of the caller's context variables
+    (e.g. the AWS account selected with data.aws.settings.use_account).
+    """
+    return executor.submit(copy_context().run, fn, *args, **kwargs)
+
+
+def bounded_map(fn: Callable[[T], R], items: Iterable[T], workers: Optional[int] = None) -> List[R]:
+    """
+    Apply fn to every item on a bounded thread pool.
+    Results come back in input order regardless of completion order.
+    Workers inherit the caller's context variables.
+    """
+    items = list(items)
+    workers = min(workers or ENRICHMENT_WORKERS, len(items))
+    if workers <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="foai-worker") as executor:
+        futures = [submit_in_context(executor, fn, item) for item in items]
+        return [future.result() for future in futures]
+
+
+class StageTimer:
+    """Accumulates wall time per named stage of a collection run"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, stage_name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[stage_name] = self.stages.get(stage_name, 0.0) + elapsed
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            stages = {stage: round(seconds, 3) for stage, seconds in self.stages.items()}
+        stages["total"] = round(time.perf_counter() - self.started, 3)
+        return stages
+
+    def report(self):
+        stages = self.summary()
+        timings = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in stages.items())
+        print(f"[TIMING] {self.name}: {timings}")
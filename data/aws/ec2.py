@@ -1,14 +1,25 @@
 
-import boto3
 import json
-from typing import List, Dict, Optional
-from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Union
+from datetime import datetime, timedelta, timezone
 import time
 import os
+from data.aws.settings import get_boto3_client, get_active_account_id, AWS_REGION
+from data.aws.rate_limiter import AWSThrottledError, call_with_backoff, raise_if_throttled, print_rate_limiter_stats
+from data.aws.pricing_catalog import get_catalog_hourly_price, PRICING_REGION_NAMES
+from data.aws.concurrency import bounded_map, service_slot, submit_in_context, StageTimer
+from data.aws.fleet import Fleet, InstanceRecord, tags_to_pairs
+from data.aws import inventory_store
+from data.aws.instance_catalog import get_instance_catalog, get_instance_type_info, family_category
+from memory.tiered_cache import TieredCache
 
-# Global cache for pricing data
-_pricing_cache = {}
 DEBUG = os.getenv("DEBUG", "False").lower() == "true"
+PRICING_CACHE_TTL_SECONDS = int(os.getenv("PRICING_CACHE_TTL_SECONDS", "86400"))
+PRICING_CACHE_MAX_ENTRIES = int(os.getenv("PRICING_CACHE_MAX_ENTRIES", "2048"))
+PRICING_FALLBACK_TTL_SECONDS = int(os.getenv("PRICING_FALLBACK_TTL_SECONDS", "900"))  # retry estimated prices sooner
+
+# Shared pricing cache: per-process LRU in front of Redis, so workers and restarts reuse lookups
+_pricing_cache = TieredCache("pricing:ec2", max_entries=PRICING_CACHE_MAX_ENTRIES, ttl_seconds=PRICING_CACHE_TTL_SECONDS)
 
 # Constants
 HOURS_PER_MONTH = 730
@@ -25,14 +36,23 @@ def get_dynamic_ec2_pricing(instance_type: str, region: str, os_type: str = 'Lin
     cache_key = f"{instance_type}_{region}_{os_type}"
     
     # Check cache first
-    if cache_key in _pricing_cache:
-        cached_price = _pricing_cache[cache_key]
-        print(f"[PRICING CACHE] Using cached price for {instance_type}: ${cached_price:.4f}/hour")
+    cached_price = _pricing_cache.get(cache_key)
+    if cached_price is not None:
+        if DEBUG:
+            print(f"[PRICING CACHE] Using cached price for {instance_type}: ${cached_price:.4f}/hour")
         return cached_price
     
+    # Local offer-file catalog answers without a Pricing API round trip
+    catalog_price = get_catalog_hourly_price(instance_type, region, os_type)
+    if catalog_price is not None:
+        if DEBUG:
+            print(f"[PRICING CATALOG] {instance_type} in {region}: ${catalog_price:.4f}/hour")
+        _pricing_cache.set(cache_key, catalog_price)
+        return catalog_price
+    
     try:
         print(f"[PRICING] Fetching current pricing for {instance_type} in {region}...")
-        pricing_client = boto3.client('pricing', region_name='us-east-1')
+        pricing_client = get_boto3_client('pricing', region='us-east-1')
         
         # Map region codes to AWS Pricing API region names
         region_mapping = {
@@ -69,11 +89,14 @@ def get_dynamic_ec2_pricing(instance_type: str, region: str, os_type: str = 'Lin
             {'Type': 'TERM_MATCH', 'Field': 'termType', 'Value': 'OnDemand'},
         ]
         
-        response = pricing_client.get_products(
-            ServiceCode='AmazonEC2',
-            Filters=filters,
-            MaxResults=10
-        )
+        # Gate the API call itself so every caller (price tables, downsize/stop savings) shares the slots
+        with service_slot("pricing"):
+            response = call_with_backoff(
+                pricing_client.get_products,
+                ServiceCode='AmazonEC2',
+                Filters=filters,
+                MaxResults=10
+            )
         
         if response['PriceList']:
             for price_item in response['PriceList']:
@@ -103,7 +126,7 @@ def get_dynamic_ec2_pricing(instance_type: str, region: str, os_type: str = 'Lin
                                 print(f"[PRICING] {instance_type} in {region}: ${hourly_cost:.4f}/hour")
                                 
                                 # Cache the result
-                                _pricing_cache[cache_key] = hourly_cost
+                                _pricing_cache.set(cache_key, hourly_cost)
                                 return hourly_cost
         
         # If no pricing found, try with Linux OS (most common)
@@ -116,18 +139,28 @@ def get_dynamic_ec2_pricing(instance_type: str, region: str, os_type: str = 'Lin
         fallback_price = _get_smart_fallback_pricing(instance_type, region)
         
         print(f"[FALLBACK] Using smart fallback pricing for {instance_type}: ${fallback_price:.4f}/hour")
-        _pricing_cache[cache_key] = fallback_price
+        _pricing_cache.set(cache_key, fallback_price, ttl_seconds=PRICING_FALLBACK_TTL_SECONDS)
         return fallback_price
         
     except Exception as e:
+        raise_if_throttled(e)
         print(f"[PRICING] Error fetching pricing for {instance_type}: {e}")
         
         # Smart fallback on error
         fallback_price = _get_smart_fallback_pricing(instance_type, region)
         print(f"[FALLBACK] Using smart fallback pricing for {instance_type}: ${fallback_price:.4f}/hour")
-        _pricing_cache[cache_key] = fallback_price
+        _pricing_cache.set(cache_key, fallback_price, ttl_seconds=PRICING_FALLBACK_TTL_SECONDS)
         return fallback_price
 
+# Approximate on-demand $/vCPU-hour by family category (us-east-1, Linux)
+FALLBACK_PRICE_PER_VCPU = {
+    'General Purpose': 0.048,
+    'Compute Optimized': 0.0425,
+    'Memory Optimized': 0.063,
+    'Storage Optimized': 0.078,
+    'Accelerated Computing': 0.25,
+}
+
 def _get_smart_fallback_pricing(instance_type: str, region: str) -> float:
     """
     Smart fallback pricing based on instance family patterns and current AWS pricing
@@ -187,6 +220,13 @@ def _get_smart_fallback_pricing(instance_type: str, region: str) -> float:
             estimated_price = base_price * size_multiplier
             return estimated_price
     
+    # Any other family: scale a per-vCPU us-east-1 baseline by the catalog's vCPU count
+    info = get_instance_type_info(instance_type, region)
+    if info and info.vcpu:
+        category, _ = family_category(info.family)
+        per_vcpu = 0.0208 if info.burstable else FALLBACK_PRICE_PER_VCPU.get(category, 0.048)
+        return per_vcpu * info.vcpu
+    
     # Final fallback - reasonable default based on size
     if 'micro' in instance_type: return 0.01
     elif 'small' in instance_type: return 0.02
@@ -198,264 +238,849 @@ def _get_smart_fallback_pricing(instance_type: str, region: str) -> float:
     elif '8xlarge' in instance_type: return 1.28
     else: return 0.05  # Generic default
 
-def get_reserved_instance_pricing(instance_type: str, region: str = 'us-east-1', os_type: str = 'Linux', term: str = '1yr') -> float:
+# Reserved options resolved per (instance type, region, OS): key -> (lease length, purchase option)
+RESERVED_PRICING_OPTIONS = {
+    '1yr_no_upfront': ('1yr', 'No Upfront'),
+    '1yr_partial_upfront': ('1yr', 'Partial Upfront'),
+    '1yr_all_upfront': ('1yr', 'All Upfront'),
+    '3yr_no_upfront': ('3yr', 'No Upfront'),
+    '3yr_partial_upfront': ('3yr', 'Partial Upfront'),
+    '3yr_all_upfront': ('3yr', 'All Upfront'),
+}
+RESERVED_FALLBACK_DISCOUNT = {'1yr': 0.5, '3yr': 0.6}  # typical discount vs on-demand
+LEASE_HOURS = {'1yr': 8760, '3yr': 26280}
+
+def get_instance_os(instance: dict) -> str:
+    """Map describe_instances platform details to the pricing operatingSystem value"""
+    platform_details = instance.get("PlatformDetails", "") or ""
+    if instance.get("Platform") == "windows" or platform_details.startswith("Windows"):
+        return 'Windows'
+    if platform_details.startswith("Red Hat"):
+        return 'RHEL'
+    if platform_details.startswith("SUSE"):
+        return 'SUSE'
+    return 'Linux'
+
+def _fetch_reserved_prices_from_api(instance_type: str, region: str, os_type: str) -> Dict[str, float]:
+    """
+    One Pricing API call returns every reserved term for the product, so all
+    lease/purchase-option combinations are resolved together.
+    Returns effective hourly cost (upfront fee amortised over the lease) per option key.
+    """
+    pricing_client = get_boto3_client('pricing', region='us-east-1')
+    filters = [
+        {'Type': 'TERM_MATCH', 'Field': 'location', 'Value': PRICING_REGION_NAMES.get(region, 'US East (N. Virginia)')},
+        {'Type': 'TERM_MATCH', 'Field': 'instanceType', 'Value': instance_type},
+        {'Type': 'TERM_MATCH', 'Field': 'operatingSystem', 'Value': os_type},
+        {'Type': 'TERM_MATCH', 'Field': 'tenancy', 'Value': 'Shared'},
+        {'Type': 'TERM_MATCH', 'Field': 'preInstalledSw', 'Value': 'NA'},
+        {'Type': 'TERM_MATCH', 'Field': 'capacitystatus', 'Value': 'Used'},
+    ]
+    with service_slot("pricing"):
+        response = call_with_backoff(pricing_client.get_products, ServiceCode='AmazonEC2', Filters=filters, MaxResults=10)
+
+    option_by_term = {term: key for key, term in RESERVED_PRICING_OPTIONS.items()}
+    prices = {}
+    for price_item in response.get('PriceList', []):
+        price_data = json.loads(price_item)
+        if price_data.get('product', {}).get('attributes', {}).get('licenseModel') == 'Bring your own license':
+            continue
+        for term_data in price_data.get('terms', {}).get('Reserved', {}).values():
+            term_attributes = term_data.get('termAttributes', {})
+            if term_attributes.get('OfferingClass') != 'standard':
+                continue
+            lease = term_attributes.get('LeaseContractLength', '')
+            option_key = option_by_term.get((lease, term_attributes.get('PurchaseOption', '')))
+            if not option_key:
+                continue
+            hourly, upfront = 0.0, 0.0
+            for dimension_data in term_data.get('priceDimensions', {}).values():
+                usd_price = float(dimension_data.get('pricePerUnit', {}).get('USD', '0') or 0)
+                if dimension_data.get('unit') == 'Quantity':
+                    upfront += usd_price
+                else:
+                    hourly += usd_price
+            effective = hourly + upfront / LEASE_HOURS[lease]
+            if effective > 0:
+                prices[option_key] = effective
+    return prices
+
+def get_instance_price_table(instance_type: str, region: str, os_type: str = 'Linux') -> Dict:
+    """
+    Resolve on-demand and all reserved prices for one (instance type, region, OS).
+    Returns {"on_demand": hourly, "reserved": {option_key: effective hourly}}.
+    Cached in the shared pricing cache, so repeat instance types cost nothing.
+    """
+    cache_key = f"table_{instance_type}_{region}_{os_type}"
+    cached_table = _pricing_cache.get(cache_key)
+    if cached_table is not None:
+        return cached_table
+
+    on_demand = get_dynamic_ec2_pricing(instance_type, region, os_type)
+    reserved = {}
+    for option_key, (lease, purchase_option) in RESERVED_PRICING_OPTIONS.items():
+        catalog_price = get_catalog_hourly_price(
+            instance_type, region, os_type,
+            term_type='Reserved', purchase_option=purchase_option, lease_length=lease, offering_class='standard'
+        )
+        if catalog_price is not None:
+            reserved[option_key] = catalog_price
+
+    estimated = False
+    if len(reserved) < len(RESERVED_PRICING_OPTIONS):
+        try:
+            print(f"[PRICING] Fetching reserved instance pricing for {instance_type} ({os_type}) in {region}")
+            api_prices = _fetch_reserved_prices_from_api(instance_type, region, os_type)
+            for option_key, price in api_prices.items():
+                reserved.setdefault(option_key, price)
+        except Exception as e:
+            raise_if_throttled(e)
+            print(f"[PRICING] Error fetching reserved pricing for {instance_type}: {e}")
+
+        # Smart fallback for whatever is still missing (typically 40-60% of on-demand)
+        for option_key, (lease, _) in RESERVED_PRICING_OPTIONS.items():
+            if option_key not in reserved:
+                reserved[option_key] = on_demand * (1 - RESERVED_FALLBACK_DISCOUNT[lease])
+                estimated = True
+        if estimated:
+            print(f"[FALLBACK] Estimated part of the reserved pricing for {instance_type}")
+
+    table = {"on_demand": on_demand, "reserved": reserved}
+    ttl = PRICING_FALLBACK_TTL_SECONDS if estimated else None
+    _pricing_cache.set(cache_key, table, ttl_seconds=ttl)
+    return table
+
+def prefetch_instance_pricing(instances: List[dict], region: str, price_tables: Optional[Dict[tuple, Dict]] = None) -> Dict[tuple, Dict]:
+    """
+    Resolve price tables once per distinct (instance type, region, OS) in the fleet,
+    so per-instance work only reads from the returned table.
+    Pass an existing price_tables dict to only resolve keys it doesn't have yet.
+    """
+    price_tables = {} if price_tables is None else price_tables
+    keys = {(inst.get("InstanceType", "unknown"), region, get_instance_os(inst)) for inst in instances}
+    missing = keys - price_tables.keys()
+    if missing:
+        print(f"[PRICING] Resolving prices for {len(missing)} new instance types across {len(instances)} instances")
+    # Pricing API slots are taken around the get_products calls inside get_instance_price_table
+    missing = sorted(missing)
+    for key, table in zip(missing, bounded_map(lambda key: get_instance_price_table(*key), missing)):
+        price_tables[key] = table
+    return price_tables
+
+def get_reserved_instance_pricing(instance_type: str, region: str = 'us-east-1', os_type: str = 'Linux', term: str = '1yr',
+                                  purchase_option: str = 'No Upfront') -> float:
     """
     Get reserved instance pricing for better savings calculations
     Returns hourly cost in USD for reserved instances
     """
-    try:
-        print(f"[PRICING] Fetching reserved instance pricing for {instance_type} ({term})")
-        
-        pricing_client = boto3.client('pricing', region_name='us-east-1')
-        
-        region_mapping = {
-            'us-east-1': 'US East (N. Virginia)',
-            'us-west-1': 'US West (N. California)',
-            'us-west-2': 'US West (Oregon)',
-            'eu-west-1': 'Europe (Ireland)',
-            'eu-central-1': 'Europe (Frankfurt)',
-            'ap-southeast-1': 'Asia Pacific (Singapore)',
-            'ap-southeast-2': 'Asia Pacific (Sydney)',
-            'ap-northeast-1': 'Asia Pacific (Tokyo)',
-            'sa-east-1': 'South America (Sao Paulo)',
-            'ca-central-1': 'Canada (Central)',
-            'eu-west-2': 'Europe (London)',
-            'eu-west-3': 'Europe (Paris)',
-            'eu-north-1': 'Europe (Stockholm)',
-            'ap-south-1': 'Asia Pacific (Mumbai)',
-            'ap-northeast-2': 'Asia Pacific (Seoul)',
-            'ap-northeast-3': 'Asia Pacific (Osaka)',
-            'af-south-1': 'Africa (Cape Town)',
-            'me-south-1': 'Middle East (Bahrain)',
-            'me-central-1': 'Middle East (UAE)'
-        }
-        
-        region_name = region_mapping.get(region, 'US East (N. Virginia)')
-        
-        # Map term to pricing API values
-        term_mapping = {
-            '1yr': '1yr',
-            '3yr': '3yr'
-        }
-        
-        term_value = term_mapping.get(term, '1yr')
-        
-        # Build filters for reserved instance pricing
-        filters = [
-            {'Type': 'TERM_MATCH', 'Field': 'serviceCode', 'Value': 'AmazonEC2'},
-            {'Type': 'TERM_MATCH', 'Field': 'regionCode', 'Value': region_name},
-            {'Type': 'TERM_MATCH', 'Field': 'instanceType', 'Value': instance_type},
-            {'Type': 'TERM_MATCH', 'Field': 'operatingSystem', 'Value': os_type},
-            {'Type': 'TERM_MATCH', 'Field': 'tenancy', 'Value': 'Shared'},
-            {'Type': 'TERM_MATCH', 'Field': 'termType', 'Value': 'Reserved'},
-            {'Type': 'TERM_MATCH', 'Field': 'offeringClass', 'Value': 'standard'},
-            {'Type': 'TERM_MATCH', 'Field': 'purchaseOption', 'Value': 'No Upfront'},
-        ]
-        
-        response = pricing_client.get_products(
-            ServiceCode='AmazonEC2',
-            Filters=filters,
-            MaxResults=10
-        )
-        
-        if response['PriceList']:
-            for price_item in response['PriceList']:
-                price_data = json.loads(price_item)
-                
-                product_attributes = price_data.get('product', {}).get('attributes', {})
-                item_instance_type = product_attributes.get('instanceType', '')
-                item_os = product_attributes.get('operatingSystem', '')
-                item_tenancy = product_attributes.get('tenancy', '')
-                item_term = product_attributes.get('termLength', '')
-                
-                if (item_instance_type == instance_type and 
-                    item_os == os_type and 
-                    item_tenancy == 'Shared' and
-                    term_value in item_term):
-                    
-                    terms = price_data.get('terms', {})
-                    reserved_terms = terms.get('Reserved', {})
-                    
-                    for term_id, term_data in reserved_terms.items():
-                        price_dimensions = term_data.get('priceDimensions', {})
-                        for dimension_id, dimension_data in price_dimensions.items():
-                            price_per_unit = dimension_data.get('pricePerUnit', {})
-                            usd_price = price_per_unit.get('USD', '0')
-                            
-                            if usd_price and usd_price != '0':
-                                hourly_cost = float(usd_price)
-                                print(f"[PRICING] Reserved {instance_type} ({term}): ${hourly_cost:.4f}/hour")
-                                return hourly_cost
-        
-        # Smart fallback for reserved pricing (typically 40-60% of on-demand)
-        on_demand_price = get_dynamic_ec2_pricing(instance_type, region, os_type)
-        reserved_discount = 0.5 if term == '1yr' else 0.6  # 50% for 1yr, 60% for 3yr
-        reserved_price = on_demand_price * (1 - reserved_discount)
-        
-        print(f"[FALLBACK] Estimated reserved pricing for {instance_type} ({term}): ${reserved_price:.4f}/hour")
-        return reserved_price
-        
-    except Exception as e:
-        print(f"[PRICING] Error fetching reserved pricing for {instance_type}: {e}")
-        
-        # Fallback to estimated reserved pricing
-        on_demand_price = get_dynamic_ec2_pricing(instance_type, region, os_type)
-        reserved_discount = 0.5 if term == '1yr' else 0.6
-        reserved_price = on_demand_price * (1 - reserved_discount)
-        
-        print(f"[FALLBACK] Using estimated reserved pricing for {instance_type}: ${reserved_price:.4f}/hour")
-        return reserved_price
+    option_key = f"{term}_{purchase_option.lower().replace(' ', '_')}"
+    reserved = get_instance_price_table(instance_type, region, os_type)["reserved"]
+    reserved_price = reserved.get(option_key, reserved.get(f"{term}_no_upfront", 0.0))
+    if DEBUG:
+        print(f"[PRICING] Reserved {instance_type} ({term}, {purchase_option}): ${reserved_price:.4f}/hour")
+    return reserved_price
 
 
-import boto3
-from typing import List, Optional
-from data.aws.settings import get_boto3_client
-from data.aws.cloudwatch import get_cpu_metrics
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List, Optional
+from data.aws.cloudwatch import (get_cpu_metrics, fetch_fleet_cpu_metrics, fetch_fleet_memory_series,
+                                 TIERED_METRICS_ENABLED, TIERED_METRICS_MARGIN)
+from data.aws.rightsizing import (plan_rightsizing, RIGHTSIZING_ENABLED, RIGHTSIZING_USE_MEMORY, RIGHTSIZING_PERCENTILE,
+                                  RIGHTSIZING_HEADROOM, RIGHTSIZING_MIN_HOURS, RIGHTSIZING_FAMILIES)
+from rules.aws.ec2_rules import get_ec2_rules
+import heapq
 import json
+import numpy as np
+
+EC2_DESCRIBE_PAGE_SIZE = int(os.getenv("EC2_DESCRIBE_PAGE_SIZE", "500"))  # server-side MaxResults (5-1000)
+EC2_PAGE_PREFETCH = int(os.getenv("EC2_PAGE_PREFETCH", "2"))  # pages fetched ahead of enrichment
+# Comma-separated regions for multi-region scans; empty or "all" = every region enabled for the account
+EC2_SCAN_REGIONS = [r.strip() for r in os.getenv("EC2_SCAN_REGIONS", "").split(",") if r.strip()]
+REGION_SCAN_WORKERS = int(os.getenv("REGION_SCAN_WORKERS", "8"))
+# Instances whose metrics are fetched per step of a top-K scan
+EC2_TOP_K_BATCH_SIZE = int(os.getenv("EC2_TOP_K_BATCH_SIZE", "20"))
+# Only suggest the next smaller type when average CPU scaled to its vCPUs stays below this
+DOWNSIZE_MAX_PROJECTED_CPU = float(os.getenv("DOWNSIZE_MAX_PROJECTED_CPU", "60"))
+
+def enrichment_settings(cpu_threshold: float) -> list:
+    """
+    Scan inputs besides the instance itself that shape its enrichment. cpu_threshold decides
+    daily vs hourly metrics (and so whether rightsizing runs); the rest are the downsize and
+    rightsizing settings. Part of the inventory snapshot fingerprint, so a scan with other
+    settings re-enriches instead of reusing stale records.
+    """
+    return [cpu_threshold, TIERED_METRICS_ENABLED, TIERED_METRICS_MARGIN, DOWNSIZE_MAX_PROJECTED_CPU,
+            RIGHTSIZING_ENABLED, RIGHTSIZING_USE_MEMORY, RIGHTSIZING_PERCENTILE, RIGHTSIZING_HEADROOM,
+            RIGHTSIZING_MIN_HOURS, RIGHTSIZING_FAMILIES]
+
+def iter_instance_pages(
+    ec2,
+    instance_ids: Optional[List[str]] = None,
+    filters: Optional[List[dict]] = None,
+    page_size: int = EC2_DESCRIBE_PAGE_SIZE,
+    prefetch: int = EC2_PAGE_PREFETCH
+) -> Iterator[List[dict]]:
+    """
+    Yields describe_instances results one page at a time using the paginator, so
+    no instances are lost to an ignored NextToken.
+    A background thread keeps up to `prefetch` pages in flight, so callers can
+    enrich the first page while later pages are still being fetched.
+    """
+    if instance_ids:
+        # MaxResults can't be combined with InstanceIds
+        paginate_args = {"InstanceIds": instance_ids}
+    else:
+        paginate_args = {"Filters": filters or [], "PaginationConfig": {"PageSize": page_size}}
+
+    pages = queue.Queue(maxsize=max(prefetch, 1))
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            paginator = ec2.get_paginator("describe_instances")
+            for page in paginator.paginate(**paginate_args):
+                batch = [
+                    instance
+                    for reservation in page.get("Reservations", [])
+                    for instance in reservation.get("Instances", [])
+                ]
+                if not put(batch):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(done)
+
+    producer = threading.Thread(target=produce, name="ec2-describe-pages", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            if item:
+                yield item
+    finally:
+        # Lets the producer exit if the caller stops consuming early
+        stop.set()
+
+def iter_ec2_instances(
+    ec2,
+    instance_ids: Optional[List[str]] = None,
+    filters: Optional[List[dict]] = None,
+    page_size: int = EC2_DESCRIBE_PAGE_SIZE
+) -> Iterator[dict]:
+    """Yields described instances one at a time across all pages"""
+    for page in iter_instance_pages(ec2, instance_ids=instance_ids, filters=filters, page_size=page_size):
+        yield from page
+
+def plan_page_rightsizing(instances: List[dict], region: str, fleet_metrics: Dict[str, dict]) -> Dict[str, dict]:
+    """
+    Percentile rightsizing plans for a page of described instances, from its hourly CPU batch.
+    Instances a tiered fetch left at daily resolution (clearly busy) are not planned.
+    """
+    instances = [inst for inst in instances
+                 if fleet_metrics.get(inst["InstanceId"], {}).get("Resolution", "hourly") == "hourly"]
+    if not RIGHTSIZING_ENABLED or not instances:
+        return {}
+    instance_ids = [inst["InstanceId"] for inst in instances]
+    cpu_series = {instance_id: fleet_metrics.get(instance_id, {}).get("HourlySeries", []) for instance_id in instance_ids}
+    memory_series = None
+    if RIGHTSIZING_USE_MEMORY:
+        try:
+            with service_slot("cloudwatch"):
+                memory_series = fetch_fleet_memory_series(instance_ids, region=region)
+        except AWSThrottledError:
+            raise
+        except Exception as e:
+            print(f"[RIGHTSIZING] Memory metrics unavailable, sizing on CPU only: {e}")
+    return plan_rightsizing(
+        instance_ids,
+        [inst.get("InstanceType", "unknown") for inst in instances],
+        [get_instance_os(inst) for inst in instances],
+        region,
+        cpu_series,
+        price_fn=get_dynamic_ec2_pricing,
+        memory_series=memory_series,
+    )
+
+def _enrich_instance(instance: dict, region: Optional[str], price_tables: Dict[tuple, Dict],
+                     fleet_metrics: Optional[Dict[str, dict]] = None, account_id: Optional[str] = None,
+                     rightsizing: Optional[Dict[str, dict]] = None) -> InstanceRecord:
+    """
+    Enrich one described instance with CPU metrics, pricing and the best savings option.
+    Pricing and metrics are read from the prefetched per-type tables / fleet batch;
+    percentile rightsizing plans come from plan_page_rightsizing.
+    """
+    instance_id = instance["InstanceId"]
+    instance_type = instance.get("InstanceType", "unknown")
+    availability_zone = instance.get("Placement", {}).get("AvailabilityZone", "unknown")
+    
+    # Get CPU metrics
+    metrics = get_cpu_metrics(instance_id, region=region, fleet_metrics=fleet_metrics)
+    
+    # Read pricing from the prefetched per-type table
+    os_type = get_instance_os(instance)
+    price_table = price_tables[(instance_type, region, os_type)]
+    estimated_hourly_cost = price_table["on_demand"]
+    monthly_cost = estimated_hourly_cost * 730  # 730 hours per month
+    
+    # Calculate potential savings based on CPU utilization
+    avg_cpu = metrics.get("AverageCPU", 0)
+    current_cpu = metrics.get("CurrentCPU", 0)
+    
+    # Get reserved instance pricing for better savings calculation
+    reserved_hourly_cost = price_table["reserved"]["1yr_no_upfront"]
+    reserved_monthly_cost = reserved_hourly_cost * 730
+    
+    # Enhanced savings calculation with real pricing (no hardcoded multipliers)
+    savings_options = []
+    
+    # Option 1: Reserved Instance savings (real pricing)
+    reserved_savings = monthly_cost - reserved_monthly_cost
+    if reserved_savings > 0:
+        savings_options.append({
+            "type": "Reserved Instance",
+            "savings": reserved_savings,
+            "reason": f"Switch to 1-year reserved instance (saves ${reserved_savings:.2f}/month)"
+        })
+    
+    # Option 2: Shutdown savings (for low CPU usage instances)
+    if avg_cpu >= 0 and avg_cpu < 10:
+        # Calculate shutdown savings (full monthly cost when stopping)
+        shutdown_result = calculate_stop_instance_savings(instance_type, region, os_type)
+        if shutdown_result["savings"] > 0:
+            savings_options.append({
+                "type": "Shutdown Instance",
+                "savings": shutdown_result["savings"],
+                "reason": shutdown_result["reason"]
+            })
+    
+    # Option 3: Downsize to the next smaller type in the family if projected CPU still fits
+    current_info = get_instance_type_info(instance_type, region)
+    target_type = get_downsized_instance_type(instance_type, region) if current_info else ''
+    if target_type and avg_cpu > 0:
+        projected_cpu = avg_cpu * current_info.vcpu / max(get_instance_type_info(target_type, region).vcpu, 1)
+        if projected_cpu <= DOWNSIZE_MAX_PROJECTED_CPU:
+            downsize_result = calculate_downsizing_savings(instance_type, target_type, region, os_type)
+            if downsize_result["savings"] > 0:
+                savings_options.append({
+                    "type": "Downsize Instance",
+                    "savings": downsize_result["savings"],
+                    "reason": f"{downsize_result['reason']}, projected CPU {projected_cpu:.1f}%"
+                })
+
+    # Option 4: Rightsize to the cheapest type covering the CPU percentile plus headroom
+    rightsizing_plan = (rightsizing or {}).get(instance_id)
+    if rightsizing_plan:
+        cpu_stats = rightsizing_plan["CPU"]
+        savings_options.append({
+            "type": "Rightsize Instance",
+            "savings": rightsizing_plan["MonthlySavings"],
+            "reason": f"Rightsize from {instance_type} to {rightsizing_plan['TargetInstanceType']} "
+                      f"(saves ${rightsizing_plan['MonthlySavings']:.2f}/month; CPU p50 {cpu_stats['p50']}%, "
+                      f"p95 {cpu_stats['p95']}%, p99 {cpu_stats['p99']}%, max {cpu_stats['max']}%)"
+        })
+
+    # Select the best savings option
+    if savings_options:
+        best_option = max(savings_options, key=lambda x: x["savings"])
+        potential_savings = best_option["savings"]
+        savings_reason = best_option["reason"]
+    else:
+        potential_savings = 0.0
+        savings_reason = "High CPU usage - instance appears to be well-utilized"
+
+    # Extract tags for analysis
+    tags = instance.get("Tags", [])
+
+    launch_time = instance.get("LaunchTime", "")
+    instance_data = InstanceRecord(
+        instance_id=instance_id,
+        instance_type=instance_type,
+        availability_zone=availability_zone,
+        region=region,
+        account_id=account_id,
+        state=instance.get("State", {}).get("Name", "unknown"),
+        platform=instance.get("Platform", "linux"),
+        os_type=os_type,
+        average_cpu=avg_cpu,
+        current_cpu=current_cpu,
+        uptime_hours=metrics.get("UptimeHours", 0),
+        hourly_cost=estimated_hourly_cost,
+        monthly_cost=monthly_cost,
+        estimated_savings=potential_savings,
+        savings_reason=savings_reason,
+        recommended_type=rightsizing_plan["TargetInstanceType"] if rightsizing_plan else "",
+        cpu_percentile=rightsizing_plan["CPUPercentile"] if rightsizing_plan else 0.0,
+        tags=tags_to_pairs(tags),
+        launch_time=launch_time.isoformat() if hasattr(launch_time, "isoformat") else str(launch_time),
+        vpc_id=instance.get("VpcId", ""),
+        subnet_id=instance.get("SubnetId", ""),
+        private_ip=instance.get("PrivateIpAddress", ""),
+        public_ip=instance.get("PublicIpAddress", ""),
+    )
+
+    # One line per instance - this runs on the enrichment workers, so multi-line output would interleave
+    print(f"[EC2] {instance_id} ({instance_type}, {availability_zone}): CPU avg {avg_cpu}% / current {current_cpu}%, "
+          f"${monthly_cost:.2f}/month on-demand, ${reserved_monthly_cost:.2f}/month reserved, "
+          f"saves ${potential_savings:.2f}/month - {savings_reason}")
+    return instance_data
 
 def fetch_ec2_instances(
     instance_ids: Optional[List[str]] = None,
-    region: Optional[str] = None
-) -> List[dict]:
+    region: Optional[str] = None,
+    workers: Optional[int] = None,
+    top_k: Optional[int] = None,
+    rules: Optional[Dict] = None
+) -> Fleet:
     """
     Fetches EC2 instances and their CPU metrics with detailed analysis.
     Filters by instance_ids if provided.
     Uses region override if passed.
+    Instances are read page by page and each page is enriched concurrently on up to
+    `workers` threads (ENRICHMENT_WORKERS by default); output keeps describe order.
+    With top_k, only enriches as many instances as needed to find the top_k savings
+    under `rules` (see fetch_top_ec2_instances). Only instances whose daily average CPU is
+    near the rules' cpu_threshold get hourly metrics (see fetch_fleet_cpu_metrics).
+    Returns a columnar Fleet; call .to_dicts() where plain dicts are needed.
     """
+    if top_k:
+        return fetch_top_ec2_instances(top_k, rules=rules, instance_ids=instance_ids, region=region, workers=workers)
+    region = region or AWS_REGION
+    cpu_threshold = (rules or {}).get("cpu_threshold", DEFAULT_CPU_THRESHOLD)
     print(f"\n🔍 [EC2] Let me check your EC2 instances...")
-    print(f"📍 [EC2] Looking in region: {region or 'default'}")
+    print(f"📍 [EC2] Looking in region: {region}")
     print(f"🎯 [EC2] Checking: {instance_ids or 'all your running instances'}")
     
     try:
         ec2 = get_boto3_client("ec2", region=region)
+        account_id = get_active_account_id()
         filters = [{"Name": "instance-state-name", "Values": ["running"]}]
 
         if instance_ids:
             print(f"📋 [EC2] Getting details for: {instance_ids}")
-            response = ec2.describe_instances(InstanceIds=instance_ids)
         else:
             print(f"📋 [EC2] Finding all your running instances...")
-            response = ec2.describe_instances(Filters=filters)
 
-        instances = []
+        page_fleets = []
+        price_tables = {}
         total_instances = 0
-        
-        for reservation in response.get("Reservations", []):
-            for instance in reservation.get("Instances", []):
-                total_instances += 1
-                instance_id = instance["InstanceId"]
-                instance_type = instance.get("InstanceType", "unknown")
-                availability_zone = instance.get("Placement", {}).get("AvailabilityZone", "unknown")
-                
-                print(f"\n[EC2] Looking at instance {instance_id}...")
-                print(f"   [INFO] Type: {instance_type}")
-                print(f"   [INFO] Zone: {availability_zone}")
-                
-                # Get CPU metrics
-                print(f"   📈 Checking CPU usage for {instance_id}...")
-                metrics = get_cpu_metrics(instance_id, region=region)
-                
-                # Get dynamic pricing based on instance type and region
-                print(f"   [PRICING] Fetching pricing for {instance_type} in {region}")
-                estimated_hourly_cost = get_dynamic_ec2_pricing(instance_type, region)
-                monthly_cost = estimated_hourly_cost * 730  # 730 hours per month
-                
-                print(f"   [COST] Hourly cost: ${estimated_hourly_cost:.4f}")
-                print(f"   [COST] Monthly cost: ${monthly_cost:.2f}")
-                
-                # Calculate potential savings based on CPU utilization
-                avg_cpu = metrics.get("AverageCPU", 0)
-                current_cpu = metrics.get("CurrentCPU", 0)
-                
-                # Get reserved instance pricing for better savings calculation
-                reserved_hourly_cost = get_reserved_instance_pricing(instance_type, region)
-                reserved_monthly_cost = reserved_hourly_cost * 730
-                
-                # Enhanced savings calculation with real pricing (no hardcoded multipliers)
-                savings_options = []
-                
-                # Option 1: Reserved Instance savings (real pricing)
-                reserved_savings = monthly_cost - reserved_monthly_cost
-                if reserved_savings > 0:
-                    savings_options.append({
-                        "type": "Reserved Instance",
-                        "savings": reserved_savings,
-                        "reason": f"Switch to 1-year reserved instance (saves ${reserved_savings:.2f}/month)"
-                    })
-                
-                # Option 2: Shutdown savings (for low CPU usage instances)
-                if avg_cpu >= 0 and avg_cpu < 10:
-                    # Calculate shutdown savings (full monthly cost when stopping)
-                    shutdown_result = calculate_stop_instance_savings(instance_type, region)
-                    if shutdown_result["savings"] > 0:
-                        savings_options.append({
-                            "type": "Shutdown Instance",
-                            "savings": shutdown_result["savings"],
-                            "reason": shutdown_result["reason"]
-                        })
-                
-                # Select the best savings option
-                if savings_options:
-                    best_option = max(savings_options, key=lambda x: x["savings"])
-                    potential_savings = best_option["savings"]
-                    savings_reason = best_option["reason"]
-                else:
-                    potential_savings = 0.0
-                    savings_reason = "High CPU usage - instance appears to be well-utilized"
-
-                print(f"   [CPU] 7-day average CPU: {avg_cpu}%")
-                print(f"   [CPU] Current CPU: {current_cpu}%")
-                print(f"   [COST] On-demand cost: ${monthly_cost:.2f}/month")
-                print(f"   [COST] Reserved cost: ${reserved_monthly_cost:.2f}/month")
-                print(f"   [SAVINGS] Best savings option: {savings_reason}")
-                print(f"   [SAVINGS] Potential savings: ${potential_savings:.2f}/month")
-
-                # Extract tags for analysis
-                tags = instance.get("Tags", [])
-                tag_dict = {tag.get("Key", ""): tag.get("Value", "") for tag in tags}
-                
-                if tags:
-                    print(f"   [TAGS] Tags: {json.dumps(tag_dict, indent=6)}")
-                else:
-                    print(f"   [TAGS] No tags found")
-
-                instance_data = {
-                    "InstanceId": instance_id,
-                    "InstanceType": instance_type,
-                    "AvailabilityZone": availability_zone,
-                    "Tags": tags,
-                    "TagDict": tag_dict,
-                    "AverageCPU": avg_cpu,
-                    "CurrentCPU": current_cpu,
-                    "EstimatedSavings": potential_savings,
-                    "SavingsReason": savings_reason,
-                    "UptimeHours": metrics.get("UptimeHours", 0),
-                    "region": region,
-                    "estimated_hourly_cost": estimated_hourly_cost,
-                    "estimated_monthly_cost": monthly_cost,
-                    "State": instance.get("State", {}).get("Name", "unknown"),
-                    "LaunchTime": instance.get("LaunchTime", ""),
-                    "Platform": instance.get("Platform", "linux"),
-                    "VpcId": instance.get("VpcId", ""),
-                    "SubnetId": instance.get("SubnetId", ""),
-                    "PrivateIpAddress": instance.get("PrivateIpAddress", ""),
-                    "PublicIpAddress": instance.get("PublicIpAddress", ""),
-                }
-
-                instances.append(instance_data)
-                print(f"   [SUCCESS] Instance {instance_id} analysis complete")
+        reused_instances = 0
+        timer = StageTimer("EC2 scan")
+
+        # Last snapshot for this account/region: unchanged, fresh instances skip enrichment
+        snapshot = {}
+        snapshot_entries = []
+        settings = enrichment_settings(cpu_threshold)
+        if inventory_store.INVENTORY_STORE_ENABLED:
+            try:
+                snapshot = inventory_store.load_snapshot(account_id, region)
+            except Exception as e:
+                print(f"[INVENTORY] Snapshot store unavailable, enriching everything: {e}")
+        pages = iter_instance_pages(ec2, instance_ids=instance_ids, filters=filters)
+        page_number = 0
+
+        while True:
+            with timer.stage("describe"):
+                page = next(pages, None)
+            if page is None:
+                break
+            page_number += 1
+            total_instances += len(page)
+            print(f"\n📄 [EC2] Page {page_number}: {len(page)} instances")
+
+            # Diff against the snapshot by instance ID, type, state, tags and scan settings
+            now = time.time()
+            fingerprints = [inventory_store.instance_fingerprint(inst, settings) for inst in page]
+            records = [
+                inventory_store.reusable_record(snapshot, inst, fingerprint, now) if snapshot else None
+                for inst, fingerprint in zip(page, fingerprints)
+            ]
+            reused = [record is not None for record in records]
+            changed = [inst for inst, record in zip(page, records) if record is None]
+            reused_instances += len(page) - len(changed)
+            if snapshot:
+                print(f"   [INVENTORY] {len(page) - len(changed)} unchanged, {len(changed)} new or changed")
+
+            if changed:
+                # Resolve on-demand + reserved prices once per distinct (type, region, OS)
+                with timer.stage("pricing"):
+                    prefetch_instance_pricing(changed, region, price_tables)
+
+                # One GetMetricData batch per 500 instances instead of two calls per instance;
+                # daily averages first, hourly detail only for instances near the CPU threshold
+                with timer.stage("metrics"), service_slot("cloudwatch"):
+                    fleet_metrics = fetch_fleet_cpu_metrics(
+                        [inst["InstanceId"] for inst in changed], region=region, cpu_threshold=cpu_threshold
+                    )
+
+                # p50/p95/p99/max for the whole page in one pass, then the cheapest covering type
+                with timer.stage("rightsizing"):
+                    rightsizing = plan_page_rightsizing(changed, region, fleet_metrics)
+
+                with timer.stage("enrichment"):
+                    enriched = iter(bounded_map(
+                        lambda instance: _enrich_instance(instance, region, price_tables, fleet_metrics, account_id, rightsizing),
+                        changed, workers
+                    ))
+                records = [record if record is not None else next(enriched) for record in records]
+
+            page_fleets.append(Fleet.from_records(records))
+            if inventory_store.INVENTORY_STORE_ENABLED:
+                # Reused records keep their original enrichment time, so the TTL still expires them
+                snapshot_entries.extend(
+                    (record, fingerprint, snapshot[record.instance_id][2] if was_reused else now)
+                    for record, fingerprint, was_reused in zip(records, fingerprints, reused)
+                )
+
+        instances = Fleet.concat(page_fleets)
+        if inventory_store.INVENTORY_STORE_ENABLED:
+            try:
+                # A filtered scan only refreshes its instances; a full scan replaces the snapshot
+                inventory_store.save_snapshot(account_id, region, snapshot_entries, replace=not instance_ids)
+            except Exception as e:
+                print(f"[INVENTORY] Could not save snapshot: {e}")
 
         print(f"\n[EC2] Analysis Summary:")
-        print(f"   [INFO] Analyzed {total_instances} instances")
-        print(f"   [COST] Total monthly cost: ${sum(inst.get('estimated_monthly_cost', 0) for inst in instances):.2f}")
-        print(f"   [SAVINGS] Potential savings: ${sum(inst.get('EstimatedSavings', 0) for inst in instances):.2f}")
-        print(f"   [OPPORTUNITY] {len([inst for inst in instances if inst.get('EstimatedSavings', 0) > 0])} instances could save you money")
+        print(f"   [INFO] Analyzed {total_instances} instances ({reused_instances} reused from the last snapshot)")
+        print(f"   [COST] Total monthly cost: ${instances.total('monthly_cost'):.2f}")
+        print(f"   [SAVINGS] Potential savings: ${instances.total('estimated_savings'):.2f}")
+        print(f"   [OPPORTUNITY] {int((instances.numeric['estimated_savings'] > 0).sum())} instances could save you money")
+        timer.report()
+        print_rate_limiter_stats()
         
         return instances
         
+    except AWSThrottledError as e:
+        print(f"[ERROR] [EC2] Scan aborted, AWS kept throttling: {e}")
+        print_rate_limiter_stats()
+        return Fleet.empty()
+    except Exception as e:
+        print(f"[ERROR] [EC2] Something went wrong: {e}")
+        return Fleet.empty()
+
+def apply_recommendation_rules(fleet: Fleet, rules: Optional[Dict] = None) -> Dict[str, np.ndarray]:
+    """
+    Evaluate the recommendation rules column-wise, in order: CPU threshold, minimum uptime,
+    minimum savings (very low CPU overrides low savings), excluded tags.
+    Returns boolean masks {"over_cpu", "low_uptime", "low_savings", "overridden",
+    "excluded_tags", "eligible"} over the fleet.
+    """
+    rules = rules or get_ec2_rules()
+    avg_cpu = fleet.numeric["average_cpu"]
+    uptime = fleet.numeric["uptime_hours"]
+    savings = fleet.numeric["estimated_savings"]
+
+    over_cpu = avg_cpu > rules.get("cpu_threshold", DEFAULT_CPU_THRESHOLD)
+    low_uptime = ~over_cpu & (uptime < rules.get("min_uptime_hours", DEFAULT_MIN_UPTIME_HOURS))
+    remaining = ~over_cpu & ~low_uptime
+    below_min_savings = remaining & (savings < rules.get("min_savings_usd", DEFAULT_MIN_SAVINGS_USD))
+    overridden = below_min_savings & (avg_cpu < 10)
+    low_savings = below_min_savings & ~overridden
+    eligible = remaining & ~low_savings
+
+    excluded_tags = np.zeros(fleet.size, dtype=bool)
+    excluded = set(rules.get("excluded_tags", []))
+    if excluded:
+        instance_tags = fleet.objects["tags"]
+        for i in np.flatnonzero(eligible):
+            if any(f"{key}={value}" in excluded for key, value in instance_tags[i]):
+                excluded_tags[i] = True
+        eligible &= ~excluded_tags
+
+    return {
+        "over_cpu": over_cpu,
+        "low_uptime": low_uptime,
+        "low_savings": low_savings,
+        "overridden": overridden,
+        "excluded_tags": excluded_tags,
+        "eligible": eligible,
+    }
+
+def fetch_top_ec2_instances(
+    top_k: int = MAX_RECOMMENDATIONS,
+    rules: Optional[Dict] = None,
+    instance_ids: Optional[List[str]] = None,
+    region: Optional[str] = None,
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None
+) -> Fleet:
+    """
+    Top-K scan: enough enriched instances to contain the top_k recommendations under `rules`.
+    Every running instance is described and priced (cheap, per instance type); its monthly
+    on-demand cost bounds any savings option. Instances are then enriched in descending
+    bound order, batch_size at a time, until the top_k-th best confirmed savings is at least
+    the largest remaining bound. Savings are scored after the same rules and pricing
+    preferences generate_recommendations applies. Returns only the instances that were enriched.
+    """
+    # price_matrix imports this module, so it can only be imported once both are loaded
+    from data.aws.price_matrix import reprice_fleet, PRICING_PREFERENCE_KEYS
+
+    region = region or AWS_REGION
+    rules = rules or get_ec2_rules()
+    pricing_preferences = {key: rules[key] for key in PRICING_PREFERENCE_KEYS if key in rules}
+    batch_size = max(batch_size or EC2_TOP_K_BATCH_SIZE, 1)
+    print(f"\n🔍 [EC2] Looking for your top {top_k} EC2 savings in {region}...")
+
+    try:
+        ec2 = get_boto3_client("ec2", region=region)
+        account_id = get_active_account_id()
+        filters = [{"Name": "instance-state-name", "Values": ["running"]}]
+        timer = StageTimer("EC2 top-K scan")
+        price_tables = {}
+
+        with timer.stage("describe"):
+            described = [inst for page in iter_instance_pages(ec2, instance_ids=instance_ids, filters=filters) for inst in page]
+        if not described:
+            print(f"[EC2] No running instances found")
+            return Fleet.empty()
+
+        # Savings can never exceed what the instance costs, so on-demand cost is the bound
+        with timer.stage("pricing"):
+            prefetch_instance_pricing(described, region, price_tables)
+        bounds = np.array([
+            price_tables[(inst.get("InstanceType", "unknown"), region, get_instance_os(inst))]["on_demand"] * HOURS_PER_MONTH
+            for inst in described
+        ])
+        order = np.argsort(-bounds, kind="stable")
+
+        snapshot = {}
+        if inventory_store.INVENTORY_STORE_ENABLED:
+            try:
+                snapshot = inventory_store.load_snapshot(account_id, region)
+            except Exception as e:
+                print(f"[INVENTORY] Snapshot store unavailable, enriching everything: {e}")
+
+        evaluated: List[InstanceRecord] = []
+        snapshot_entries = []
+        cpu_threshold = rules.get("cpu_threshold", DEFAULT_CPU_THRESHOLD)
+        settings = enrichment_settings(cpu_threshold)
+        best_scores: List[float] = []  # min-heap of the top_k confirmed savings
+        fetched_metrics = 0
+        position = 0
+        while position < len(order):
+            if len(best_scores) >= top_k and best_scores[0] >= bounds[order[position]]:
+                break
+            batch = [described[i] for i in order[position:position + batch_size]]
+            position += len(batch)
+
+            now = time.time()
+            fingerprints = [inventory_store.instance_fingerprint(inst, settings) for inst in batch]
+            records = [
+                inventory_store.reusable_record(snapshot, inst, fingerprint, now) if snapshot else None
+                for inst, fingerprint in zip(batch, fingerprints)
+            ]
+            reused = [record is not None for record in records]
+            changed = [inst for inst, record in zip(batch, records) if record is None]
+            if changed:
+                with timer.stage("metrics"), service_slot("cloudwatch"):
+                    fleet_metrics = fetch_fleet_cpu_metrics(
+                        [inst["InstanceId"] for inst in changed], region=region, cpu_threshold=cpu_threshold
+                    )
+                with timer.stage("rightsizing"):
+                    rightsizing = plan_page_rightsizing(changed, region, fleet_metrics)
+                with timer.stage("enrichment"):
+                    enriched = iter(bounded_map(
+                        lambda instance: _enrich_instance(instance, region, price_tables, fleet_metrics, account_id, rightsizing),
+                        changed, workers
+                    ))
+                records = [record if record is not None else next(enriched) for record in records]
+                fetched_metrics += len(changed)
+
+            batch_fleet = Fleet.from_records(records)
+            if pricing_preferences:
+                batch_fleet = reprice_fleet(batch_fleet, **pricing_preferences)
+            scores = np.where(apply_recommendation_rules(batch_fleet, rules)["eligible"],
+                              batch_fleet.numeric["estimated_savings"], 0.0)
+            for score in scores:
+                if len(best_scores) < top_k:
+                    heapq.heappush(best_scores, score)
+                elif score > best_scores[0]:
+                    heapq.heapreplace(best_scores, score)
+            evaluated.extend(records)
+            if inventory_store.INVENTORY_STORE_ENABLED:
+                snapshot_entries.extend(
+                    (record, fingerprint, snapshot[record.instance_id][2] if was_reused else now)
+                    for record, fingerprint, was_reused in zip(records, fingerprints, reused)
+                )
+
+        if inventory_store.INVENTORY_STORE_ENABLED:
+            try:
+                # Partial scan: refresh what was enriched, keep the rest of the snapshot
+                inventory_store.save_snapshot(account_id, region, snapshot_entries, replace=False)
+            except Exception as e:
+                print(f"[INVENTORY] Could not save snapshot: {e}")
+
+        instances = Fleet.from_records(evaluated)
+        print(f"\n[EC2] Top-{top_k} Summary:")
+        print(f"   [INFO] Enriched {len(evaluated)} of {len(described)} instances "
+              f"({fetched_metrics} metric fetches, {len(described) - len(evaluated)} pruned by cost bound)")
+        print(f"   [SAVINGS] Top-{top_k} confirmed savings: ${sum(best_scores):.2f}/month")
+        timer.report()
+        print_rate_limiter_stats()
+        return instances
+
+    except AWSThrottledError as e:
+        print(f"[ERROR] [EC2] Top-K scan aborted, AWS kept throttling: {e}")
+        print_rate_limiter_stats()
+        return Fleet.empty()
     except Exception as e:
         print(f"[ERROR] [EC2] Something went wrong: {e}")
-        return []
+        return Fleet.empty()
+
+def get_inventory_hourly_price(instance_type: str, region: str, os_type: str = 'Linux') -> float:
+    """
+    On-demand hourly price without any Pricing API call: the shared pricing cache, then the
+    local offer-file catalog, then the instance-catalog estimate (_get_smart_fallback_pricing).
+    """
+    cached_price = _pricing_cache.get(f"{instance_type}_{region}_{os_type}")
+    if cached_price is not None:
+        return cached_price
+    catalog_price = get_catalog_hourly_price(instance_type, region, os_type)
+    if catalog_price is not None:
+        return catalog_price
+    return _get_smart_fallback_pricing(instance_type, region)
+
+def collect_ec2_inventory(
+    region: Optional[str] = None,
+    instance_ids: Optional[List[str]] = None,
+    states: Optional[List[str]] = ("running",),
+    instance_type: Optional[str] = None
+) -> Fleet:
+    """
+    Metrics-free inventory: describe_instances plus cached on-demand prices, nothing else
+    (no CloudWatch, no Pricing API, no savings analysis). CPU columns are -1 (not fetched);
+    uptime comes from LaunchTime. `states` / `instance_type` become describe filters
+    (states=None = every state). Describe errors propagate to the caller.
+    """
+    region = region or AWS_REGION
+    ec2 = get_boto3_client("ec2", region=region)
+    account_id = get_active_account_id()
+    filters = []
+    if states:
+        filters.append({"Name": "instance-state-name", "Values": list(states)})
+    if instance_type:
+        filters.append({"Name": "instance-type", "Values": [instance_type]})
+
+    now = datetime.now(timezone.utc)
+    prices: Dict[tuple, float] = {}
+    records = []
+    for instance in iter_ec2_instances(ec2, instance_ids=instance_ids, filters=filters):
+        instance_type_name = instance.get("InstanceType", "unknown")
+        os_type = get_instance_os(instance)
+        key = (instance_type_name, os_type)
+        if key not in prices:
+            prices[key] = get_inventory_hourly_price(instance_type_name, region, os_type)
+        state = instance.get("State", {}).get("Name", "unknown")
+        launch_time = instance.get("LaunchTime", "")
+        has_launch_time = hasattr(launch_time, "isoformat")
+        uptime_hours = (now - launch_time).total_seconds() / 3600 if has_launch_time and state == "running" else 0.0
+        records.append(InstanceRecord(
+            instance_id=instance["InstanceId"],
+            instance_type=instance_type_name,
+            availability_zone=instance.get("Placement", {}).get("AvailabilityZone", "unknown"),
+            region=region,
+            account_id=account_id,
+            state=state,
+            platform=instance.get("Platform", "linux"),
+            os_type=os_type,
+            average_cpu=-1,
+            current_cpu=-1.0,
+            uptime_hours=round(uptime_hours, 1),
+            hourly_cost=prices[key],
+            monthly_cost=prices[key] * HOURS_PER_MONTH,
+            tags=tags_to_pairs(instance.get("Tags", [])),
+            launch_time=launch_time.isoformat() if has_launch_time else str(launch_time),
+            vpc_id=instance.get("VpcId", ""),
+            subnet_id=instance.get("SubnetId", ""),
+            private_ip=instance.get("PrivateIpAddress", ""),
+            public_ip=instance.get("PublicIpAddress", ""),
+        ))
+
+    inventory = Fleet.from_records(records)
+    print(f"[EC2] Inventory for {region}: {len(inventory)} instances, {len(prices)} instance types, "
+          f"${inventory.total('monthly_cost'):.2f}/month on-demand")
+    return inventory
+
+_enabled_regions: Optional[List[str]] = None
+_enabled_regions_lock = threading.Lock()
+
+def discover_enabled_regions() -> List[str]:
+    """Regions enabled for the account (opt-in regions only once opted in), looked up once per process"""
+    global _enabled_regions
+    with _enabled_regions_lock:
+        if _enabled_regions is None:
+            ec2 = get_boto3_client("ec2", region=AWS_REGION)
+            response = ec2.describe_regions(
+                Filters=[{"Name": "opt-in-status", "Values": ["opt-in-not-required", "opted-in"]}]
+            )
+            _enabled_regions = sorted(r["RegionName"] for r in response.get("Regions", []))
+            print(f"🌍 [EC2] Found {len(_enabled_regions)} enabled regions")
+        return list(_enabled_regions)
+
+def resolve_scan_regions(regions: Optional[List[str]] = None) -> List[str]:
+    """Explicit regions, else EC2_SCAN_REGIONS, else every enabled region ("all" means discover)"""
+    regions = [r for r in (regions or EC2_SCAN_REGIONS) if r]
+    if not regions or any(r.lower() == "all" for r in regions):
+        return discover_enabled_regions()
+    return list(dict.fromkeys(regions))
+
+def fetch_ec2_instances_multi_region(
+    regions: Optional[List[str]] = None,
+    instance_ids: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+    region_workers: Optional[int] = None,
+    inventory_only: bool = False
+) -> Fleet:
+    """
+    Scans several regions concurrently (each with its own pooled clients) and merges
+    the instances as each region finishes, so total latency tracks the slowest region.
+    Output is grouped by region in the order the regions were resolved.
+    With inventory_only, each region runs collect_ec2_inventory instead of the full analysis.
+    """
+    regions = resolve_scan_regions(regions)
+    print(f"\n🌍 [EC2] Scanning {len(regions)} regions: {', '.join(regions)}")
+    timer = StageTimer("EC2 multi-region scan")
+    by_region: Dict[str, Fleet] = {}
+    merged = 0
+
+    with timer.stage("regions"), ThreadPoolExecutor(
+        max_workers=max(min(region_workers or REGION_SCAN_WORKERS, len(regions)), 1),
+        thread_name_prefix="foai-region"
+    ) as executor:
+        futures = {
+            (submit_in_context(executor, collect_ec2_inventory, instance_ids=instance_ids, region=region)
+             if inventory_only else
+             submit_in_context(executor, fetch_ec2_instances, instance_ids=instance_ids, region=region, workers=workers)): region
+            for region in regions
+        }
+        for future in as_completed(futures):
+            region = futures[future]
+            try:
+                by_region[region] = future.result()
+            except Exception as e:
+                print(f"[ERROR] [EC2] Scan failed for {region}: {e}")
+                by_region[region] = Fleet.empty()
+            merged += len(by_region[region])
+            print(f"🌍 [EC2] {region} done: {len(by_region[region])} instances ({merged} so far)")
+
+    timer.report()
+    return Fleet.concat(by_region[region] for region in regions if region in by_region)
 
 
 # data/aws/ec2.py
@@ -463,90 +1088,119 @@ def fetch_ec2_instances(
 from collections import defaultdict
 from typing import List, Dict
 
-def summarize_cost_by_region(instances: List[dict]) -> List[dict]:
+def summarize_cost_by_region(instances: Union[Fleet, List[dict]], by_account: bool = False) -> List[dict]:
     """
     Groups EC2 instances by region and calculates total estimated cost per region.
+    With by_account=True, rows are per (account, region) and carry "account_id".
+    Accepts a Fleet (summed column-wise) or a list of instance dicts.
 
     Returns a sorted list of:
     {
         "region": str,
         "instance_count": int,
-        "estimated_hourly_cost": float
+        "estimated_hourly_cost": float,
+        "estimated_monthly_cost": float,
+        "estimated_monthly_savings": float
     }
     """
     print(f"\n[EC2] Breaking down costs by region...")
-    
-    region_summary = defaultdict(lambda: {"instance_count": 0, "estimated_hourly_cost": 0.0, "estimated_monthly_cost": 0.0})
 
-    for inst in instances:
-        region = inst.get("region", "unknown")
-        hourly_cost = inst.get("estimated_hourly_cost", 0.0)
-        monthly_cost = inst.get("estimated_monthly_cost", 0.0)
-
-        region_summary[region]["instance_count"] += 1
-        region_summary[region]["estimated_hourly_cost"] += hourly_cost
-        region_summary[region]["estimated_monthly_cost"] += monthly_cost
+    fleet = Fleet.from_any(instances)
+    group_by = ("account_id", "region") if by_account else ("region",)
+    groups = fleet.group_sums(group_by, ("hourly_cost", "monthly_cost", "estimated_savings"))
 
     # Convert to list and sort by cost descending
     result = sorted(
-        [{"region": r, **summary} for r, summary in region_summary.items()],
+        [
+            {
+                **({"account_id": key[0] or "unknown"} if by_account else {}),
+                "region": key[-1] or "unknown",
+                "instance_count": count,
+                "estimated_hourly_cost": sums["hourly_cost"],
+                "estimated_monthly_cost": sums["monthly_cost"],
+                "estimated_monthly_savings": sums["estimated_savings"],
+            }
+            for key, count, sums in groups
+        ],
         key=lambda x: x["estimated_monthly_cost"],
         reverse=True
     )
     
     print(f"[EC2] Regional breakdown:")
     for region_data in result:
-        print(f"   [REGION] {region_data['region']}: {region_data['instance_count']} instances, "
-              f"${region_data['estimated_monthly_cost']:.2f}/month")
+        label = f"{region_data['account_id']}/{region_data['region']}" if by_account else region_data['region']
+        print(f"   [REGION] {label}: {region_data['instance_count']} instances, "
+              f"${region_data['estimated_monthly_cost']:.2f}/month, "
+              f"${region_data['estimated_monthly_savings']:.2f}/month potential savings")
     
     return result
 
-def clear_pricing_cache():
-    """Clear the pricing cache"""
-    global _pricing_cache
-    _pricing_cache.clear()
+def clear_pricing_cache(shared: bool = True):
+    """Clear the pricing cache (local tier, and the shared Redis tier unless shared=False)"""
+    _pricing_cache.clear(shared=shared)
     print("[PRICING] Cache cleared")
 
 def get_pricing_cache_stats():
-    """Get pricing cache statistics"""
-    global _pricing_cache
+    """Get pricing cache statistics across both cache tiers"""
+    cache_stats = _pricing_cache.stats()
+    cached_instances = _pricing_cache.keys()
     return {
-        "cache_size": len(_pricing_cache),
-        "cached_instances": list(_pricing_cache.keys())
+        "cache_size": len(cached_instances),
+        "shared_cache_size": _pricing_cache.redis_size(),
+        "cached_instances": cached_instances,
+        "hits": cache_stats["hits"],
+        "redis_hits": cache_stats["redis_hits"],
+        "misses": cache_stats["misses"],
+        "evictions": cache_stats["evictions"],
+        "expirations": cache_stats["expirations"],
+        "warm_loaded": cache_stats["warm_loaded"],
+        "hit_rate": cache_stats["hit_rate"],
+        "ttl_seconds": cache_stats["ttl_seconds"],
     }
 
 def print_pricing_cache_stats():
     """Print pricing cache statistics"""
     stats = get_pricing_cache_stats()
-    print(f"[PRICING] Cache stats: {stats['cache_size']} cached prices")
+    print(f"[PRICING] Cache stats: {stats['cache_size']} cached prices locally, "
+          f"{stats['shared_cache_size'] if stats['shared_cache_size'] is not None else 'n/a'} shared")
+    print(f"[PRICING] Hits: {stats['hits']} local / {stats['redis_hits']} redis, misses: {stats['misses']}, "
+          f"evictions: {stats['evictions']}, hit rate: {stats['hit_rate']:.0%}")
     if stats['cached_instances']:
         print(f"[PRICING] Cached instances: {', '.join(stats['cached_instances'][:5])}{'...' if len(stats['cached_instances']) > 5 else ''}")
 
-def get_downsized_instance_type(current_instance_type: str) -> str:
+def get_downsized_instance_type(current_instance_type: str, region: Optional[str] = None) -> str:
     """
-    Get the next smaller instance type for downsizing recommendations
+    Get the next smaller instance type in the same family for downsizing recommendations
     Returns the smaller instance type or empty string if no smaller type available
     """
-    # Instance type hierarchy (smaller to larger)
-    instance_hierarchy = {
-        # T3 family
-        't3.2xlarge': 't3.xlarge', 't3.xlarge': 't3.large', 't3.large': 't3.medium',
-        't3.medium': 't3.small', 't3.small': 't3.micro',
-        # T2 family
-        't2.2xlarge': 't2.xlarge', 't2.xlarge': 't2.large', 't2.large': 't2.medium',
-        't2.medium': 't2.small', 't2.small': 't2.micro',
-        # M5 family
-        'm5.24xlarge': 'm5.12xlarge', 'm5.12xlarge': 'm5.4xlarge', 'm5.4xlarge': 'm5.2xlarge',
-        'm5.2xlarge': 'm5.xlarge', 'm5.xlarge': 'm5.large',
-        # C5 family
-        'c5.18xlarge': 'c5.9xlarge', 'c5.9xlarge': 'c5.4xlarge', 'c5.4xlarge': 'c5.2xlarge',
-        'c5.2xlarge': 'c5.xlarge', 'c5.xlarge': 'c5.large',
-        # R5 family
-        'r5.24xlarge': 'r5.12xlarge', 'r5.12xlarge': 'r5.4xlarge', 'r5.4xlarge': 'r5.2xlarge',
-        'r5.2xlarge': 'r5.xlarge', 'r5.xlarge': 'r5.large',
+    smaller = get_instance_catalog(region).next_smaller(current_instance_type)
+    return smaller.instance_type if smaller else ''
+
+def find_cheapest_instance_type(min_vcpu: float, min_memory_gib: float, region: Optional[str] = None,
+                                os_type: str = 'Linux', architecture: Optional[str] = None,
+                                families: Optional[List[str]] = None, include_burstable: bool = True) -> Optional[dict]:
+    """
+    Find the cheapest current-generation instance type with at least min_vcpu vCPUs and
+    min_memory_gib GiB of memory (optionally restricted to an architecture / families).
+    Returns {"instance_type", "hourly_cost", "monthly_cost", "details"} or None.
+    """
+    region = region or AWS_REGION
+    best = get_instance_catalog(region).cheapest_covering(
+        min_vcpu, min_memory_gib,
+        price_fn=lambda instance_type: get_dynamic_ec2_pricing(instance_type, region, os_type),
+        families=families,
+        architecture=architecture,
+        include_burstable=include_burstable,
+    )
+    if best is None:
+        return None
+    info, hourly_cost = best
+    return {
+        "instance_type": info.instance_type,
+        "hourly_cost": hourly_cost,
+        "monthly_cost": hourly_cost * HOURS_PER_MONTH,
+        "details": info.to_details(),
     }
-    
-    return instance_hierarchy.get(current_instance_type, '')
 
 def calculate_downsizing_savings(current_instance_type: str, target_instance_type: str, region: str, os_type: str = 'Linux') -> dict:
     """
@@ -576,6 +1230,7 @@ def calculate_downsizing_savings(current_instance_type: str, target_instance_typ
         }
         
     except Exception as e:
+        raise_if_throttled(e)
         print(f"[DOWNSIZE] Error calculating downsizing savings: {e}")
         return {
             "savings": 0.0,
@@ -588,7 +1243,7 @@ def get_ebs_pricing(region: str = 'us-east-1') -> float:
     Returns monthly cost per GB
     """
     try:
-        pricing_client = boto3.client('pricing', region_name='us-east-1')
+        pricing_client = get_boto3_client('pricing', region='us-east-1')
         
         region_mapping = {
             'us-east-1': 'US East (N. Virginia)',
@@ -611,11 +1266,13 @@ def get_ebs_pricing(region: str = 'us-east-1') -> float:
             {'Type': 'TERM_MATCH', 'Field': 'termType', 'Value': 'OnDemand'},
         ]
         
-        response = pricing_client.get_products(
-            ServiceCode='AmazonEC2',
-            Filters=filters,
-            MaxResults=1
-        )
+        with service_slot("pricing"):
+            response = call_with_backoff(
+                pricing_client.get_products,
+                ServiceCode='AmazonEC2',
+                Filters=filters,
+                MaxResults=1
+            )
         
         if response['PriceList']:
             price_data = json.loads(response['PriceList'][0])
@@ -640,6 +1297,7 @@ def get_ebs_pricing(region: str = 'us-east-1') -> float:
         return 0.0
         
     except Exception as e:
+        raise_if_throttled(e)
         print(f"[EBS PRICING] Error fetching EBS pricing: {e}")
         return 0.0
 
@@ -670,6 +1328,7 @@ def calculate_stop_instance_savings(instance_type: str, region: str, os_type: st
         }
         
     except Exception as e:
+        raise_if_throttled(e)
         print(f"[STOP] Error calculating stop savings: {e}")
         return {
             "savings": 0.0,
@@ -0,0 +1,264 @@
+"""
+Compact EC2 fleet representation for fo.ai
+InstanceRecord is a slotted per-instance record; Fleet stores a whole scan column-wise
+(NumPy arrays for the numeric fields, dictionary-encoded strings for type/AZ/region/
+account). Analysis code works on the columns; dicts are only built at the API boundary.
+"""
+
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+TagPairs = Tuple[Tuple[str, str], ...]
+
+# CPU for records without metrics: treated as busy, so the rules never recommend them
+UNKNOWN_CPU = 100.0
+
+
+@dataclass(slots=True)
+class InstanceRecord:
+    """One analysed EC2 instance"""
+    instance_id: str
+    instance_type: str = "unknown"
+    availability_zone: str = "unknown"
+    region: str = "unknown"
+    account_id: Optional[str] = None
+    state: str = "unknown"
+    platform: str = "linux"
+    os_type: str = "Linux"  # pricing operatingSystem (Linux, Windows, RHEL, SUSE)
+    average_cpu: float = UNKNOWN_CPU
+    current_cpu: float = UNKNOWN_CPU
+    uptime_hours: float = 0.0
+    hourly_cost: float = 0.0
+    monthly_cost: float = 0.0
+    estimated_savings: float = 0.0
+    savings_reason: str = ""
+    recommended_type: str = ""  # percentile rightsizing target, if any
+    cpu_percentile: float = 0.0  # CPU at the rightsizing percentile
+    tags: TagPairs = field(default_factory=tuple)
+    launch_time: str = ""
+    vpc_id: str = ""
+    subnet_id: str = ""
+    private_ip: str = ""
+    public_ip: str = ""
+
+    @property
+    def tag_dict(self) -> Dict[str, str]:
+        return dict(self.tags)
+
+    def to_dict(self) -> dict:
+        """Legacy instance dict, as returned by the API"""
+        return {
+            "InstanceId": self.instance_id,
+            "InstanceType": self.instance_type,
+            "AvailabilityZone": self.availability_zone,
+            "Tags": [{"Key": key, "Value": value} for key, value in self.tags],
+            "TagDict": self.tag_dict,
+            "AverageCPU": self.average_cpu,
+            "CurrentCPU": self.current_cpu,
+            "EstimatedSavings": self.estimated_savings,
+            "SavingsReason": self.savings_reason,
+            "RecommendedInstanceType": self.recommended_type,
+            "CPUPercentile": self.cpu_percentile,
+            "UptimeHours": self.uptime_hours,
+            "region": self.region,
+            "AccountId": self.account_id,
+            "estimated_hourly_cost": self.hourly_cost,
+            "estimated_monthly_cost": self.monthly_cost,
+            "State": self.state,
+            "LaunchTime": self.launch_time,
+            "Platform": self.platform,
+            "OperatingSystem": self.os_type,
+            "VpcId": self.vpc_id,
+            "SubnetId": self.subnet_id,
+            "PrivateIpAddress": self.private_ip,
+            "PublicIpAddress": self.public_ip,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "InstanceRecord":
+        """Build a record from a legacy instance dict (mock data, older callers)"""
+        launch_time = data.get("LaunchTime", "")
+        return cls(
+            instance_id=data.get("InstanceId", ""),
+            instance_type=data.get("InstanceType", "unknown"),
+            availability_zone=data.get("AvailabilityZone", "unknown"),
+            region=data.get("region") or "unknown",
+            account_id=data.get("AccountId"),
+            state=data.get("State", "unknown"),
+            platform=data.get("Platform", "linux"),
+            os_type=data.get("OperatingSystem") or ("Windows" if data.get("Platform") == "windows" else "Linux"),
+            average_cpu=float(data.get("AverageCPU", UNKNOWN_CPU)),
+            current_cpu=float(data.get("CurrentCPU", UNKNOWN_CPU)),
+            uptime_hours=float(data.get("UptimeHours", 0.0)),
+            hourly_cost=float(data.get("estimated_hourly_cost", 0.0)),
+            monthly_cost=float(data.get("estimated_monthly_cost", 0.0)),
+            estimated_savings=float(data.get("EstimatedSavings", 0.0)),
+            savings_reason=data.get("SavingsReason", ""),
+            recommended_type=data.get("RecommendedInstanceType", ""),
+            cpu_percentile=float(data.get("CPUPercentile", 0.0)),
+            tags=tags_to_pairs(data.get("Tags", [])),
+            launch_time=launch_time.isoformat() if hasattr(launch_time, "isoformat") else str(launch_time or ""),
+            vpc_id=data.get("VpcId", ""),
+            subnet_id=data.get("SubnetId", ""),
+            private_ip=data.get("PrivateIpAddress", ""),
+            public_ip=data.get("PublicIpAddress", ""),
+        )
+
+
+def tags_to_pairs(tags: Optional[List[dict]]) -> TagPairs:
+    """AWS tag list -> tuple of interned (key, value) pairs"""
+    return tuple((sys.intern(tag.get("Key", "")), sys.intern(tag.get("Value", ""))) for tag in tags or [])
+
+
+class Fleet:
+    """
+    Column-wise container for a fleet of InstanceRecords.
+    Numeric fields are float64 arrays, low-cardinality strings are stored as int32 codes
+    into a shared category list, everything else as plain per-row lists.
+    """
+
+    NUMERIC_FIELDS = ("average_cpu", "current_cpu", "uptime_hours", "hourly_cost", "monthly_cost", "estimated_savings",
+                      "cpu_percentile")
+    CATEGORICAL_FIELDS = ("instance_type", "availability_zone", "region", "account_id", "state", "platform", "os_type")
+    OBJECT_FIELDS = ("instance_id", "savings_reason", "recommended_type", "tags", "launch_time", "vpc_id", "subnet_id", "private_ip", "public_ip")
+
+    __slots__ = ("size", "numeric", "codes", "categories", "objects")
+
+    def __init__(self, size: int, numeric: Dict[str, np.ndarray], codes: Dict[str, np.ndarray],
+                 categories: Dict[str, List[Optional[str]]], objects: Dict[str, list]):
+        self.size = size
+        self.numeric = numeric
+        self.codes = codes
+        self.categories = categories
+        self.objects = objects
+
+    # --- construction ---
+
+    @classmethod
+    def empty(cls) -> "Fleet":
+        return cls.from_records([])
+
+    @classmethod
+    def from_records(cls, records: Sequence[InstanceRecord]) -> "Fleet":
+        numeric = {
+            name: np.fromiter((getattr(r, name) for r in records), dtype=np.float64, count=len(records))
+            for name in cls.NUMERIC_FIELDS
+        }
+        codes, categories = {}, {}
+        for name in cls.CATEGORICAL_FIELDS:
+            lookup: Dict[Optional[str], int] = {}
+            codes[name] = np.fromiter(
+                (lookup.setdefault(getattr(r, name), len(lookup)) for r in records), dtype=np.int32, count=len(records)
+            )
+            categories[name] = [sys.intern(value) if isinstance(value, str) else value for value in lookup]
+        objects = {name: [getattr(r, name) for r in records] for name in cls.OBJECT_FIELDS}
+        return cls(len(records), numeric, codes, categories, objects)
+
+    @classmethod
+    def from_dicts(cls, instances: Iterable[dict]) -> "Fleet":
+        return cls.from_records([InstanceRecord.from_dict(instance) for instance in instances])
+
+    @classmethod
+    def from_any(cls, data: Union["Fleet", Iterable[Union[InstanceRecord, dict]], None]) -> "Fleet":
+        """Accept a Fleet, InstanceRecords or legacy dicts"""
+        if isinstance(data, Fleet):
+            return data
+        rows = list(data or [])
+        return cls.from_records([row if isinstance(row, InstanceRecord) else InstanceRecord.from_dict(row) for row in rows])
+
+    @classmethod
+    def concat(cls, fleets: Iterable["Fleet"]) -> "Fleet":
+        fleets = [fleet for fleet in fleets if fleet is not None]
+        if not fleets:
+            return cls.empty()
+        if len(fleets) == 1:
+            return fleets[0]
+        numeric = {name: np.concatenate([f.numeric[name] for f in fleets]) for name in cls.NUMERIC_FIELDS}
+        codes, categories = {}, {}
+        for name in cls.CATEGORICAL_FIELDS:
+            lookup: Dict[Optional[str], int] = {}
+            remapped = []
+            for fleet in fleets:
+                mapping = np.array([lookup.setdefault(value, len(lookup)) for value in fleet.categories[name]] or [0],
+                                   dtype=np.int32)
+                remapped.append(mapping[fleet.codes[name]])
+            codes[name] = np.concatenate(remapped)
+            categories[name] = list(lookup)
+        objects = {name: [value for f in fleets for value in f.objects[name]] for name in cls.OBJECT_FIELDS}
+        return cls(sum(f.size for f in fleets), numeric, codes, categories, objects)
+
+    # --- access ---
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def __iter__(self) -> Iterator[InstanceRecord]:
+        for i in range(self.size):
+            yield self.record(i)
+
+    def __getitem__(self, i: int) -> InstanceRecord:
+        return self.record(i)
+
+    def __repr__(self) -> str:
+        return (f"Fleet({self.size} instances, {len(self.categories['region'])} regions, "
+                f"${self.total('monthly_cost'):.2f}/month)")
+
+    def record(self, i: int) -> InstanceRecord:
+        values = {name: float(self.numeric[name][i]) for name in self.NUMERIC_FIELDS}
+        values.update({name: self.categories[name][self.codes[name][i]] for name in self.CATEGORICAL_FIELDS})
+        values.update({name: self.objects[name][i] for name in self.OBJECT_FIELDS})
+        return InstanceRecord(**values)
+
+    def column(self, name: str) -> np.ndarray:
+        """Numeric column as a float array, or a categorical column decoded to an object array"""
+        if name in self.numeric:
+            return self.numeric[name]
+        if name in self.codes:
+            return np.array(self.categories[name], dtype=object)[self.codes[name]] if self.size else np.array([], dtype=object)
+        return np.array(self.objects[name], dtype=object)
+
+    def total(self, name: str) -> float:
+        return float(self.numeric[name].sum()) if self.size else 0.0
+
+    def take(self, indices: Sequence[int]) -> "Fleet":
+        """Subset of the fleet (keeps the category lists, remaps nothing)"""
+        indices = np.asarray(indices, dtype=np.int64)
+        return Fleet(
+            len(indices),
+            {name: values[indices] for name, values in self.numeric.items()},
+            {name: codes[indices] for name, codes in self.codes.items()},
+            self.categories,
+            {name: [values[i] for i in indices] for name, values in self.objects.items()},
+        )
+
+    def group_sums(self, by: Sequence[str], fields: Sequence[str]) -> List[Tuple[tuple, int, Dict[str, float]]]:
+        """
+        Sum numeric `fields` per distinct combination of categorical `by` fields.
+        Returns [(key values, row count, {field: sum}), ...].
+        """
+        if not self.size:
+            return []
+        key_codes = np.stack([self.codes[name] for name in by], axis=1)
+        unique_keys, inverse = np.unique(key_codes, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=len(unique_keys))
+        sums = {name: np.bincount(inverse, weights=self.numeric[name], minlength=len(unique_keys)) for name in fields}
+        return [
+            (
+                tuple(self.categories[name][code] for name, code in zip(by, unique_keys[g])),
+                int(counts[g]),
+                {name: float(sums[name][g]) for name in fields},
+            )
+            for g in range(len(unique_keys))
+        ]
+
+    def to_dicts(self, indices: Optional[Sequence[int]] = None) -> List[dict]:
+        """Materialise legacy instance dicts (API boundary only)"""
+        rows = range(self.size) if indices is None else indices
+        return [self.record(int(i)).to_dict() for i in rows]
@@ -0,0 +1,203 @@
+"""
+Idle-window schedule mining for fo.ai
+Folds each instance's hourly CPU series into a 7x24 hour-of-week profile (vectorized
+across the fleet), finds the contiguous windows that are idle every observed week, and
+turns them into stop/start cron schedules with the hours and dollars they save.
+Schedules are in UTC, like EventBridge cron expressions.
+"""
+
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from data.aws.cloudwatch import fetch_fleet_cpu_metrics
+from data.aws.fleet import Fleet
+
+# An hour-of-week bin is idle when CPU stays at or below this in every observed week
+IDLE_CPU_THRESHOLD = float(os.getenv("IDLE_CPU_THRESHOLD", "5"))
+# Shortest window worth a stop/start pair (restart costs and boot time eat shorter ones)
+IDLE_MIN_WINDOW_HOURS = int(os.getenv("IDLE_MIN_WINDOW_HOURS", "4"))
+# Weeks of history each bin needs before it can count as idle
+IDLE_MIN_WEEKS = int(os.getenv("IDLE_MIN_WEEKS", "2"))
+IDLE_LOOKBACK_DAYS = int(os.getenv("IDLE_LOOKBACK_DAYS", "28"))
+
+HOURS_PER_WEEK = 168
+HOURS_PER_MONTH = 730
+WEEKDAYS = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
+
+Series = List[Tuple[datetime, float]]
+
+
+def hour_of_week_profile(series_by_instance: Dict[str, Series], instance_ids: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fold hourly series into (peak, weeks) arrays of shape [instance, 7, 24]:
+    peak = highest CPU seen in that hour-of-week bin, weeks = datapoints folded into it.
+    Bins without data have peak NaN and weeks 0.
+    """
+    rows, bins, values = [], [], []
+    for row, instance_id in enumerate(instance_ids):
+        series = series_by_instance.get(instance_id) or []
+        if not series:
+            continue
+        rows.append(np.full(len(series), row, dtype=np.int64))
+        bins.append(np.fromiter((ts.weekday() * 24 + ts.hour for ts, _ in series), dtype=np.int64, count=len(series)))
+        values.append(np.fromiter((value for _, value in series), dtype=np.float64, count=len(series)))
+
+    size = len(instance_ids) * HOURS_PER_WEEK
+    peak = np.full(size, -np.inf)
+    weeks = np.zeros(size, dtype=np.int64)
+    if rows:
+        flat = np.concatenate(rows) * HOURS_PER_WEEK + np.concatenate(bins)
+        np.maximum.at(peak, flat, np.concatenate(values))
+        np.add.at(weeks, flat, 1)
+    peak[weeks == 0] = np.nan
+    return peak.reshape(-1, 7, 24), weeks.reshape(-1, 7, 24)
+
+
+def idle_windows(idle: np.ndarray, min_hours: int = IDLE_MIN_WINDOW_HOURS) -> List[List[Tuple[int, int]]]:
+    """
+    Contiguous idle runs per instance from an idle mask [instance, 168], wrapping around the
+    end of the week. Returns [[(start hour-of-week, length), ...], ...]; a fully idle week is
+    returned as [(0, 168)].
+    """
+    count = len(idle)
+    if not count:
+        return []
+    # Two laps of the week, so runs crossing Sunday -> Monday stay whole
+    doubled = np.concatenate([idle, idle], axis=1).astype(np.int8)
+    edges = np.diff(np.pad(doubled, ((0, 0), (1, 1))), axis=1)
+    start_rows, start_cols = np.nonzero(edges == 1)
+    end_rows, end_cols = np.nonzero(edges == -1)
+
+    windows: List[List[Tuple[int, int]]] = [[] for _ in range(count)]
+    full_week = idle.all(axis=1)
+    for row in np.flatnonzero(full_week):
+        windows[row].append((0, HOURS_PER_WEEK))
+    for row, start, end in zip(start_rows, start_cols, end_cols):
+        # Runs are reported once, from the lap where they start; skip the full-week case
+        if full_week[row] or start >= HOURS_PER_WEEK or (start == 0 and idle[row, -1]):
+            continue
+        length = min(end - start, HOURS_PER_WEEK)
+        if length >= min_hours:
+            windows[row].append((int(start), int(length)))
+    return windows
+
+
+def _hour_label(hour: int) -> str:
+    return f"{hour:02d}:00"
+
+
+def windows_to_schedules(windows: List[Tuple[int, int]]) -> List[dict]:
+    """
+    Group idle windows that stop and start at the same hours into one stop/start cron pair
+    (e.g. weeknights and the weekend both 19:00 -> 07:00). Sorted by hours saved, largest first.
+    """
+    groups: Dict[Tuple[int, int], List[Tuple[int, int]]] = defaultdict(list)
+    for start, length in windows:
+        groups[(start % 24, (start + length) % 24)].append((start, length))
+
+    schedules = []
+    for (stop_hour, end_hour), group in groups.items():
+        stop_bins = sorted({start // 24 for start, _ in group})
+        start_bins = sorted({((start + length) // 24) % 7 for start, length in group})
+        stop_days = [WEEKDAYS[day] for day in stop_bins]
+        start_days = [WEEKDAYS[day] for day in start_bins]
+        hours_per_week = sum(length for _, length in group)
+        schedules.append({
+            "stop_cron": f"cron(0 {stop_hour} ? * {','.join(stop_days)} *)",
+            "start_cron": f"cron(0 {end_hour} ? * {','.join(start_days)} *)",
+            "stop_time": _hour_label(stop_hour),
+            "start_time": _hour_label(end_hour),
+            "stop_days": stop_days,
+            "start_days": start_days,
+            "windows": len(group),
+            "hours_per_week": hours_per_week,
+            "description": (f"stop {_hour_label(stop_hour)} {','.join(stop_days)}, "
+                            f"start {_hour_label(end_hour)} {','.join(start_days)} (UTC)"),
+        })
+    schedules.sort(key=lambda schedule: -schedule["hours_per_week"])
+    return schedules
+
+
+def mine_idle_schedules(
+    instance_ids: Sequence[str],
+    cpu_series: Dict[str, Series],
+    hourly_costs: Sequence[float],
+    cpu_threshold: float = IDLE_CPU_THRESHOLD,
+    min_window_hours: int = IDLE_MIN_WINDOW_HOURS,
+    min_weeks: int = IDLE_MIN_WEEKS,
+) -> Dict[str, dict]:
+    """
+    Proposed stop/start schedules per instance with recurring idle windows.
+
+    Returns {instance_id: {"IdleHoursPerWeek", "MonthlySavings", "HourlyCost", "AlwaysIdle",
+             "Schedules": [...], "shutdown_parameters", "startup_parameters"}}.
+    The *_parameters dicts go straight to EC2Agent schedule_shutdown / schedule_startup
+    and apply the schedule that saves the most hours.
+    """
+    if not len(instance_ids):
+        return {}
+    peak, weeks = hour_of_week_profile(cpu_series, instance_ids)
+    idle = ((peak <= cpu_threshold) & (weeks >= min_weeks)).reshape(len(instance_ids), HOURS_PER_WEEK)
+    windows = idle_windows(idle, min_window_hours)
+    hourly_costs = np.asarray(hourly_costs, dtype=np.float64)
+
+    proposals = {}
+    for row, instance_windows in enumerate(windows):
+        if not instance_windows:
+            continue
+        instance_id = instance_ids[row]
+        always_idle = instance_windows == [(0, HOURS_PER_WEEK)]
+        schedules = [] if always_idle else windows_to_schedules(instance_windows)
+        for schedule in schedules:
+            schedule["monthly_savings"] = round(
+                schedule["hours_per_week"] * HOURS_PER_MONTH / HOURS_PER_WEEK * hourly_costs[row], 2
+            )
+        idle_hours = sum(length for _, length in instance_windows)
+        proposal = {
+            "IdleHoursPerWeek": idle_hours,
+            "MonthlySavings": round(idle_hours * HOURS_PER_MONTH / HOURS_PER_WEEK * hourly_costs[row], 2),
+            "HourlyCost": float(hourly_costs[row]),
+            "AlwaysIdle": always_idle,
+            "Schedules": schedules,
+        }
+        if schedules:
+            best = schedules[0]
+            proposal["shutdown_parameters"] = {
+                "instance_id": instance_id,
+                "schedule": {"type": "cron", "cron_expression": best["stop_cron"], "description": best["description"]},
+            }
+            proposal["startup_parameters"] = {
+                "instance_id": instance_id,
+                "schedule": {"type": "cron", "cron_expression": best["start_cron"], "description": best["description"]},
+            }
+        proposals[instance_id] = proposal
+
+    print(f"[IDLE] {len(proposals)}/{len(instance_ids)} instances have recurring idle windows "
+          f"(<= {cpu_threshold:g}% CPU for {min_window_hours}h+, {min_weeks}+ weeks of data)")
+    return proposals
+
+
+def suggest_idle_schedules(instances, region: Optional[str] = None, days: int = IDLE_LOOKBACK_DAYS,
+                           tier_cpu_threshold: Optional[float] = None, **kwargs) -> Dict[str, dict]:
+    """
+    Mine idle schedules for a Fleet (or InstanceRecords / legacy dicts), fetching
+    `days` of hourly CPU per region through the metrics store.
+    With tier_cpu_threshold, only instances whose daily average CPU is below it plus
+    TIERED_METRICS_MARGIN get hourly series; the rest are not mined.
+    """
+    fleet = Fleet.from_any(instances)
+    if not fleet:
+        return {}
+    instance_ids = fleet.objects["instance_id"]
+    regions = fleet.column("region")
+    series = {}
+    for scan_region in dict.fromkeys(regions):
+        ids = [instance_id for instance_id, r in zip(instance_ids, regions) if r == scan_region]
+        metrics_region = region or (scan_region if scan_region not in (None, "unknown") else None)
+        fleet_metrics = fetch_fleet_cpu_metrics(ids, region=metrics_region, days=days, cpu_threshold=tier_cpu_threshold)
+        series.update({instance_id: metrics["HourlySeries"] for instance_id, metrics in fleet_metrics.items()})
+    return mine_idle_schedules(instance_ids, series, fleet.numeric["hourly_cost"], **kwargs)
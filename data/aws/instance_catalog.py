@@ -0,0 +1,396 @@
+"""
+EC2 instance-type catalog for fo.ai
+Caches describe_instance_types per region on disk (SQLite, refreshed after a TTL) and
+keeps bisect indexes in memory, so rightsizing works for every family: the next smaller
+type in a family, or the smallest type covering a vCPU / memory target, is O(log n).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from data.aws.rate_limiter import call_with_backoff, raise_if_throttled
+from data.aws.settings import get_boto3_client, AWS_REGION
+
+INSTANCE_CATALOG_ENABLED = os.getenv("INSTANCE_CATALOG_ENABLED", "True").lower() == "true"
+INSTANCE_CATALOG_PATH = os.getenv("INSTANCE_CATALOG_PATH", ".foai/instance_types.db")
+INSTANCE_CATALOG_TTL_SECONDS = int(os.getenv("INSTANCE_CATALOG_TTL_SECONDS", "604800"))  # 7 days
+
+# Instance family prefix -> (category, description); longest prefix wins
+FAMILY_CATEGORIES = {
+    "t": ("General Purpose", "Burstable general purpose"),
+    "m": ("General Purpose", "Balanced compute, memory and networking"),
+    "a": ("General Purpose", "Arm-based general purpose"),
+    "mac": ("General Purpose", "macOS on dedicated Mac hardware"),
+    "c": ("Compute Optimized", "High vCPU-to-memory ratio for compute-bound workloads"),
+    "hpc": ("Compute Optimized", "High performance computing"),
+    "r": ("Memory Optimized", "High memory-to-vCPU ratio for in-memory workloads"),
+    "x": ("Memory Optimized", "Very large memory footprints"),
+    "u": ("Memory Optimized", "High memory (SAP HANA class)"),
+    "z": ("Memory Optimized", "High single-thread frequency with large memory"),
+    "i": ("Storage Optimized", "High random I/O local NVMe storage"),
+    "im": ("Storage Optimized", "Dense local NVMe storage"),
+    "is": ("Storage Optimized", "Dense local NVMe storage"),
+    "d": ("Storage Optimized", "Dense local HDD storage"),
+    "h": ("Storage Optimized", "High sequential throughput local HDD storage"),
+    "p": ("Accelerated Computing", "GPU instances for training and HPC"),
+    "g": ("Accelerated Computing", "GPU instances for graphics and inference"),
+    "inf": ("Accelerated Computing", "AWS Inferentia machine learning inference"),
+    "trn": ("Accelerated Computing", "AWS Trainium machine learning training"),
+    "dl": ("Accelerated Computing", "Deep learning training"),
+    "f": ("Accelerated Computing", "FPGA instances"),
+    "vt": ("Accelerated Computing", "Video transcoding"),
+}
+
+_SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS instance_types (
+    region TEXT NOT NULL,
+    instance_type TEXT NOT NULL,
+    vcpu INTEGER NOT NULL,
+    memory_mib INTEGER NOT NULL,
+    network TEXT NOT NULL,
+    architectures TEXT NOT NULL,
+    burstable INTEGER NOT NULL,
+    current_generation INTEGER NOT NULL,
+    PRIMARY KEY (region, instance_type)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS instance_catalog_meta (
+    region TEXT PRIMARY KEY,
+    refreshed_at INTEGER NOT NULL
+);
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Per-thread connection to the catalog, creating the database on first use"""
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        store_dir = os.path.dirname(INSTANCE_CATALOG_PATH)
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+        conn = sqlite3.connect(INSTANCE_CATALOG_PATH, timeout=30)
+        with _schema_lock:
+            if not _schema_ready:
+                conn.executescript(_SCHEMA)
+                _schema_ready = True
+        _local.conn = conn
+    return conn
+
+
+def instance_family(instance_type: str) -> str:
+    """'m5d.2xlarge' -> 'm5d'"""
+    return instance_type.split(".", 1)[0]
+
+
+def family_category(family: str) -> Tuple[str, str]:
+    """(category, description) for an instance family, e.g. 'r6g' -> Memory Optimized"""
+    letters = ""
+    for char in family:
+        if char.isdigit() or char == "-":
+            break
+        letters += char
+    for length in range(len(letters), 0, -1):
+        if letters[:length] in FAMILY_CATEGORIES:
+            return FAMILY_CATEGORIES[letters[:length]]
+    return ("Unknown", "Unknown instance family")
+
+
+@dataclass(slots=True, frozen=True)
+class InstanceTypeInfo:
+    """Hardware profile of one instance type"""
+    instance_type: str
+    vcpu: int
+    memory_mib: int
+    network: str = "Unknown"
+    architectures: Tuple[str, ...] = ()
+    burstable: bool = False
+    current_generation: bool = True
+
+    @property
+    def family(self) -> str:
+        return instance_family(self.instance_type)
+
+    @property
+    def memory_gib(self) -> float:
+        return self.memory_mib / 1024
+
+    @property
+    def sort_key(self) -> Tuple[int, int, str]:
+        return (self.vcpu, self.memory_mib, self.instance_type)
+
+    def to_details(self) -> dict:
+        """InstanceTypeDetails dict, as shown in recommendations"""
+        category, description = family_category(self.family)
+        return {
+            "Family": self.family,
+            "Category": category,
+            "Description": description,
+            "vCPU": self.vcpu,
+            "Memory": f"{self.memory_gib:g} GiB",
+            "Network": self.network,
+            "Architecture": ", ".join(self.architectures) or "Unknown",
+            "Burstable": self.burstable,
+        }
+
+    @classmethod
+    def from_api(cls, item: dict) -> "InstanceTypeInfo":
+        """Build from one describe_instance_types entry"""
+        return cls(
+            instance_type=item["InstanceType"],
+            vcpu=int(item.get("VCpuInfo", {}).get("DefaultVCpus", 0)),
+            memory_mib=int(item.get("MemoryInfo", {}).get("SizeInMiB", 0)),
+            network=item.get("NetworkInfo", {}).get("NetworkPerformance", "Unknown"),
+            architectures=tuple(item.get("ProcessorInfo", {}).get("SupportedArchitectures", [])),
+            burstable=bool(item.get("BurstablePerformanceSupported", False)),
+            current_generation=bool(item.get("CurrentGeneration", True)),
+        )
+
+
+class InstanceCatalog:
+    """
+    In-memory indexes over one region's instance types.
+    Each family is kept sorted by (vCPU, memory); lookups within a family bisect those
+    keys, cross-family queries do one bisect per family.
+    """
+
+    def __init__(self, region: str, types: Iterable[InstanceTypeInfo], refreshed_at: float = 0.0):
+        self.region = region
+        self.refreshed_at = refreshed_at
+        self.types: Dict[str, InstanceTypeInfo] = {}
+        by_family: Dict[str, List[InstanceTypeInfo]] = {}
+        for info in types:
+            self.types[info.instance_type] = info
+            by_family.setdefault(info.family, []).append(info)
+        self.families: Dict[str, List[InstanceTypeInfo]] = {}
+        self._keys: Dict[str, List[Tuple[int, int, str]]] = {}
+        self._vcpus: Dict[str, List[int]] = {}
+        # Running max of memory per family, so "first type with >= Y GiB" is a bisect too
+        self._memory_max: Dict[str, List[int]] = {}
+        for family, members in by_family.items():
+            members.sort(key=lambda info: info.sort_key)
+            self.families[family] = members
+            self._keys[family] = [info.sort_key for info in members]
+            self._vcpus[family] = [info.vcpu for info in members]
+            running, memory_max = 0, []
+            for info in members:
+                running = max(running, info.memory_mib)
+                memory_max.append(running)
+            self._memory_max[family] = memory_max
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def __bool__(self) -> bool:
+        return bool(self.types)
+
+    def get(self, instance_type: str) -> Optional[InstanceTypeInfo]:
+        return self.types.get(instance_type)
+
+    def next_smaller(self, instance_type: str) -> Optional[InstanceTypeInfo]:
+        """Largest type in the same family that is strictly smaller (vCPU or memory)"""
+        info = self.types.get(instance_type)
+        if info is None:
+            return None
+        family = info.family
+        members, keys = self.families[family], self._keys[family]
+        index = bisect_left(keys, info.sort_key) - 1
+        # Skip same-sized variants (e.g. .metal next to the largest virtualised size)
+        while index >= 0 and (members[index].vcpu, members[index].memory_mib) == (info.vcpu, info.memory_mib):
+            index -= 1
+        return members[index] if index >= 0 else None
+
+    def smallest_covering(self, family: str, min_vcpu: float = 0, min_memory_gib: float = 0) -> Optional[InstanceTypeInfo]:
+        """Smallest type in `family` with at least min_vcpu vCPUs and min_memory_gib GiB"""
+        members = self.families.get(family)
+        if not members:
+            return None
+        min_memory_mib = min_memory_gib * 1024
+        index = max(
+            bisect_left(self._vcpus[family], min_vcpu),
+            bisect_left(self._memory_max[family], min_memory_mib),
+        )
+        # Memory is not strictly monotonic in vCPU for every family; step past any gap
+        while index < len(members) and members[index].memory_mib < min_memory_mib:
+            index += 1
+        return members[index] if index < len(members) else None
+
+    def cheapest_covering(
+        self,
+        min_vcpu: float,
+        min_memory_gib: float,
+        price_fn: Callable[[str], float],
+        families: Optional[Iterable[str]] = None,
+        architecture: Optional[str] = None,
+        include_burstable: bool = True,
+        current_generation_only: bool = True,
+    ) -> Optional[Tuple[InstanceTypeInfo, float]]:
+        """
+        Cheapest (type, hourly price) with at least min_vcpu vCPUs and min_memory_gib GiB.
+        Prices only the smallest covering type of each candidate family, since price grows
+        with size inside a family. Types price_fn cannot price (<= 0) are skipped.
+        """
+        best: Optional[Tuple[InstanceTypeInfo, float]] = None
+        for family in (families if families is not None else self.families):
+            candidate = self.smallest_covering(family, min_vcpu, min_memory_gib)
+            if candidate is None:
+                continue
+            if architecture and architecture not in candidate.architectures:
+                continue
+            if candidate.burstable and not include_burstable:
+                continue
+            if current_generation_only and not candidate.current_generation:
+                continue
+            price = price_fn(candidate.instance_type)
+            if price > 0 and (best is None or price < best[1]):
+                best = (candidate, price)
+        return best
+
+
+_catalogs: Dict[str, InstanceCatalog] = {}
+_catalogs_lock = threading.Lock()
+_region_locks: Dict[str, threading.Lock] = {}
+
+
+def _load_from_disk(region: str) -> Tuple[List[InstanceTypeInfo], float]:
+    conn = _get_connection()
+    row = conn.execute("SELECT refreshed_at FROM instance_catalog_meta WHERE region = ?", (region,)).fetchone()
+    if row is None:
+        return [], 0.0
+    types = [
+        InstanceTypeInfo(instance_type, vcpu, memory_mib, network,
+                         tuple(a for a in architectures.split(",") if a), bool(burstable), bool(current_generation))
+        for instance_type, vcpu, memory_mib, network, architectures, burstable, current_generation in conn.execute(
+            "SELECT instance_type, vcpu, memory_mib, network, architectures, burstable, current_generation "
+            "FROM instance_types WHERE region = ?",
+            (region,),
+        )
+    ]
+    return types, float(row[0])
+
+
+def _save_to_disk(region: str, types: List[InstanceTypeInfo], refreshed_at: float):
+    conn = _get_connection()
+    rows = [
+        (region, info.instance_type, info.vcpu, info.memory_mib, info.network,
+         ",".join(info.architectures), int(info.burstable), int(info.current_generation))
+        for info in types
+    ]
+    with conn:
+        conn.execute("DELETE FROM instance_types WHERE region = ?", (region,))
+        conn.executemany("INSERT INTO instance_types VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("INSERT OR REPLACE INTO instance_catalog_meta VALUES (?, ?)", (region, int(refreshed_at)))
+
+
+def _describe_instance_types(region: str) -> List[InstanceTypeInfo]:
+    """Page through describe_instance_types for a region"""
+    ec2 = get_boto3_client("ec2", region)
+    paginator = ec2.get_paginator("describe_instance_types")
+    types = []
+
+    def read_all():
+        types.clear()
+        for page in paginator.paginate(PaginationConfig={"PageSize": 100}):
+            types.extend(InstanceTypeInfo.from_api(item) for item in page.get("InstanceTypes", []))
+
+    call_with_backoff(read_all)
+    return types
+
+
+def get_instance_catalog(region: Optional[str] = None, refresh: bool = False) -> InstanceCatalog:
+    """
+    Instance-type catalog for a region: memory first, then the on-disk copy while it is
+    younger than INSTANCE_CATALOG_TTL_SECONDS, then describe_instance_types.
+    A stale on-disk copy is still used if the API call fails; an empty catalog otherwise.
+    """
+    region = region or AWS_REGION
+    now = time.time()
+    catalog = _catalogs.get(region)
+    if catalog is not None and not refresh and now - catalog.refreshed_at < INSTANCE_CATALOG_TTL_SECONDS:
+        return catalog
+    if not INSTANCE_CATALOG_ENABLED:
+        return _catalogs.setdefault(region, InstanceCatalog(region, [], now))
+
+    with _catalogs_lock:
+        region_lock = _region_locks.setdefault(region, threading.Lock())
+    with region_lock:
+        catalog = _catalogs.get(region)
+        if catalog is not None and not refresh and now - catalog.refreshed_at < INSTANCE_CATALOG_TTL_SECONDS:
+            return catalog
+
+        stored, refreshed_at = _load_from_disk(region)
+        if stored and not refresh and now - refreshed_at < INSTANCE_CATALOG_TTL_SECONDS:
+            catalog = InstanceCatalog(region, stored, refreshed_at)
+            print(f"[CATALOG] Loaded {len(catalog)} instance types for {region} from disk")
+        else:
+            try:
+                print(f"[CATALOG] Refreshing instance types for {region}...")
+                types = _describe_instance_types(region)
+                _save_to_disk(region, types, now)
+                catalog = InstanceCatalog(region, types, now)
+                print(f"[CATALOG] Indexed {len(catalog)} instance types in {len(catalog.families)} families")
+            except Exception as e:
+                raise_if_throttled(e)
+                print(f"[ERROR] [CATALOG] Could not describe instance types in {region}: {e}")
+                # Keep serving a stale copy, but retry the API after a short back-off rather than the full TTL
+                retry_at = now - INSTANCE_CATALOG_TTL_SECONDS + 300
+                catalog = InstanceCatalog(region, stored, retry_at)
+
+        _catalogs[region] = catalog
+        return catalog
+
+
+def get_instance_type_info(instance_type: str, region: Optional[str] = None) -> Optional[InstanceTypeInfo]:
+    """Hardware profile of an instance type, or None if the catalog does not know it"""
+    return get_instance_catalog(region).get(instance_type)
+
+
+def get_instance_type_details(instance_type: str, region: Optional[str] = None) -> dict:
+    """InstanceTypeDetails for recommendations ({} when the type is unknown)"""
+    info = get_instance_type_info(instance_type, region)
+    return info.to_details() if info else {}
+
+
+def clear_instance_catalog(region: Optional[str] = None):
+    """Forget cached instance types (all regions, or one region) in memory and on disk"""
+    conn = _get_connection()
+    with conn:
+        if region:
+            conn.execute("DELETE FROM instance_types WHERE region = ?", (region,))
+            conn.execute("DELETE FROM instance_catalog_meta WHERE region = ?", (region,))
+        else:
+            conn.execute("DELETE FROM instance_types")
+            conn.execute("DELETE FROM instance_catalog_meta")
+    with _catalogs_lock:
+        if region:
+            _catalogs.pop(region, None)
+        else:
+            _catalogs.clear()
+    print("[CATALOG] Instance type catalog cleared")
+
+
+def get_instance_catalog_stats() -> dict:
+    """Get instance type catalog statistics"""
+    conn = _get_connection()
+    regions = {
+        region: {"instance_types": count, "refreshed_at": refreshed_at}
+        for region, count, refreshed_at in conn.execute(
+            "SELECT m.region, COUNT(t.instance_type), m.refreshed_at FROM instance_catalog_meta m "
+            "LEFT JOIN instance_types t ON t.region = m.region GROUP BY m.region"
+        )
+    }
+    return {
+        "path": INSTANCE_CATALOG_PATH,
+        "ttl_seconds": INSTANCE_CATALOG_TTL_SECONDS,
+        "regions": regions,
+        "loaded_regions": sorted(_catalogs),
+    }
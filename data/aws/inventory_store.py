@@ -0,0 +1,156 @@
+"""
+Persistent EC2 inventory snapshots for fo.ai
+Keeps the last enriched inventory per (account, region) in SQLite, keyed by instance ID
+with a fingerprint of what affects enrichment (type, state, tags and the scan settings),
+so a scan only re-enriches instances that are new, changed, scanned with other settings,
+or whose enrichment went stale.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from data.aws.fleet import InstanceRecord
+from data.aws.metrics_store import METRICS_FRESHNESS_SECONDS
+
+INVENTORY_STORE_ENABLED = os.getenv("INVENTORY_STORE_ENABLED", "True").lower() == "true"
+INVENTORY_STORE_PATH = os.getenv("INVENTORY_STORE_PATH", ".foai/inventory.db")
+# Unchanged instances reuse their stored enrichment for this long (metrics freshness by default)
+INVENTORY_ENRICHMENT_TTL_SECONDS = int(os.getenv("INVENTORY_ENRICHMENT_TTL_SECONDS", str(METRICS_FRESHNESS_SECONDS)))
+
+_SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS inventory_snapshot (
+    account_id TEXT NOT NULL,
+    region TEXT NOT NULL,
+    instance_id TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    record TEXT NOT NULL,
+    enriched_at INTEGER NOT NULL,
+    PRIMARY KEY (account_id, region, instance_id)
+) WITHOUT ROWID;
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Per-thread connection to the store, creating the database on first use"""
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        store_dir = os.path.dirname(INVENTORY_STORE_PATH)
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+        conn = sqlite3.connect(INVENTORY_STORE_PATH, timeout=30)
+        with _schema_lock:
+            if not _schema_ready:
+                conn.executescript(_SCHEMA)
+                _schema_ready = True
+        _local.conn = conn
+    return conn
+
+
+def instance_fingerprint(instance: dict, settings: Optional[Sequence] = None) -> str:
+    """
+    Stable hash of the described fields that change an instance's enrichment, plus the
+    scan `settings` it was enriched with (see ec2.enrichment_settings).
+    """
+    tags = sorted((tag.get("Key", ""), tag.get("Value", "")) for tag in instance.get("Tags", []))
+    payload = json.dumps([
+        instance.get("InstanceType", ""),
+        instance.get("State", {}).get("Name", ""),
+        tags,
+        list(settings or []),
+    ])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _record_to_json(record: InstanceRecord) -> str:
+    return json.dumps(asdict(record))
+
+
+def _record_from_json(raw: str) -> InstanceRecord:
+    values = json.loads(raw)
+    values["tags"] = tuple(tuple(pair) for pair in values.get("tags", []))
+    return InstanceRecord(**values)
+
+
+def load_snapshot(account_id: str, region: str) -> Dict[str, Tuple[str, str, int]]:
+    """instance_id -> (fingerprint, serialized record, enriched_at) for the last scan"""
+    conn = _get_connection()
+    return {
+        instance_id: (fingerprint, record, enriched_at)
+        for instance_id, fingerprint, record, enriched_at in conn.execute(
+            "SELECT instance_id, fingerprint, record, enriched_at FROM inventory_snapshot "
+            "WHERE account_id = ? AND region = ?",
+            (account_id or "", region),
+        )
+    }
+
+
+def reusable_record(snapshot: Dict[str, Tuple[str, str, int]], instance: dict,
+                    fingerprint: str, now: Optional[float] = None) -> Optional[InstanceRecord]:
+    """The stored enrichment for an instance if it is unchanged and still fresh, else None"""
+    entry = snapshot.get(instance["InstanceId"])
+    if entry is None:
+        return None
+    stored_fingerprint, record, enriched_at = entry
+    if stored_fingerprint != fingerprint:
+        return None
+    if (now or time.time()) - enriched_at >= INVENTORY_ENRICHMENT_TTL_SECONDS:
+        return None
+    return _record_from_json(record)
+
+
+def save_snapshot(account_id: str, region: str,
+                  entries: Iterable[Tuple[InstanceRecord, str, int]], replace: bool = True):
+    """
+    Store (record, fingerprint, enriched_at) entries for (account, region).
+    replace=True drops instances that were not part of this (full) scan.
+    """
+    conn = _get_connection()
+    rows = [
+        (account_id or "", region, record.instance_id, fingerprint, _record_to_json(record), int(enriched_at))
+        for record, fingerprint, enriched_at in entries
+    ]
+    with conn:
+        if replace:
+            conn.execute(
+                "DELETE FROM inventory_snapshot WHERE account_id = ? AND region = ?", (account_id or "", region)
+            )
+        conn.executemany("INSERT OR REPLACE INTO inventory_snapshot VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+def clear_inventory_store(account_id: Optional[str] = None, region: Optional[str] = None):
+    """Forget stored snapshots (all, one account, or one account/region)"""
+    conn = _get_connection()
+    with conn:
+        if account_id and region:
+            conn.execute("DELETE FROM inventory_snapshot WHERE account_id = ? AND region = ?", (account_id, region))
+        elif account_id:
+            conn.execute("DELETE FROM inventory_snapshot WHERE account_id = ?", (account_id,))
+        else:
+            conn.execute("DELETE FROM inventory_snapshot")
+    print("[INVENTORY] Snapshot store cleared")
+
+
+def get_inventory_store_stats() -> dict:
+    """Get inventory snapshot statistics"""
+    conn = _get_connection()
+    snapshots, instances = conn.execute(
+        "SELECT COUNT(DISTINCT account_id || '/' || region), COUNT(*) FROM inventory_snapshot"
+    ).fetchone()
+    return {
+        "path": INVENTORY_STORE_PATH,
+        "snapshots": snapshots,
+        "instances": instances,
+        "enrichment_ttl_seconds": INVENTORY_ENRICHMENT_TTL_SECONDS,
+    }
@@ -0,0 +1,217 @@
+"""
+Persistent local time-series store for CloudWatch metrics
+Keeps fetched datapoints in SQLite keyed by (instance, metric, period), so repeat
+analyses only fetch the missing tail since the last stored timestamp.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+METRICS_STORE_ENABLED = os.getenv("METRICS_STORE_ENABLED", "True").lower() == "true"
+METRICS_STORE_PATH = os.getenv("METRICS_STORE_PATH", ".foai/metrics.db")
+# Series fetched more recently than this are served from the store without any CloudWatch call
+METRICS_FRESHNESS_SECONDS = int(os.getenv("METRICS_FRESHNESS_SECONDS", "3600"))
+# Datapoints older than this are dropped during compaction
+METRICS_RETENTION_DAYS = int(os.getenv("METRICS_RETENTION_DAYS", "90"))
+# Hourly datapoints older than this are rolled up into daily averages (0 = keep hourly detail)
+METRICS_COMPACT_AFTER_DAYS = int(os.getenv("METRICS_COMPACT_AFTER_DAYS", "0"))
+METRICS_COMPACT_INTERVAL_SECONDS = int(os.getenv("METRICS_COMPACT_INTERVAL_SECONDS", "86400"))
+# Longest window analyses read from the store (7-day CPU metrics, IDLE_LOOKBACK_DAYS for idle schedules).
+# Compacting inside it would drop hourly detail a window still needs and force a head refetch every cycle.
+METRICS_LONGEST_WINDOW_DAYS = max(7, int(os.getenv("IDLE_LOOKBACK_DAYS", "28")))
+if 0 < METRICS_COMPACT_AFTER_DAYS < METRICS_LONGEST_WINDOW_DAYS:
+    print(f"[METRICS STORE] METRICS_COMPACT_AFTER_DAYS={METRICS_COMPACT_AFTER_DAYS} is inside the "
+          f"{METRICS_LONGEST_WINDOW_DAYS}-day analysis window - using {METRICS_LONGEST_WINDOW_DAYS}")
+    METRICS_COMPACT_AFTER_DAYS = METRICS_LONGEST_WINDOW_DAYS
+
+DAILY_PERIOD_SECONDS = 86400
+
+
+def rollup_metric_name(metric: str, period: int) -> str:
+    """Series key compaction rolls `metric` at `period` into (daily averages, kept apart from fetched daily data)"""
+    return f"{metric}:rollup:{period}"
+
+_SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS metric_points (
+    instance_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    period INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (instance_id, metric, period, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series_state (
+    instance_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    period INTEGER NOT NULL,
+    covered_from INTEGER NOT NULL,
+    fetched_at INTEGER NOT NULL,
+    PRIMARY KEY (instance_id, metric, period)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Per-thread connection to the store, creating the database on first use"""
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        store_dir = os.path.dirname(METRICS_STORE_PATH)
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+        conn = sqlite3.connect(METRICS_STORE_PATH, timeout=30)
+        with _schema_lock:
+            if not _schema_ready:
+                conn.executescript(_SCHEMA)
+                _schema_ready = True
+        _local.conn = conn
+    return conn
+
+
+def _chunks(items: List[str], size: int = 500) -> Iterable[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def get_series_state(instance_ids: List[str], metric: str, period: int) -> Dict[str, dict]:
+    """
+    Returns instance_id -> {"last_ts", "covered_from", "fetched_at"} (epoch seconds or None).
+    covered_from is the earliest start time already requested from CloudWatch, so a
+    longer window knows it has to backfill the head as well as the tail.
+    """
+    conn = _get_connection()
+    state = {instance_id: {"last_ts": None, "covered_from": None, "fetched_at": None} for instance_id in instance_ids}
+    for chunk in _chunks(list(instance_ids)):
+        placeholders = ",".join("?" * len(chunk))
+        for instance_id, last_ts in conn.execute(
+            f"SELECT instance_id, MAX(ts) FROM metric_points WHERE metric = ? AND period = ? "
+            f"AND instance_id IN ({placeholders}) GROUP BY instance_id",
+            [metric, period, *chunk],
+        ):
+            state[instance_id]["last_ts"] = last_ts
+        for instance_id, covered_from, fetched_at in conn.execute(
+            f"SELECT instance_id, covered_from, fetched_at FROM series_state WHERE metric = ? AND period = ? "
+            f"AND instance_id IN ({placeholders})",
+            [metric, period, *chunk],
+        ):
+            state[instance_id]["covered_from"] = covered_from
+            state[instance_id]["fetched_at"] = fetched_at
+    return state
+
+
+def store_series(metric: str, period: int, series_by_instance: Dict[str, List[Tuple[datetime, float]]],
+                 requested_from: datetime):
+    """Upsert fetched datapoints and mark each series as fetched from `requested_from` up to now"""
+    conn = _get_connection()
+    fetched_at = int(time.time())
+    requested_from_ts = int(requested_from.timestamp())
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO metric_points VALUES (?, ?, ?, ?, ?)",
+            [
+                (instance_id, metric, period, int(ts.timestamp()), value)
+                for instance_id, series in series_by_instance.items()
+                for ts, value in series
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO series_state VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (instance_id, metric, period) DO UPDATE SET "
+            "covered_from = MIN(covered_from, excluded.covered_from), fetched_at = excluded.fetched_at",
+            [(instance_id, metric, period, requested_from_ts, fetched_at) for instance_id in series_by_instance],
+        )
+    maybe_compact()
+
+
+def load_series(instance_ids: List[str], metric: str, period: int, since: datetime) -> Dict[str, List[Tuple[datetime, float]]]:
+    """Stored datapoints since `since`, ordered by timestamp, per instance"""
+    conn = _get_connection()
+    series = {instance_id: [] for instance_id in instance_ids}
+    since_ts = int(since.timestamp())
+    for chunk in _chunks(list(instance_ids)):
+        placeholders = ",".join("?" * len(chunk))
+        for instance_id, ts, value in conn.execute(
+            f"SELECT instance_id, ts, value FROM metric_points WHERE metric = ? AND period = ? AND ts >= ? "
+            f"AND instance_id IN ({placeholders}) ORDER BY instance_id, ts",
+            [metric, period, since_ts, *chunk],
+        ):
+            series[instance_id].append((datetime.fromtimestamp(ts, tz=timezone.utc), value))
+    return series
+
+
+def compact():
+    """
+    Apply retention and compaction settings:
+    drop datapoints older than METRICS_RETENTION_DAYS and, when METRICS_COMPACT_AFTER_DAYS
+    is set, roll older sub-daily datapoints up into daily averages stored under
+    rollup_metric_name(). Each delete moves the affected series' covered_from up to its
+    cutoff, so incremental fetches backfill the dropped detail when a window needs it.
+    METRICS_COMPACT_AFTER_DAYS is clamped to METRICS_LONGEST_WINDOW_DAYS, so regular
+    analysis windows never reach the compacted range.
+    """
+    conn = _get_connection()
+    now = int(time.time())
+    with conn:
+        retention_cutoff = now - METRICS_RETENTION_DAYS * 86400
+        deleted = conn.execute("DELETE FROM metric_points WHERE ts < ?", (retention_cutoff,)).rowcount
+        conn.execute(
+            "UPDATE series_state SET covered_from = ? WHERE covered_from < ?", (retention_cutoff, retention_cutoff)
+        )
+        rolled_up = 0
+        if METRICS_COMPACT_AFTER_DAYS > 0:
+            # Whole days only, so a later run never replaces a day's average with a partial one
+            cutoff = (now - METRICS_COMPACT_AFTER_DAYS * 86400) // DAILY_PERIOD_SECONDS * DAILY_PERIOD_SECONDS
+            conn.execute(
+                "INSERT OR REPLACE INTO metric_points "
+                "SELECT instance_id, metric || ':rollup:' || period, ?, (ts / ?) * ?, AVG(value) FROM metric_points "
+                "WHERE period < ? AND ts < ? GROUP BY instance_id, metric, period, ts / ?",
+                (DAILY_PERIOD_SECONDS, DAILY_PERIOD_SECONDS, DAILY_PERIOD_SECONDS,
+                 DAILY_PERIOD_SECONDS, cutoff, DAILY_PERIOD_SECONDS),
+            )
+            rolled_up = conn.execute(
+                "DELETE FROM metric_points WHERE period < ? AND ts < ?", (DAILY_PERIOD_SECONDS, cutoff)
+            ).rowcount
+            conn.execute(
+                "UPDATE series_state SET covered_from = ? WHERE period < ? AND covered_from < ?",
+                (cutoff, DAILY_PERIOD_SECONDS, cutoff),
+            )
+        conn.execute("INSERT OR REPLACE INTO store_meta VALUES ('last_compacted_at', ?)", (str(now),))
+    if deleted or rolled_up:
+        print(f"[METRICS STORE] Compacted: {deleted} expired, {rolled_up} hourly points rolled up to daily")
+
+
+def maybe_compact():
+    """Run compact() if it hasn't run within METRICS_COMPACT_INTERVAL_SECONDS"""
+    conn = _get_connection()
+    row = conn.execute("SELECT value FROM store_meta WHERE key = 'last_compacted_at'").fetchone()
+    if row is None or int(time.time()) - int(row[0]) >= METRICS_COMPACT_INTERVAL_SECONDS:
+        compact()
+
+
+def get_metrics_store_stats() -> dict:
+    """Get metrics store statistics"""
+    conn = _get_connection()
+    series_count, point_count = conn.execute(
+        "SELECT COUNT(DISTINCT instance_id || metric || period), COUNT(*) FROM metric_points"
+    ).fetchone()
+    return {
+        "path": METRICS_STORE_PATH,
+        "series": series_count,
+        "datapoints": point_count,
+        "retention_days": METRICS_RETENTION_DAYS,
+        "compact_after_days": METRICS_COMPACT_AFTER_DAYS,
+        "freshness_seconds": METRICS_FRESHNESS_SECONDS,
+    }
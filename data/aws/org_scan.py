@@ -0,0 +1,99 @@
+"""
+Multi-account organization scan for fo.ai
+Assumes a role in each member account (credentials cached and auto-refreshed by
+data.aws.settings) and runs the EC2 / S3 collectors for every account concurrently.
+Every result is tagged with its AccountId.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Union
+
+from data.aws.concurrency import StageTimer, submit_in_context
+from data.aws.ec2 import fetch_ec2_instances, fetch_ec2_instances_multi_region
+from data.aws.fleet import Fleet
+from data.aws.s3 import fetch_s3_data
+from data.aws.settings import use_account, ORG_ROLE_NAME
+
+ORG_SCAN_CONCURRENCY = int(os.getenv("ORG_SCAN_CONCURRENCY", "8"))  # (account, service) scans in flight
+ORG_ACCOUNT_IDS = [a.strip() for a in os.getenv("ORG_ACCOUNT_IDS", "").split(",") if a.strip()]
+ORG_SCAN_SERVICES = ("ec2", "s3")
+
+
+def _scan_account_service(account_id: str, role_name: str, service: str,
+                          regions: Optional[List[str]], s3_region: Optional[str]) -> Union[Fleet, List[dict]]:
+    with use_account(account_id, role_name):
+        if service == "ec2":
+            if regions and len(regions) == 1 and regions[0].lower() != "all":
+                return fetch_ec2_instances(region=regions[0])
+            return fetch_ec2_instances_multi_region(regions=regions)
+        if service == "s3":
+            return fetch_s3_data(region=s3_region)
+        raise ValueError(f"Unsupported service for org scan: {service}")
+
+
+def scan_organization(
+    account_ids: Optional[List[str]] = None,
+    role_name: Optional[str] = None,
+    services: Optional[List[str]] = None,
+    regions: Optional[List[str]] = None,
+    s3_region: Optional[str] = None,
+    max_concurrency: Optional[int] = None
+) -> Dict:
+    """
+    Scan every account in `account_ids` (ORG_ACCOUNT_IDS by default) through `role_name`.
+    EC2 covers `regions` (EC2_SCAN_REGIONS / every enabled region when omitted).
+    At most `max_concurrency` (account, service) scans run at once.
+
+    Returns:
+    {
+        "accounts": [account_id, ...],
+        "ec2": Fleet of instances carrying their account_id,
+        "s3": [bucket dicts tagged with AccountId],
+        "errors": [{"AccountId", "Service", "error"}]
+    }
+    """
+    account_ids = list(dict.fromkeys(account_ids or ORG_ACCOUNT_IDS))
+    role_name = role_name or ORG_ROLE_NAME
+    services = [s.lower() for s in (services or ORG_SCAN_SERVICES)]
+    if not account_ids:
+        raise ValueError("No account IDs given (pass account_ids or set ORG_ACCOUNT_IDS)")
+
+    print(f"\n🏢 [ORG] Scanning {len(account_ids)} accounts ({', '.join(services)}) via role {role_name}")
+    timer = StageTimer("Org scan")
+    by_task: Dict[tuple, Union[Fleet, List[dict]]] = {}
+    errors = []
+
+    with timer.stage("accounts"), ThreadPoolExecutor(
+        max_workers=max(min(max_concurrency or ORG_SCAN_CONCURRENCY, len(account_ids) * len(services)), 1),
+        thread_name_prefix="foai-account"
+    ) as executor:
+        futures = {
+            submit_in_context(executor, _scan_account_service, account_id, role_name, service, regions, s3_region):
+                (account_id, service)
+            for account_id in account_ids
+            for service in services
+        }
+        for future in as_completed(futures):
+            account_id, service = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"[ERROR] [ORG] {service} scan failed for account {account_id}: {e}")
+                errors.append({"AccountId": account_id, "Service": service, "error": str(e)})
+                results = Fleet.empty() if service == "ec2" else []
+            if not isinstance(results, Fleet):
+                for item in results:
+                    item.setdefault("AccountId", account_id)
+            by_task[(account_id, service)] = results
+            print(f"🏢 [ORG] {account_id} {service} done: {len(results)} results")
+
+    timer.report()
+    result = {"accounts": account_ids, "errors": errors}
+    for service in services:
+        per_account = [by_task[(account_id, service)] for account_id in account_ids if (account_id, service) in by_task]
+        if service == "ec2":
+            result[service] = Fleet.concat(per_account)
+        else:
+            result[service] = [item for items in per_account for item in items]
+    return result
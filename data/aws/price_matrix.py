@@ -0,0 +1,274 @@
+"""
+Vectorized EC2 price matrix for fo.ai
+Holds hourly prices as one dense NumPy array indexed by (region, instance type, OS,
+pricing model) and prices whole Fleet columns at once: monthly cost, reserved, stop and
+downsizing savings for every instance come out of a handful of array operations, so a
+fleet can be re-priced after a preference change without touching the pricing APIs.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from data.aws.concurrency import bounded_map, service_slot
+from data.aws.ec2 import (
+    get_instance_price_table,
+    RESERVED_PRICING_OPTIONS,
+    HOURS_PER_MONTH,
+    DEFAULT_CPU_THRESHOLD,
+    DOWNSIZE_MAX_PROJECTED_CPU,
+)
+from data.aws.fleet import Fleet
+from data.aws.instance_catalog import get_instance_catalog
+
+PRICING_MODELS = ("on_demand",) + tuple(RESERVED_PRICING_OPTIONS)
+
+# Savings options in the same precedence order as the per-instance enrichment (ties keep the first)
+SAVINGS_OPTIONS = ("None", "Reserved Instance", "Shutdown Instance", "Downsize Instance", "Rightsize Instance")
+# Preference keys that reprice_fleet understands (see memory/preferences.py)
+PRICING_PREFERENCE_KEYS = ("stop_cpu_threshold", "reserved_option", "max_projected_cpu")
+
+PriceKey = Tuple[str, str, str]  # (instance type, region, OS)
+
+
+class PriceMatrix:
+    """
+    Dense hourly price array prices[region, instance type, OS, pricing model] (NaN = unknown),
+    plus per-type vCPU counts and the index of the next smaller type in the same family.
+    """
+
+    __slots__ = ("regions", "instance_types", "os_types", "models", "prices", "vcpus", "smaller", "_positions")
+
+    def __init__(self, regions: Sequence[str], instance_types: Sequence[str], os_types: Sequence[str],
+                 prices: np.ndarray, vcpus: np.ndarray, smaller: np.ndarray, models: Sequence[str] = PRICING_MODELS):
+        self.regions = list(regions)
+        self.instance_types = list(instance_types)
+        self.os_types = list(os_types)
+        self.models = list(models)
+        self.prices = prices
+        self.vcpus = vcpus
+        self.smaller = smaller
+        self._positions = {
+            "region": {value: i for i, value in enumerate(self.regions)},
+            "instance_type": {value: i for i, value in enumerate(self.instance_types)},
+            "os_type": {value: i for i, value in enumerate(self.os_types)},
+            "model": {value: i for i, value in enumerate(self.models)},
+        }
+
+    def __repr__(self) -> str:
+        return (f"PriceMatrix({len(self.regions)} regions x {len(self.instance_types)} types x "
+                f"{len(self.os_types)} OS x {len(self.models)} models, "
+                f"{int(np.isfinite(self.prices).sum())} prices)")
+
+    # --- construction ---
+
+    @classmethod
+    def from_price_tables(cls, price_tables: Dict[PriceKey, Dict]) -> "PriceMatrix":
+        """Build from {(instance type, region, OS): get_instance_price_table(...)}"""
+        regions = sorted({region for _, region, _ in price_tables})
+        os_types = sorted({os_type for _, _, os_type in price_tables})
+        instance_types = sorted({instance_type for instance_type, _, _ in price_tables})
+        type_index = {value: i for i, value in enumerate(instance_types)}
+        region_index = {value: i for i, value in enumerate(regions)}
+        os_index = {value: i for i, value in enumerate(os_types)}
+
+        prices = np.full((len(regions), len(instance_types), len(os_types), len(PRICING_MODELS)), np.nan)
+        for (instance_type, region, os_type), table in price_tables.items():
+            row = [table.get("on_demand", np.nan)] + [
+                table.get("reserved", {}).get(option, np.nan) for option in RESERVED_PRICING_OPTIONS
+            ]
+            prices[region_index[region], type_index[instance_type], os_index[os_type]] = row
+        # A zero price means "unknown", not "free"
+        prices[prices <= 0] = np.nan
+
+        vcpus = np.zeros(len(instance_types))
+        smaller = np.full(len(instance_types), -1, dtype=np.int64)
+        catalogs = [get_instance_catalog(region) for region in regions]
+        for i, instance_type in enumerate(instance_types):
+            for catalog in catalogs:
+                info = catalog.get(instance_type)
+                if info is None:
+                    continue
+                vcpus[i] = info.vcpu
+                target = catalog.next_smaller(instance_type)
+                if target is not None and target.instance_type in type_index:
+                    smaller[i] = type_index[target.instance_type]
+                break
+        return cls(regions, instance_types, os_types, prices, vcpus, smaller)
+
+    @classmethod
+    def build(cls, keys: Iterable[PriceKey], include_downsize_targets: bool = True,
+              price_tables: Optional[Dict[PriceKey, Dict]] = None, workers: Optional[int] = None) -> "PriceMatrix":
+        """
+        Resolve price tables (shared pricing cache first) for every (type, region, OS) key and,
+        unless disabled, for each type's next smaller sibling, then build the matrix.
+        """
+        price_tables = dict(price_tables or {})
+        keys = set(keys)
+        if include_downsize_targets:
+            for instance_type, region, os_type in list(keys):
+                target = get_instance_catalog(region).next_smaller(instance_type)
+                if target is not None:
+                    keys.add((target.instance_type, region, os_type))
+        missing = sorted(keys - price_tables.keys())
+        if missing:
+            print(f"[PRICE MATRIX] Resolving {len(missing)} price tables")
+
+        def resolve(key):
+            with service_slot("pricing"):
+                return get_instance_price_table(*key)
+
+        for key, table in zip(missing, bounded_map(resolve, missing, workers)):
+            price_tables[key] = table
+        matrix = cls.from_price_tables(price_tables)
+        print(f"[PRICE MATRIX] {matrix}")
+        return matrix
+
+    @classmethod
+    def for_fleet(cls, fleet: Fleet, **kwargs) -> "PriceMatrix":
+        """Matrix covering every (type, region, OS) present in a fleet, plus rightsizing targets"""
+        regions, os_types = fleet.column("region"), fleet.column("os_type")
+        keys = set(zip(fleet.column("instance_type"), regions, os_types))
+        keys.update(
+            (target, region, os_type)
+            for target, region, os_type in zip(fleet.objects["recommended_type"], regions, os_types) if target
+        )
+        return cls.build(keys, **kwargs)
+
+    # --- lookups ---
+
+    def positions(self, axis: str, values: Sequence[str]) -> np.ndarray:
+        """Indexes of `values` along an axis (-1 where the matrix does not have the value)"""
+        lookup = self._positions[axis]
+        return np.fromiter((lookup.get(value, -1) for value in values), dtype=np.int64, count=len(values))
+
+    def fleet_positions(self, fleet: Fleet) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(region, type, OS) matrix indexes for every instance, mapped through the category codes"""
+        return tuple(
+            self.positions(axis, fleet.categories[axis])[fleet.codes[axis]] if fleet.size else np.zeros(0, dtype=np.int64)
+            for axis in ("region", "instance_type", "os_type")
+        )
+
+    def hourly(self, region_idx: np.ndarray, type_idx: np.ndarray, os_idx: np.ndarray,
+               model: str = "on_demand") -> np.ndarray:
+        """Hourly price per row; NaN wherever any index is unknown (-1)"""
+        model_idx = self._positions["model"][model]
+        known = (region_idx >= 0) & (type_idx >= 0) & (os_idx >= 0)
+        out = np.full(len(type_idx), np.nan)
+        out[known] = self.prices[region_idx[known], type_idx[known], os_idx[known], model_idx]
+        return out
+
+
+def compute_fleet_savings(
+    fleet: Fleet,
+    matrix: PriceMatrix,
+    stop_cpu_threshold: float = DEFAULT_CPU_THRESHOLD,
+    reserved_option: str = "1yr_no_upfront",
+    max_projected_cpu: float = DOWNSIZE_MAX_PROJECTED_CPU,
+) -> Dict[str, np.ndarray]:
+    """
+    Cost and savings arrays for every instance in one pass (same rules as the enrichment):
+    - reserved: on-demand minus `reserved_option` monthly cost
+    - stop: full monthly cost when 0 <= average CPU < stop_cpu_threshold
+    - downsize: on-demand difference to the next smaller type when CPU scaled to its
+      vCPUs stays at or below max_projected_cpu
+    - rightsize: on-demand difference to the percentile rightsizing target (recommended_type)
+
+    Returns {"hourly_cost", "monthly_cost", "reserved_savings", "stop_savings",
+             "downsize_savings", "downsize_target" (matrix type index, -1 = none), "rightsize_savings",
+             "best_savings", "best_option" (index into SAVINGS_OPTIONS)}
+    """
+    region_idx, type_idx, os_idx = matrix.fleet_positions(fleet)
+    avg_cpu = fleet.numeric["average_cpu"]
+
+    hourly = matrix.hourly(region_idx, type_idx, os_idx, "on_demand")
+    # Instances the matrix cannot price keep the cost recorded at enrichment time
+    hourly = np.where(np.isnan(hourly), fleet.numeric["hourly_cost"], hourly)
+    monthly = hourly * HOURS_PER_MONTH
+
+    reserved_monthly = matrix.hourly(region_idx, type_idx, os_idx, reserved_option) * HOURS_PER_MONTH
+    reserved_savings = np.nan_to_num(monthly - reserved_monthly, nan=0.0)
+    reserved_savings[reserved_savings <= 0] = 0.0
+
+    stop_savings = np.where((avg_cpu >= 0) & (avg_cpu < stop_cpu_threshold) & (monthly > 0), monthly, 0.0)
+
+    target_idx = np.where(type_idx >= 0, matrix.smaller[np.maximum(type_idx, 0)], -1)
+    has_target = target_idx >= 0
+    current_vcpus = np.where(type_idx >= 0, matrix.vcpus[np.maximum(type_idx, 0)], 0.0)
+    target_vcpus = np.where(has_target, matrix.vcpus[np.maximum(target_idx, 0)], 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        projected_cpu = np.where(target_vcpus > 0, avg_cpu * current_vcpus / target_vcpus, np.inf)
+    target_monthly = matrix.hourly(region_idx, target_idx, os_idx, "on_demand") * HOURS_PER_MONTH
+    downsize_savings = np.nan_to_num(monthly - target_monthly, nan=0.0)
+    downsize_ok = has_target & (avg_cpu > 0) & (projected_cpu <= max_projected_cpu) & (downsize_savings > 0)
+    downsize_savings = np.where(downsize_ok, downsize_savings, 0.0)
+
+    rightsize_idx = matrix.positions("instance_type", fleet.objects["recommended_type"])
+    rightsize_monthly = matrix.hourly(region_idx, rightsize_idx, os_idx, "on_demand") * HOURS_PER_MONTH
+    rightsize_savings = np.nan_to_num(monthly - rightsize_monthly, nan=0.0)
+    rightsize_savings[rightsize_savings <= 0] = 0.0
+
+    options = np.stack([reserved_savings, stop_savings, downsize_savings, rightsize_savings], axis=1)
+    best_savings = options.max(axis=1) if fleet.size else np.zeros(0)
+    best_option = np.where(best_savings > 0, options.argmax(axis=1) + 1, 0) if fleet.size else np.zeros(0, dtype=np.int64)
+
+    return {
+        "hourly_cost": hourly,
+        "monthly_cost": monthly,
+        "reserved_savings": reserved_savings,
+        "stop_savings": stop_savings,
+        "downsize_savings": downsize_savings,
+        "downsize_target": np.where(downsize_ok, target_idx, -1),
+        "rightsize_savings": rightsize_savings,
+        "projected_cpu": projected_cpu,
+        "best_savings": best_savings,
+        "best_option": best_option,
+    }
+
+
+def savings_reasons(fleet: Fleet, matrix: PriceMatrix, savings: Dict[str, np.ndarray],
+                    indices: Optional[Sequence[int]] = None, reserved_option: str = "1yr_no_upfront") -> List[str]:
+    """Human-readable SavingsReason strings for the given rows (all rows by default)"""
+    lease, purchase_option = RESERVED_PRICING_OPTIONS[reserved_option]
+    reserved_label = f"{lease[0]}-year {purchase_option.lower()} reserved instance"
+    rows = range(fleet.size) if indices is None else indices
+    instance_types = fleet.column("instance_type")
+    reasons = []
+    for i in rows:
+        option = SAVINGS_OPTIONS[savings["best_option"][i]]
+        amount = savings["best_savings"][i]
+        if option == "Reserved Instance":
+            reasons.append(f"Switch to {reserved_label} (saves ${amount:.2f}/month)")
+        elif option == "Shutdown Instance":
+            reasons.append(f"Stop instance (saves ${amount:.2f}/month - full compute cost)")
+        elif option == "Downsize Instance":
+            target = matrix.instance_types[savings["downsize_target"][i]]
+            reasons.append(f"Downsize from {instance_types[i]} to {target} (saves ${amount:.2f}/month), "
+                           f"projected CPU {savings['projected_cpu'][i]:.1f}%")
+        elif option == "Rightsize Instance":
+            reasons.append(f"Rightsize from {instance_types[i]} to {fleet.objects['recommended_type'][i]} "
+                           f"(saves ${amount:.2f}/month; CPU percentile {fleet.numeric['cpu_percentile'][i]:.1f}%)")
+        else:
+            reasons.append("High CPU usage - instance appears to be well-utilized")
+    return reasons
+
+
+def reprice_fleet(fleet: Fleet, matrix: Optional[PriceMatrix] = None, **preferences) -> Fleet:
+    """
+    Fleet with hourly/monthly cost, estimated savings and savings reasons recomputed from
+    the matrix (built for the fleet when not given). `preferences` are passed on to
+    compute_fleet_savings (stop_cpu_threshold, reserved_option, max_projected_cpu).
+    """
+    if not fleet:
+        return fleet
+    matrix = matrix or PriceMatrix.for_fleet(fleet)
+    savings = compute_fleet_savings(fleet, matrix, **preferences)
+    numeric = dict(fleet.numeric)
+    numeric["hourly_cost"] = savings["hourly_cost"]
+    numeric["monthly_cost"] = savings["monthly_cost"]
+    numeric["estimated_savings"] = savings["best_savings"]
+    objects = dict(fleet.objects)
+    objects["savings_reason"] = savings_reasons(
+        fleet, matrix, savings, reserved_option=preferences.get("reserved_option", "1yr_no_upfront")
+    )
+    return Fleet(fleet.size, numeric, fleet.codes, fleet.categories, objects)
@@ -0,0 +1,373 @@
+"""
+Local EC2 price catalog for fo.ai
+Builds a compact on-disk index from the AWS bulk offer file so pricing lookups
+don't need a Pricing API round trip per instance type.
+
+Download the regional offer file ahead of time, e.g.
+https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/AmazonEC2/current/us-east-1/index.csv
+and ingest it with: python foai_cli.py pricing ingest index.csv
+The JSON offer file (index.json) is several GB and is only accepted when
+ijson is installed to stream it; otherwise use the CSV file.
+"""
+
+import csv
+import gzip
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    import ijson  # optional - streams the JSON offer file instead of loading it whole
+except ImportError:
+    ijson = None
+
+PRICING_CATALOG_PATH = os.getenv("PRICING_CATALOG_PATH", ".foai/ec2_price_catalog.db")
+INGEST_BATCH_SIZE = 5000
+LEASE_HOURS = {"1yr": 8760, "3yr": 26280}
+
+# Map region codes to the "Location" names used by the offer file / Pricing API
+PRICING_REGION_NAMES = {
+    'us-east-1': 'US East (N. Virginia)',
+    'us-east-2': 'US East (Ohio)',
+    'us-west-1': 'US West (N. California)',
+    'us-west-2': 'US West (Oregon)',
+    'eu-west-1': 'Europe (Ireland)',
+    'eu-central-1': 'Europe (Frankfurt)',
+    'ap-southeast-1': 'Asia Pacific (Singapore)',
+    'ap-southeast-2': 'Asia Pacific (Sydney)',
+    'ap-northeast-1': 'Asia Pacific (Tokyo)',
+    'sa-east-1': 'South America (Sao Paulo)',
+    'ca-central-1': 'Canada (Central)',
+    'eu-west-2': 'Europe (London)',
+    'eu-west-3': 'Europe (Paris)',
+    'eu-north-1': 'Europe (Stockholm)',
+    'ap-south-1': 'Asia Pacific (Mumbai)',
+    'ap-northeast-2': 'Asia Pacific (Seoul)',
+    'ap-northeast-3': 'Asia Pacific (Osaka)',
+    'af-south-1': 'Africa (Cape Town)',
+    'me-south-1': 'Middle East (Bahrain)',
+    'me-central-1': 'Middle East (UAE)'
+}
+_REGION_BY_LOCATION = {name: code for code, name in PRICING_REGION_NAMES.items()}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ec2_prices (
+    region TEXT NOT NULL,
+    instance_type TEXT NOT NULL,
+    operating_system TEXT NOT NULL,
+    tenancy TEXT NOT NULL,
+    term_type TEXT NOT NULL,
+    purchase_option TEXT NOT NULL,
+    lease_length TEXT NOT NULL,
+    offering_class TEXT NOT NULL,
+    hourly_usd REAL NOT NULL DEFAULT 0,
+    upfront_usd REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (region, instance_type, operating_system, tenancy,
+                 term_type, purchase_option, lease_length, offering_class)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Two price dimensions (hourly + upfront fee) arrive as separate rows for the same key and
+# are merged into one. Each column keeps the higher value, so the 0.0 placeholder from the
+# other dimension's row never overwrites a real price. It also means that when the offer
+# file has several rows for one key (e.g. license or capacity variants that collapse onto
+# it), the most expensive hourly and upfront prices win. Estimates err high rather than low.
+_UPSERT = """
+INSERT INTO ec2_prices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (region, instance_type, operating_system, tenancy,
+             term_type, purchase_option, lease_length, offering_class)
+DO UPDATE SET hourly_usd = MAX(hourly_usd, excluded.hourly_usd),
+              upfront_usd = MAX(upfront_usd, excluded.upfront_usd)
+"""
+
+_local = threading.local()
+_catalog_mtime: Optional[int] = None
+
+
+def _get_connection() -> Optional[sqlite3.Connection]:
+    """Per-thread read connection to the catalog, or None if it hasn't been built"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        if not os.path.exists(PRICING_CATALOG_PATH):
+            return None
+        conn = sqlite3.connect(PRICING_CATALOG_PATH)
+        _local.conn = conn
+    return conn
+
+
+def _open_file(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def _is_priced_compute_row(attributes: Dict[str, str]) -> bool:
+    """Keep only plain shared/dedicated compute capacity without pre-installed software"""
+    if attributes.get("pre_installed_sw", "NA") not in ("NA", ""):
+        return False
+    if attributes.get("capacity_status", "Used") not in ("Used", ""):
+        return False
+    if attributes.get("license_model", "") == "Bring your own license":
+        return False
+    return bool(attributes.get("instance_type"))
+
+
+def _resolve_region(region_code: str, location: str) -> str:
+    return region_code or _REGION_BY_LOCATION.get(location, "")
+
+
+def _iter_csv_rows(path: str) -> Iterator[Tuple]:
+    """Stream price rows out of the CSV offer file"""
+    with _open_file(path) as f:
+        reader = csv.reader(f)
+        header = None
+        # The first few lines hold format/publication metadata before the real header
+        for row in reader:
+            if row and row[0] == "SKU":
+                header = {name: i for i, name in enumerate(row)}
+                break
+        if header is None:
+            raise ValueError(f"{path} does not look like an EC2 offer file (no SKU header)")
+
+        def col(row, name):
+            i = header.get(name)
+            return row[i] if i is not None and i < len(row) else ""
+
+        for row in reader:
+            if col(row, "Product Family") != "Compute Instance":
+                continue
+            if col(row, "Currency") not in ("USD", ""):
+                continue
+            term_type = col(row, "TermType")
+            if term_type not in ("OnDemand", "Reserved"):
+                continue
+            attributes = {
+                "instance_type": col(row, "Instance Type"),
+                "pre_installed_sw": col(row, "Pre Installed S/W"),
+                "capacity_status": col(row, "CapacityStatus"),
+                "license_model": col(row, "License Model"),
+            }
+            if not _is_priced_compute_row(attributes):
+                continue
+
+            price = float(col(row, "PricePerUnit") or 0)
+            unit = col(row, "Unit")
+            yield (
+                _resolve_region(col(row, "Region Code"), col(row, "Location")),
+                attributes["instance_type"],
+                col(row, "Operating System"),
+                col(row, "Tenancy"),
+                term_type,
+                col(row, "PurchaseOption"),
+                col(row, "LeaseContractLength"),
+                col(row, "OfferingClass"),
+                price if unit == "Hrs" else 0.0,
+                price if unit == "Quantity" else 0.0,
+            )
+
+
+def _iter_json_section(path: str, prefix: str) -> Iterator[Tuple[str, dict]]:
+    with (gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")) as f:
+        yield from ijson.kvitems(f, prefix)
+
+
+def _iter_json_rows(path: str) -> Iterator[Tuple]:
+    """Stream price rows out of the JSON offer file (products first, then terms)"""
+    # Only keep the handful of attributes we index on, per compute SKU
+    products = {}
+    for sku, product in _iter_json_section(path, "products"):
+        if product.get("productFamily") != "Compute Instance":
+            continue
+        attrs = product.get("attributes", {})
+        attributes = {
+            "instance_type": attrs.get("instanceType", ""),
+            "pre_installed_sw": attrs.get("preInstalledSw", "NA"),
+            "capacity_status": attrs.get("capacitystatus", "Used"),
+            "license_model": attrs.get("licenseModel", ""),
+        }
+        if not _is_priced_compute_row(attributes):
+            continue
+        products[sku] = (
+            _resolve_region(attrs.get("regionCode", ""), attrs.get("location", "")),
+            attributes["instance_type"],
+            attrs.get("operatingSystem", ""),
+            attrs.get("tenancy", ""),
+        )
+
+    for term_type in ("OnDemand", "Reserved"):
+        for sku, offers in _iter_json_section(path, f"terms.{term_type}"):
+            product_key = products.get(sku)
+            if product_key is None:
+                continue
+            for offer in offers.values():
+                term_attributes = offer.get("termAttributes", {})
+                for dimension in offer.get("priceDimensions", {}).values():
+                    price = float(dimension.get("pricePerUnit", {}).get("USD", 0) or 0)
+                    unit = dimension.get("unit", "")
+                    yield product_key + (
+                        term_type,
+                        term_attributes.get("PurchaseOption", ""),
+                        term_attributes.get("LeaseContractLength", ""),
+                        term_attributes.get("OfferingClass", ""),
+                        price if unit == "Hrs" else 0.0,
+                        price if unit == "Quantity" else 0.0,
+                    )
+
+
+def ingest_offer_file(path: str, region: Optional[str] = None) -> int:
+    """
+    Build (or refresh) the local catalog from a regional EC2 offer file (.csv/.json, optionally .gz).
+    Only rows for `region` are kept when it is given. Returns the number of rows processed.
+    """
+    is_json = path.endswith(".json") or path.endswith(".json.gz")
+    if is_json and ijson is None:
+        # Loading the multi-GB JSON offer file whole is not an option
+        raise RuntimeError(
+            "JSON offer files need ijson to stream them (pip install ijson); "
+            "download the CSV offer file (index.csv) instead"
+        )
+    print(f"[PRICING CATALOG] Ingesting {path} into {PRICING_CATALOG_PATH}...")
+    started = time.time()
+    rows = _iter_json_rows(path) if is_json else _iter_csv_rows(path)
+
+    catalog_dir = os.path.dirname(PRICING_CATALOG_PATH)
+    if catalog_dir:
+        os.makedirs(catalog_dir, exist_ok=True)
+
+    conn = sqlite3.connect(PRICING_CATALOG_PATH)
+    processed = 0
+    seen_regions = set()
+    try:
+        conn.executescript(_SCHEMA)
+        batch = []
+        for row in rows:
+            if not row[0] or (region and row[0] != region):
+                continue
+            if row[0] not in seen_regions:
+                # Replace whatever we had for this region with the fresh offer file
+                conn.execute("DELETE FROM ec2_prices WHERE region = ?", (row[0],))
+                seen_regions.add(row[0])
+            batch.append(row)
+            if len(batch) >= INGEST_BATCH_SIZE:
+                conn.executemany(_UPSERT, batch)
+                processed += len(batch)
+                batch = []
+        if batch:
+            conn.executemany(_UPSERT, batch)
+            processed += len(batch)
+
+        conn.executemany(
+            "INSERT OR REPLACE INTO catalog_meta VALUES (?, ?)",
+            [("source_file", os.path.abspath(path)),
+             ("ingested_at", str(int(time.time()))),
+             ("regions", ",".join(sorted(seen_regions | set(_meta_regions(conn)))))],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    reset_catalog_connections()
+    print(f"[PRICING CATALOG] Indexed {processed:,} price rows for {len(seen_regions)} region(s) "
+          f"in {time.time() - started:.1f}s")
+    return processed
+
+
+def _meta_regions(conn: sqlite3.Connection) -> list:
+    row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'regions'").fetchone()
+    return [r for r in (row[0].split(",") if row and row[0] else []) if r]
+
+
+def reset_catalog_connections():
+    """Drop cached lookups so the next query sees a freshly ingested catalog"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+    _cached_lookup.cache_clear()
+
+
+def _lookup(*key) -> Optional[Tuple[float, float]]:
+    global _catalog_mtime
+    # Skip the memo entirely until a catalog exists, so a later ingest is picked up
+    try:
+        mtime = os.stat(PRICING_CATALOG_PATH).st_mtime_ns
+    except OSError:
+        return None
+    if mtime != _catalog_mtime:
+        # The catalog changed on disk (e.g. `pricing ingest` in another process): memoized prices and misses are stale
+        _cached_lookup.cache_clear()
+        _catalog_mtime = mtime
+    if _get_connection() is None:
+        return None
+    return _cached_lookup(*key)
+
+
+@lru_cache(maxsize=8192)
+def _cached_lookup(region: str, instance_type: str, os_type: str, tenancy: str, term_type: str,
+                   purchase_option: str, lease_length: str, offering_class: str) -> Optional[Tuple[float, float]]:
+    conn = _get_connection()
+    try:
+        row = conn.execute(
+            "SELECT hourly_usd, upfront_usd FROM ec2_prices WHERE region = ? AND instance_type = ? "
+            "AND operating_system = ? AND tenancy = ? AND term_type = ? AND purchase_option = ? "
+            "AND lease_length = ? AND offering_class = ?",
+            (region, instance_type, os_type, tenancy, term_type, purchase_option, lease_length, offering_class),
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"[PRICING CATALOG] Lookup failed: {e}")
+        return None
+    return (row[0], row[1]) if row else None
+
+
+def get_catalog_price(instance_type: str, region: str, os_type: str = 'Linux', tenancy: str = 'Shared',
+                      term_type: str = 'OnDemand', purchase_option: str = '', lease_length: str = '',
+                      offering_class: str = '') -> Optional[Dict[str, float]]:
+    """
+    Look up a raw catalog entry. Returns {"hourly": ..., "upfront": ...} or None if not indexed.
+    """
+    price = _lookup(region, instance_type, os_type, tenancy, term_type,
+                    purchase_option, lease_length, offering_class)
+    if price is None:
+        return None
+    return {"hourly": price[0], "upfront": price[1]}
+
+
+def get_catalog_hourly_price(instance_type: str, region: str, os_type: str = 'Linux', tenancy: str = 'Shared',
+                             term_type: str = 'OnDemand', purchase_option: str = '', lease_length: str = '',
+                             offering_class: str = '') -> Optional[float]:
+    """
+    Effective hourly price from the catalog, amortising any upfront fee over the lease.
+    Returns None when the catalog has no matching entry.
+    """
+    price = _lookup(region, instance_type, os_type, tenancy, term_type,
+                    purchase_option, lease_length, offering_class)
+    if price is None:
+        return None
+    hourly, upfront = price
+    if upfront and lease_length in LEASE_HOURS:
+        hourly += upfront / LEASE_HOURS[lease_length]
+    return hourly if hourly > 0 else None
+
+
+def get_catalog_stats() -> dict:
+    """Get catalog statistics"""
+    conn = _get_connection()
+    if conn is None:
+        return {"available": False, "path": PRICING_CATALOG_PATH}
+    meta = dict(conn.execute("SELECT key, value FROM catalog_meta").fetchall())
+    counts = conn.execute("SELECT region, COUNT(*) FROM ec2_prices GROUP BY region").fetchall()
+    return {
+        "available": True,
+        "path": PRICING_CATALOG_PATH,
+        "source_file": meta.get("source_file"),
+        "ingested_at": int(meta["ingested_at"]) if meta.get("ingested_at") else None,
+        "rows_by_region": dict(counts),
+        "lookup_cache": _cached_lookup.cache_info()._asdict(),
+    }
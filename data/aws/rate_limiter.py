@@ -0,0 +1,220 @@
+"""
+Process-wide AWS API rate limiter for fo.ai collectors
+One adaptive token bucket per (service, region, API). Every pooled boto3 client is
+wired to it through botocore events, so each HTTP attempt (including retries) waits
+for a token, and throttling responses halve the bucket's rate until it recovers.
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+R = TypeVar("R")
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+
+# Steady-state requests per second per (service, region, API); bursts up to one second's worth
+SERVICE_RATE_LIMITS = {
+    "cloudwatch": float(os.getenv("CLOUDWATCH_RATE_LIMIT", "20")),
+    "pricing": float(os.getenv("PRICING_RATE_LIMIT", "5")),
+    "ec2": float(os.getenv("EC2_RATE_LIMIT", "20")),
+    "s3": float(os.getenv("S3_RATE_LIMIT", "50")),
+    "sts": float(os.getenv("STS_RATE_LIMIT", "10")),
+}
+DEFAULT_RATE_LIMIT = float(os.getenv("DEFAULT_RATE_LIMIT", "10"))
+
+# Floor the adaptive rate can drop to, as a fraction of the configured rate
+MIN_RATE_FRACTION = 0.05
+# Share of the configured rate regained per successful call after a throttle
+RECOVERY_FRACTION = 0.02
+
+# Extra application-level attempts once botocore's own retries are exhausted
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+RATE_LIMIT_BACKOFF_SECONDS = float(os.getenv("RATE_LIMIT_BACKOFF_SECONDS", "1.0"))
+
+THROTTLING_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "ProvisionedThroughputExceededException",
+    "BandwidthLimitExceeded",
+    "SlowDown",
+    "EC2ThrottledException",
+    "PriorRequestNotComplete",
+}
+
+
+class AWSThrottledError(RuntimeError):
+    """Raised when a call is still throttled after every retry; callers must not treat it as data"""
+
+
+class TokenBucket:
+    """Token bucket whose refill rate backs off on throttling and creeps back on success"""
+
+    def __init__(self, rate: float):
+        self.max_rate = max(rate, 0.1)
+        self.rate = self.max_rate
+        self.tokens = self.max_rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "queued": 0, "wait_seconds": 0.0, "throttled": 0, "retried": 0}
+
+    def _refill(self, now: float):
+        # Caller holds the lock
+        self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.stats["calls"] += 1
+                    if waited:
+                        self.stats["queued"] += 1
+                        self.stats["wait_seconds"] += waited
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def on_throttled(self):
+        with self._lock:
+            self.stats["throttled"] += 1
+            self.rate = max(self.rate / 2, self.max_rate * MIN_RATE_FRACTION)
+            self.tokens = min(self.tokens, 0.0)
+
+    def on_success(self):
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_FRACTION)
+
+    def on_retry(self):
+        with self._lock:
+            self.stats["retried"] += 1
+
+
+_buckets: Dict[Tuple[str, str, str], TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(service: str, region: str, api: str) -> TokenBucket:
+    key = (service, region or "global", api)
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(SERVICE_RATE_LIMITS.get(service, DEFAULT_RATE_LIMIT))
+            _buckets[key] = bucket
+        return bucket
+
+
+def is_throttling_error(e: Exception) -> bool:
+    """True if the exception is an AWS throttling / rate-exceeded error"""
+    response = getattr(e, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+    return False
+
+
+def raise_if_throttled(e: Exception):
+    """Re-raise a throttling error as AWSThrottledError instead of letting it become a fallback value"""
+    if isinstance(e, AWSThrottledError):
+        raise e
+    if is_throttling_error(e):
+        raise AWSThrottledError(f"Throttled by AWS: {e}") from e
+
+
+def _split_event_name(event_name: str) -> Tuple[str, str]:
+    # e.g. "request-created.cloudwatch.GetMetricData" -> ("cloudwatch", "GetMetricData")
+    parts = event_name.split(".")
+    service = parts[1] if len(parts) > 1 else "unknown"
+    api = parts[2] if len(parts) > 2 else "unknown"
+    return service, api
+
+
+def install_rate_limiter(client):
+    """Route every request attempt of a boto3 client through the shared token buckets"""
+    if not RATE_LIMIT_ENABLED:
+        return client
+    region = client.meta.region_name
+
+    def before_attempt(request=None, event_name="", **kwargs):
+        service, api = _split_event_name(event_name)
+        bucket = get_bucket(service, region, api)
+        context = getattr(request, "context", None) or {}
+        if context.get("retries", {}).get("attempt", 1) > 1:
+            bucket.on_retry()
+        bucket.acquire()
+
+    def after_attempt(response=None, event_name="", **kwargs):
+        service, api = _split_event_name(event_name)
+        bucket = get_bucket(service, region, api)
+        parsed = response[1] if response else None
+        error_code = parsed.get("Error", {}).get("Code") if isinstance(parsed, dict) else None
+        if error_code in THROTTLING_ERROR_CODES:
+            bucket.on_throttled()
+        elif response is not None:
+            bucket.on_success()
+        # Returning None leaves the retry decision to botocore's retry handler
+
+    client.meta.events.register("request-created", before_attempt, unique_id="foai-rate-limit-acquire")
+    client.meta.events.register("needs-retry", after_attempt, unique_id="foai-rate-limit-observe")
+    return client
+
+
+def call_with_backoff(fn: Callable[..., R], *args, **kwargs) -> R:
+    """
+    Call fn, retrying with exponential backoff and jitter while AWS keeps throttling.
+    Raises AWSThrottledError when it is still throttled, so a throttle never turns into a value.
+    """
+    for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not is_throttling_error(e):
+                raise
+            if attempt == RATE_LIMIT_MAX_RETRIES:
+                raise AWSThrottledError(f"Still throttled after {attempt + 1} attempts: {e}") from e
+            delay = RATE_LIMIT_BACKOFF_SECONDS * (2 ** attempt)
+            time.sleep(delay / 2 + random.uniform(0, delay / 2))
+
+
+def get_rate_limiter_stats() -> dict:
+    """Get rate limiter counters, per (service/region/API) bucket and in total"""
+    with _buckets_lock:
+        buckets = dict(_buckets)
+    per_api = {}
+    totals = {"calls": 0, "queued": 0, "wait_seconds": 0.0, "throttled": 0, "retried": 0}
+    for (service, region, api), bucket in buckets.items():
+        with bucket._lock:
+            stats = dict(bucket.stats)
+            stats["rate"] = round(bucket.rate, 2)
+            stats["max_rate"] = bucket.max_rate
+        stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+        per_api[f"{service}/{region}/{api}"] = stats
+        for counter in totals:
+            totals[counter] += stats[counter]
+    totals["wait_seconds"] = round(totals["wait_seconds"], 3)
+    return {"enabled": RATE_LIMIT_ENABLED, "totals": totals, "apis": per_api}
+
+
+def print_rate_limiter_stats():
+    """Print rate limiter counters"""
+    stats = get_rate_limiter_stats()
+    totals = stats["totals"]
+    print(f"[RATE LIMIT] calls={totals['calls']} queued={totals['queued']} "
+          f"throttled={totals['throttled']} retried={totals['retried']} waited={totals['wait_seconds']:.2f}s")
+    for key, api_stats in stats["apis"].items():
+        if api_stats["throttled"] or api_stats["queued"]:
+            print(f"   {key}: rate={api_stats['rate']}/{api_stats['max_rate']} req/s, "
+                  f"queued={api_stats['queued']}, throttled={api_stats['throttled']}, retried={api_stats['retried']}")
@@ -0,0 +1,195 @@
+"""
+Percentile-based EC2 rightsizing for fo.ai
+Loads a page of hourly CPU (and CloudWatch agent memory, where published) series into a
+2-D NumPy matrix, computes p50/p95/p99/max per instance in one vectorized pass, and picks
+the cheapest catalog type whose capacity covers the target percentile plus headroom.
+"""
+
+import os
+import warnings
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from data.aws.instance_catalog import get_instance_catalog, family_category
+
+RIGHTSIZING_ENABLED = os.getenv("RIGHTSIZING_ENABLED", "True").lower() == "true"
+# Utilization percentile the target type must cover (100 = observed max)
+RIGHTSIZING_PERCENTILE = float(os.getenv("RIGHTSIZING_PERCENTILE", "95"))
+# Spare capacity kept on top of the percentile, as a fraction (0.25 = 25% headroom)
+RIGHTSIZING_HEADROOM = float(os.getenv("RIGHTSIZING_HEADROOM", "0.25"))
+# Hourly datapoints an instance needs before it is rightsized at all
+RIGHTSIZING_MIN_HOURS = int(os.getenv("RIGHTSIZING_MIN_HOURS", "72"))
+RIGHTSIZING_USE_MEMORY = os.getenv("RIGHTSIZING_USE_MEMORY", "True").lower() == "true"
+# Comma-separated candidate families; empty = current-generation families in the same category
+RIGHTSIZING_FAMILIES = [f.strip() for f in os.getenv("RIGHTSIZING_FAMILIES", "").split(",") if f.strip()]
+
+HOURS_PER_MONTH = 730
+HOUR_SECONDS = 3600
+STAT_PERCENTILES = (50, 95, 99)
+
+Series = List[Tuple[datetime, float]]
+
+
+def utilization_matrix(series_by_instance: Dict[str, Series], instance_ids: Sequence[str],
+                       start: datetime, hours: int) -> np.ndarray:
+    """
+    Hourly series -> float array [instance, hour since `start`], NaN where there is no datapoint.
+    Points outside the window are dropped.
+    """
+    matrix = np.full((len(instance_ids), hours), np.nan)
+    start_ts = start.timestamp()
+    for row, instance_id in enumerate(instance_ids):
+        series = series_by_instance.get(instance_id)
+        if not series:
+            continue
+        stamps = np.fromiter((ts.timestamp() for ts, _ in series), dtype=np.float64, count=len(series))
+        values = np.fromiter((value for _, value in series), dtype=np.float64, count=len(series))
+        columns = ((stamps - start_ts) // HOUR_SECONDS).astype(np.int64)
+        inside = (columns >= 0) & (columns < hours)
+        matrix[row, columns[inside]] = values[inside]
+    return matrix
+
+
+def utilization_percentiles(matrix: np.ndarray, target_percentile: float = RIGHTSIZING_PERCENTILE) -> Dict[str, np.ndarray]:
+    """
+    Per-row statistics over the hour axis, ignoring gaps:
+    {"p50", "p95", "p99", "max", "target", "hours"} (NaN for rows without data)
+    """
+    hours = np.isfinite(matrix).sum(axis=1)
+    if not matrix.size:
+        empty = np.full(len(matrix), np.nan)
+        return {"p50": empty, "p95": empty, "p99": empty, "max": empty, "target": empty, "hours": hours}
+    quantiles = sorted(set(STAT_PERCENTILES) | {min(max(target_percentile, 0.0), 100.0)})
+    with warnings.catch_warnings():
+        # All-NaN rows (no datapoints) are expected and stay NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        values = np.nanpercentile(matrix, quantiles, axis=1)
+        peak = np.nanmax(matrix, axis=1)
+    stats = {f"p{q:g}": values[i] for i, q in enumerate(quantiles)}
+    return {
+        "p50": stats["p50"],
+        "p95": stats["p95"],
+        "p99": stats["p99"],
+        "max": peak,
+        "target": stats[f"p{min(max(target_percentile, 0.0), 100.0):g}"],
+        "hours": hours,
+    }
+
+
+def _candidate_families(catalog, info) -> Optional[List[str]]:
+    """Families a type may move to: RIGHTSIZING_FAMILIES, else same category, architecture and generation"""
+    if RIGHTSIZING_FAMILIES:
+        return RIGHTSIZING_FAMILIES
+    category = family_category(info.family)[0]
+    architectures = set(info.architectures)
+    return [
+        family for family, members in catalog.families.items()
+        if family_category(family)[0] == category
+        and members[0].current_generation
+        and architectures & set(members[0].architectures)
+    ]
+
+
+def _target_architecture(info) -> Optional[str]:
+    """Architecture targets must run, preferring 64-bit (t2 lists i386 first, which current families lack)"""
+    for architecture in ("x86_64", "arm64"):
+        if architecture in info.architectures:
+            return architecture
+    return info.architectures[0] if info.architectures else None
+
+
+def plan_rightsizing(
+    instance_ids: Sequence[str],
+    instance_types: Sequence[str],
+    os_types: Sequence[str],
+    region: str,
+    cpu_series: Dict[str, Series],
+    price_fn: Callable[[str, str, str], float],
+    memory_series: Optional[Dict[str, Series]] = None,
+    days: int = 7,
+    percentile: float = RIGHTSIZING_PERCENTILE,
+    headroom: float = RIGHTSIZING_HEADROOM,
+    min_hours: int = RIGHTSIZING_MIN_HOURS,
+) -> Dict[str, dict]:
+    """
+    Cheapest type per instance that covers its `percentile` CPU (and memory, when the agent
+    publishes it) with `headroom` to spare. price_fn(instance_type, region, os) -> hourly.
+    Without memory data the target keeps the current memory-per-vCPU ratio.
+
+    Returns {instance_id: {"TargetInstanceType", "CurrentHourly", "TargetHourly", "MonthlySavings",
+             "CPU": {"p50", "p95", "p99", "max"}, "MemoryPercentile", "RequiredVCpu",
+             "RequiredMemoryGiB", "Percentile", "Headroom"}} for instances worth moving.
+    """
+    if not RIGHTSIZING_ENABLED or not instance_ids:
+        return {}
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    hours = days * 24
+    start = now - timedelta(hours=hours)
+
+    cpu = utilization_percentiles(utilization_matrix(cpu_series, instance_ids, start, hours), percentile)
+    if memory_series:
+        memory = utilization_percentiles(utilization_matrix(memory_series, instance_ids, start, hours), percentile)
+        memory_target = np.where(memory["hours"] >= min_hours, memory["target"], np.nan)
+    else:
+        memory_target = np.full(len(instance_ids), np.nan)
+
+    catalog = get_instance_catalog(region)
+    current = [catalog.get(instance_type) for instance_type in instance_types]
+    vcpus = np.array([info.vcpu if info else 0 for info in current], dtype=np.float64)
+    memory_gib = np.array([info.memory_gib if info else 0 for info in current], dtype=np.float64)
+
+    # Capacity needed at the target percentile, plus headroom (vectorized over the page)
+    scale = 1.0 + headroom
+    required_vcpu = vcpus * np.nan_to_num(cpu["target"]) / 100 * scale
+    with np.errstate(divide="ignore", invalid="ignore"):
+        proportional_memory = np.where(vcpus > 0, memory_gib * required_vcpu / vcpus, 0.0)
+    required_memory = np.where(np.isfinite(memory_target), memory_gib * memory_target / 100 * scale, proportional_memory)
+    eligible = (cpu["hours"] >= min_hours) & (vcpus > 0)
+
+    plans = {}
+    cheapest_cache: Dict[tuple, Optional[tuple]] = {}
+    families_cache: Dict[str, Optional[List[str]]] = {}
+    for row in np.flatnonzero(eligible):
+        info = current[row]
+        os_type = os_types[row]
+        families = families_cache.get(info.family)
+        if families is None:
+            families = families_cache[info.family] = _candidate_families(catalog, info)
+        key = (round(float(required_vcpu[row]), 2), round(float(required_memory[row]), 2),
+               info.family, info.architectures, info.burstable, os_type)
+        if key not in cheapest_cache:
+            cheapest_cache[key] = catalog.cheapest_covering(
+                required_vcpu[row], required_memory[row],
+                price_fn=lambda instance_type: price_fn(instance_type, region, os_type),
+                families=families,
+                architecture=_target_architecture(info),
+                include_burstable=info.burstable,
+            )
+        best = cheapest_cache[key]
+        if best is None or best[0].instance_type == info.instance_type:
+            continue
+        target, target_hourly = best
+        current_hourly = price_fn(info.instance_type, region, os_type)
+        savings = (current_hourly - target_hourly) * HOURS_PER_MONTH
+        if savings <= 0:
+            continue
+        instance_id = instance_ids[row]
+        plans[instance_id] = {
+            "TargetInstanceType": target.instance_type,
+            "CurrentHourly": current_hourly,
+            "TargetHourly": target_hourly,
+            "MonthlySavings": savings,
+            "CPU": {name: round(float(cpu[name][row]), 2) for name in ("p50", "p95", "p99", "max")},
+            "CPUPercentile": round(float(cpu["target"][row]), 2),
+            "MemoryPercentile": round(float(memory_target[row]), 2) if np.isfinite(memory_target[row]) else None,
+            "RequiredVCpu": round(float(required_vcpu[row]), 2),
+            "RequiredMemoryGiB": round(float(required_memory[row]), 2),
+            "Percentile": percentile,
+            "Headroom": headroom,
+        }
+
+    print(f"[RIGHTSIZING] p{percentile:g} + {headroom:.0%} headroom: {int(eligible.sum())}/{len(instance_ids)} instances "
+          f"with enough history, {len(plans)} with a cheaper fit")
+    return plans
@@ -1,52 +1,110 @@
-import boto3
-from typing import List, Dict, Optional
-from data.aws.settings import get_boto3_client
+from typing import Iterator, List, Dict, Optional, Sequence, Tuple
+from botocore.exceptions import ParamValidationError
+from data.aws.settings import get_boto3_client, get_active_account_id
+from data.aws.rate_limiter import AWSThrottledError, call_with_backoff, raise_if_throttled
 from data.aws.cloudwatch import get_cpu_metrics
+from data.aws.concurrency import bounded_map, service_slot, submit_in_context, StageTimer
+from data.aws import bucket_regions
+from data.aws.s3_stats import ObjectStatsAccumulator
+from data.aws.s3_inventory import load_inventory_stats, S3_INVENTORY_DIR
 import json
+import os
 from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta, timezone
 
 TARGET_REGION = "us-east-1"             
 TARGET_BUCKET_NAMES = [] 
 
-IST = timezone(timedelta(hours=5, minutes=30))
-
-def format_datetime_utc530(dt: datetime) -> str:
-    dt_ist = dt.astimezone(IST)
-    return dt_ist.strftime('%B %-d, %Y, %H:%M:%S (UTC+05:30)')
-
-def get_boto3_client(service_name: str, region: Optional[str] = None):
-    return boto3.client(service_name, region_name=region)
+# Buckets analyzed concurrently (each also fans its metadata calls out in parallel)
+S3_BUCKET_WORKERS = int(os.getenv("S3_BUCKET_WORKERS", "8"))
+# Buckets per ListBuckets page
+S3_LIST_BUCKETS_PAGE_SIZE = int(os.getenv("S3_LIST_BUCKETS_PAGE_SIZE", "1000"))
+# Object listing without an inventory: prefix partitions listed concurrently
+S3_PARTITIONED_LISTING = os.getenv("S3_PARTITIONED_LISTING", "True").lower() == "true"
+S3_LIST_WORKERS = int(os.getenv("S3_LIST_WORKERS", "8"))
+# '/' levels a hot prefix (more than one page of keys) may be split into
+S3_LIST_MAX_SPLIT_DEPTH = int(os.getenv("S3_LIST_MAX_SPLIT_DEPTH", "3"))
+# Error codes S3 returns when a request went to the wrong region
+REGION_MISMATCH_ERROR_CODES = {"PermanentRedirect", "301", "AuthorizationHeaderMalformed", "IllegalLocationConstraintException"}
+# Cleared once the installed botocore rejects ListBuckets parameters (its S3 model predates
+# MaxBuckets / ContinuationToken / BucketRegion, e.g. the pinned 1.34.0)
+_list_buckets_paginated = True
+
+def iter_bucket_pages(page_size: int = S3_LIST_BUCKETS_PAGE_SIZE,
+                      continuation_token: Optional[str] = None,
+                      bucket_region: Optional[str] = None) -> Iterator[Tuple[List[Dict], Optional[str]]]:
+    """
+    Yields (buckets, next continuation token) one ListBuckets page at a time, starting at
+    `continuation_token`. The token is None on the last page.
+    bucket_region asks S3 to list only that region's buckets; each bucket carries its
+    BucketRegion where S3 returns it.
+    With a botocore whose ListBuckets takes no parameters, every bucket comes back as a
+    single page without BucketRegion; callers still resolve and filter regions themselves.
+    """
+    global _list_buckets_paginated
+    s3 = get_boto3_client('s3')
+    while True:
+        if not _list_buckets_paginated:
+            with service_slot("s3"):
+                response = call_with_backoff(s3.list_buckets)
+            yield response.get('Buckets', []), None
+            return
+        request = {"MaxBuckets": page_size}
+        if continuation_token:
+            request["ContinuationToken"] = continuation_token
+        if bucket_region:
+            request["BucketRegion"] = bucket_region
+        try:
+            with service_slot("s3"):
+                response = call_with_backoff(s3.list_buckets, **request)
+        except ParamValidationError as e:
+            print(f"⚠️  [S3] ListBuckets pagination not supported by this botocore, listing all buckets at once: {e}")
+            _list_buckets_paginated = False
+            continue
+        continuation_token = response.get('ContinuationToken')
+        yield response.get('Buckets', []), continuation_token
+        if not continuation_token:
+            return
 
 def get_all_buckets() -> List[Dict]:
     print(f"📋 [S3] Looking for your S3 buckets...")
-    s3 = get_boto3_client('s3')
-    response = s3.list_buckets()
-    buckets = response.get('Buckets', [])
+    buckets = [bucket for page, _ in iter_bucket_pages() for bucket in page]
     print(f"📊 [S3] Found {len(buckets)} buckets")
     return buckets
 
+def _normalize_bucket_region(location: Optional[str]) -> str:
+    """LocationConstraint -> region code (None means us-east-1, legacy 'EU' means eu-west-1)"""
+    if not location:
+        return 'us-east-1'
+    return 'eu-west-1' if location == 'EU' else location
+
+def get_bucket_client(region: Optional[str] = None):
+    """S3 client in the bucket's own region, so requests aren't redirected"""
+    return get_boto3_client('s3', region=region if region and region != 'unknown' else None)
+
 def get_bucket_location(bucket_name: str) -> str:
     try:
         s3 = get_boto3_client('s3')
-        location = s3.get_bucket_location(Bucket=bucket_name).get('LocationConstraint')
-        return location or 'us-east-1'
+        with service_slot("s3"):
+            location = s3.get_bucket_location(Bucket=bucket_name).get('LocationConstraint')
+        return _normalize_bucket_region(location)
     except Exception as e:
+        raise_if_throttled(e)
         print(f"⚠️  [S3] Couldn't get location for {bucket_name}: {e}")
         return 'unknown'
 
-def get_bucket_basic_info(bucket_name: str) -> Dict:
-    print(f"   📋 [S3] Checking bucket: {bucket_name}")
-    s3 = get_boto3_client('s3')
-    location = get_bucket_location(bucket_name)
-    
+def _get_bucket_versioning(s3, bucket_name: str) -> Dict:
     try:
         versioning = s3.get_bucket_versioning(Bucket=bucket_name).get('Status', 'Disabled')
         print(f"      🔄 Versioning: {versioning}")
     except Exception as e:
+        raise_if_throttled(e)
         print(f"      ⚠️  Error getting versioning: {e}")
         versioning = 'Disabled'
+    return {"Versioning": versioning}
 
+def _get_bucket_logging(s3, bucket_name: str) -> Dict:
     try:
         logging = s3.get_bucket_logging(Bucket=bucket_name).get('LoggingEnabled', {})
         logging_enabled = bool(logging)
@@ -55,46 +113,101 @@ def get_bucket_basic_info(bucket_name: str) -> Dict:
         if logging_target:
             print(f"      📝 Logging target: {logging_target}")
     except Exception as e:
+        raise_if_throttled(e)
         print(f"      ⚠️  Error getting logging: {e}")
         logging_enabled = False
         logging_target = None
+    return {"LoggingEnabled": logging_enabled, "LoggingTarget": logging_target}
 
-    # Get bucket encryption
+def _get_bucket_encryption(s3, bucket_name: str) -> Dict:
     try:
         encryption = s3.get_bucket_encryption(Bucket=bucket_name)
         encryption_enabled = True
         encryption_type = encryption.get('ServerSideEncryptionConfiguration', {}).get('Rules', [{}])[0].get('ApplyServerSideEncryptionByDefault', {}).get('SSEAlgorithm', 'unknown')
         print(f"      🔐 Encryption: {encryption_type}")
     except Exception as e:
+        raise_if_throttled(e)
         encryption_enabled = False
         encryption_type = 'None'
         print(f"      🔐 Encryption: Not configured")
+    return {"EncryptionEnabled": encryption_enabled, "EncryptionType": encryption_type}
 
-    # Get bucket tags
+def _get_bucket_tags(s3, bucket_name: str) -> Dict:
     try:
         tags_response = s3.get_bucket_tagging(Bucket=bucket_name)
         tags = tags_response.get('TagSet', [])
         print(f"      🏷️  Tags: {len(tags)} tags found")
     except Exception as e:
+        raise_if_throttled(e)
         tags = []
         print(f"      🏷️  Tags: No tags found")
+    return {"Tags": tags}
+
+BUCKET_METADATA_FETCHERS = (_get_bucket_versioning, _get_bucket_logging, _get_bucket_encryption, _get_bucket_tags)
+
+def _call_in_slot(fetch, *args):
+    with service_slot("s3"):
+        return fetch(*args)
+
+def resolve_bucket_regions(buckets: List[Dict], account_id: Optional[str] = None,
+                           workers: Optional[int] = None) -> Dict[str, str]:
+    """
+    bucket_name -> region for listed buckets, cheapest source first: the BucketRegion in the
+    listing, the persisted bucket region map, then GetBucketLocation (concurrently).
+    Newly learned regions are saved to the map. Unresolvable buckets map to 'unknown'.
+    """
+    account_id = account_id if account_id is not None else get_active_account_id()
+    listed = {b['Name']: _normalize_bucket_region(b['BucketRegion']) for b in buckets if b.get('BucketRegion')}
+    regions = dict(listed)
+    missing = [b['Name'] for b in buckets if b['Name'] not in regions]
+
+    stored = {}
+    if missing and bucket_regions.BUCKET_REGION_STORE_ENABLED:
+        try:
+            stored = bucket_regions.load_bucket_regions(account_id, missing)
+        except Exception as e:
+            print(f"[S3] Bucket region store unavailable, looking regions up: {e}")
+        regions.update(stored)
+        missing = [name for name in missing if name not in stored]
+
+    looked_up = dict(zip(missing, bounded_map(get_bucket_location, missing, workers or S3_BUCKET_WORKERS)))
+    regions.update(looked_up)
+
+    if bucket_regions.BUCKET_REGION_STORE_ENABLED:
+        try:
+            learned = {name: region for name, region in {**listed, **looked_up}.items() if region != 'unknown'}
+            bucket_regions.save_bucket_regions(account_id, learned)
+        except Exception as e:
+            print(f"[S3] Could not save bucket regions: {e}")
+    print(f"🗺️  [S3] Bucket regions: {len(listed)} from listing, {len(stored)} from the map, {len(looked_up)} looked up")
+    return regions
+
+def get_bucket_basic_info(bucket_name: str, location: Optional[str] = None) -> Dict:
+    """
+    Versioning, logging, encryption and tags, fetched concurrently from a client in the
+    bucket's region (looked up first unless `location` is given).
+    """
+    print(f"   📋 [S3] Checking bucket: {bucket_name}")
+    location = location or get_bucket_location(bucket_name)
+    s3 = get_bucket_client(location)
+
+    metadata = {}
+    for part in bounded_map(lambda fetch: _call_in_slot(fetch, s3, bucket_name),
+                            BUCKET_METADATA_FETCHERS, workers=len(BUCKET_METADATA_FETCHERS)):
+        metadata.update(part)
 
     return {
         "BucketName": bucket_name,
         "Region": location,
-        "Versioning": versioning,
-        "LoggingEnabled": logging_enabled,
-        "LoggingTarget": logging_target,
-        "EncryptionEnabled": encryption_enabled,
-        "EncryptionType": encryption_type,
-        "Tags": tags
+        **metadata
     }
 
-def get_bucket_lifecycle_config(bucket_name: str) -> List[Dict]:
+def get_bucket_lifecycle_config(bucket_name: str, region: Optional[str] = None) -> List[Dict]:
     print(f"   🔄 [S3] Looking for lifecycle policies in: {bucket_name}")
-    s3 = get_boto3_client('s3')
+    s3 = get_bucket_client(region)
     try:
-        response = s3.get_bucket_lifecycle_configuration(Bucket=bucket_name)
+        with service_slot("s3"):
+            response = s3.get_bucket_lifecycle_configuration(Bucket=bucket_name)
         rules = response.get('Rules', [])
         print(f"      📋 Found {len(rules)} lifecycle rules")
         for i, rule in enumerate(rules):
@@ -110,58 +223,127 @@ def get_bucket_lifecycle_config(bucket_name: str) -> List[Dict]:
             print(f"      ❌ Error getting lifecycle: {e}")
             raise
 
-def get_object_stats(bucket_name: str, prefix: Optional[str] = None) -> Dict:
-    print(f"   📊 [S3 ANALYSIS] Analyzing objects in bucket: {bucket_name}")
-    s3 = get_boto3_client('s3')
+def list_object_stats(bucket_name: str, prefix: Optional[str] = None, region: Optional[str] = None) -> ObjectStatsAccumulator:
+    """Aggregate a bucket listing (list_objects_v2, one vectorized chunk per page)"""
+    s3 = get_bucket_client(region)
     paginator = s3.get_paginator('list_objects_v2')
+    stats = ObjectStatsAccumulator()
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix or ''):
+        stats.add_objects(page.get('Contents', []))
+    return stats
+
+def _list_objects_page(s3, bucket_name: str, prefix: str, delimiter: Optional[str] = None,
+                       continuation_token: Optional[str] = None) -> Dict:
+    request = {"Bucket": bucket_name, "Prefix": prefix}
+    if delimiter:
+        request["Delimiter"] = delimiter
+    if continuation_token:
+        request["ContinuationToken"] = continuation_token
+    with service_slot("s3"):
+        return call_with_backoff(s3.list_objects_v2, **request)
+
+def _next_token(page: Dict) -> Optional[str]:
+    return page.get('NextContinuationToken') if page.get('IsTruncated') else None
+
+def _list_partition(s3, bucket_name: str, prefix: str, splittable: bool) -> Tuple[ObjectStatsAccumulator, List[str]]:
+    """
+    List one prefix partition. Returns (its aggregate, sub-prefixes still to list).
+    A partition whose first page holds all its keys is done in one request. A hot one is
+    split one '/' level down when `splittable`: its direct objects are aggregated here and
+    its sub-prefixes become new partitions. Otherwise it is paginated to the end.
+    """
+    stats = ObjectStatsAccumulator()
+    page = _list_objects_page(s3, bucket_name, prefix)
+    token = _next_token(page)
+    if token and splittable:
+        # The flat first page overlaps the sub-prefixes, so it is dropped and the level re-listed
+        stats, sub_prefixes = ObjectStatsAccumulator(), []
+        token = None
+        while True:
+            page = _list_objects_page(s3, bucket_name, prefix, delimiter='/', continuation_token=token)
+            stats.add_objects(page.get('Contents', []))
+            sub_prefixes.extend(common['Prefix'] for common in page.get('CommonPrefixes', []))
+            token = _next_token(page)
+            if not token:
+                return stats, sub_prefixes
+
+    stats.add_objects(page.get('Contents', []))
+    while token:
+        page = _list_objects_page(s3, bucket_name, prefix, continuation_token=token)
+        stats.add_objects(page.get('Contents', []))
+        token = _next_token(page)
+    return stats, []
+
+def list_object_stats_partitioned(bucket_name: str, prefix: Optional[str] = None, region: Optional[str] = None,
+                                  workers: Optional[int] = None,
+                                  max_split_depth: Optional[int] = None) -> ObjectStatsAccumulator:
+    """
+    Aggregate a bucket listing split into '/' prefix partitions that are listed concurrently
+    on a bounded pool. Only hot prefixes are split (up to max_split_depth levels below
+    `prefix`), so small buckets and prefixes still cost one request. Partition aggregates
+    merge into the same totals as list_object_stats.
+    """
+    s3 = get_bucket_client(region)
+    workers = workers or S3_LIST_WORKERS
+    max_split_depth = S3_LIST_MAX_SPLIT_DEPTH if max_split_depth is None else max_split_depth
+    stats = ObjectStatsAccumulator()
+    partitions = 0
+
+    pending = {}  # future -> depth below `prefix`
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="foai-s3-list") as executor:
+        def submit(partition_prefix: str, depth: int):
+            future = submit_in_context(executor, _list_partition, s3, bucket_name, partition_prefix, depth < max_split_depth)
+            pending[future] = depth
+
+        submit(prefix or '', 0)
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    depth = pending.pop(future)
+                    partial, sub_prefixes = future.result()
+                    stats.merge(partial)
+                    partitions += 1
+                    for sub_prefix in sub_prefixes:
+                        submit(sub_prefix, depth + 1)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
 
-    page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix or '')
-
-    object_count = 0
-    total_size = 0
-    last_modified_map = defaultdict(lambda: datetime.min.replace(tzinfo=timezone.utc))
-    size_by_storage_class = defaultdict(int)
-    objects_by_storage_class = defaultdict(int)
-
-    print(f"      📊 Scanning objects...")
-    for page in page_iterator:
-        for obj in page.get('Contents', []):
-            object_count += 1
-            key = obj['Key']
-            size = obj.get('Size', 0)
-            storage_class = obj.get('StorageClass', 'STANDARD')
-            last_modified = obj['LastModified']
-
-            total_size += size
-            size_by_storage_class[storage_class] += size
-            objects_by_storage_class[storage_class] += 1
-
-            group_key = key.split('/')[0] if '/' in key else key
-
-            if last_modified > last_modified_map[group_key]:
-                last_modified_map[group_key] = last_modified
+    print(f"      📊 Listed {partitions} prefix partitions ({workers} workers)")
+    return stats
 
-    print(f"      📊 Total objects: {object_count:,}")
-    print(f"      📊 Total size: {total_size / (1024**3):.2f} GB")
+def print_object_stats(object_stats: Dict):
+    print(f"      📊 Total objects: {object_stats['TotalObjects']:,}")
+    print(f"      📊 Total size: {object_stats['TotalSizeGB']:.2f} GB")
     print(f"      📊 Storage class breakdown:")
-    for storage_class, count in objects_by_storage_class.items():
-        size_gb = size_by_storage_class[storage_class] / (1024**3)
+    for storage_class, count in object_stats['ObjectsByStorageClass'].items():
+        size_gb = object_stats['SizeByStorageClass'][storage_class] / (1024**3)
         print(f"         {storage_class}: {count:,} objects, {size_gb:.2f} GB")
     
-    print(f"      📅 Last modified dates by group:")
-    for group, last_modified in last_modified_map.items():
-        print(f"         {group}: {format_datetime_utc530(last_modified)}")
+    print(f"      📅 Most recently modified prefixes (of ~{object_stats.get('EstimatedPrefixCount', 0):,}):")
+    for group, last_modified in object_stats['LastModifiedByGroup'].items():
+        print(f"         {group}: {last_modified}")
 
-    return {
-        "TotalObjects": object_count,
-        "TotalSizeBytes": total_size,
-        "TotalSizeGB": total_size / (1024**3),
-        "SizeByStorageClass": dict(size_by_storage_class),
-        "ObjectsByStorageClass": dict(objects_by_storage_class),
-        "LastModifiedByGroup": {
-            k: format_datetime_utc530(v) for k, v in last_modified_map.items()
-        }
-    }
+def get_object_stats(bucket_name: str, prefix: Optional[str] = None, region: Optional[str] = None,
+                     age_edges: Optional[Sequence[int]] = None) -> Dict:
+    """
+    ObjectStatistics for a bucket: from its latest S3 Inventory report when one is available
+    under S3_INVENTORY_DIR, otherwise from a full listing (prefix-partitioned and concurrent
+    unless S3_PARTITIONED_LISTING is off). "Source" says which.
+    `age_edges` (e.g. lifecycle transition days) get exact AgeHistogram totals.
+    """
+    print(f"   📊 [S3 ANALYSIS] Analyzing objects in bucket: {bucket_name}")
+
+    object_stats = load_inventory_stats(bucket_name, prefix, age_edges=age_edges) if S3_INVENTORY_DIR else None
+    if object_stats is None:
+        print(f"      📊 Scanning objects...")
+        lister = list_object_stats_partitioned if S3_PARTITIONED_LISTING else list_object_stats
+        object_stats = lister(bucket_name, prefix, region).to_stats(source="listing", age_edges=age_edges)
+
+    print_object_stats(object_stats)
+    return object_stats
 
 def calculate_storage_cost(bucket_data: Dict) -> Dict:
     """Calculate estimated storage costs for different storage classes"""
@@ -211,16 +393,22 @@ def calculate_storage_cost(bucket_data: Dict) -> Dict:
         "PotentialSavings": potential_savings
     }
 
-def fetch_s3_bucket_details(bucket_name: str, region: Optional[str] = None) -> Dict:
+def fetch_s3_bucket_details(bucket_name: str, region: Optional[str] = None, bucket_region: Optional[str] = None,
+                            age_edges: Optional[Sequence[int]] = None) -> Dict:
+    """
+    Full analysis of one bucket. The bucket's region (bucket_region, else the bucket region
+    map) is checked against the target region before any per-bucket call is made.
+    """
     print(f"\n🪣 [S3 ANALYSIS] Analyzing bucket: {bucket_name}")
     
-    basic_info = get_bucket_basic_info(bucket_name)
-    if region and basic_info['Region'] != region:
-        print(f"   ⚠️  [S3 ANALYSIS] Bucket region {basic_info['Region']} doesn't match target {region}")
+    bucket_region = bucket_region or resolve_bucket_regions([{"Name": bucket_name}])[bucket_name]
+    if region and bucket_region != region:
+        print(f"   ⚠️  [S3 ANALYSIS] Bucket region {bucket_region} doesn't match target {region}")
         return {} 
 
-    lifecycle = get_bucket_lifecycle_config(bucket_name)
-    object_stats = get_object_stats(bucket_name)
+    basic_info = get_bucket_basic_info(bucket_name, location=bucket_region)
+    lifecycle = get_bucket_lifecycle_config(bucket_name, region=bucket_region)
+    object_stats = get_object_stats(bucket_name, region=bucket_region, age_edges=age_edges)
     cost_analysis = calculate_storage_cost({"ObjectStatistics": object_stats})
 
     bucket_data = {
@@ -233,15 +421,86 @@ def fetch_s3_bucket_details(bucket_name: str, region: Optional[str] = None) -> D
     print(f"   ✅ [S3 ANALYSIS] Bucket {bucket_name} analysis complete")
     return bucket_data
 
+def _is_region_mismatch(error: Exception) -> bool:
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") in REGION_MISMATCH_ERROR_CODES
+
+def _analyze_bucket(bucket_name: str, region: Optional[str], account_id: str,
+                    bucket_region: Optional[str] = None, age_edges: Optional[Sequence[int]] = None) -> Optional[Dict]:
+    """
+    One bucket's details tagged with its account; an error entry instead of raising.
+    A wrong-region error drops the bucket's mapped region and retries once with a fresh lookup.
+    """
+    try:
+        try:
+            details = fetch_s3_bucket_details(bucket_name, region=region, bucket_region=bucket_region, age_edges=age_edges)
+        except Exception as e:
+            if not _is_region_mismatch(e):
+                raise
+            print(f"   🗺️  [S3 ANALYSIS] {bucket_name} is not in {bucket_region}, looking its region up again")
+            if bucket_regions.BUCKET_REGION_STORE_ENABLED:
+                bucket_regions.forget_bucket_regions(account_id, [bucket_name])
+            details = fetch_s3_bucket_details(bucket_name, region=region, age_edges=age_edges)
+        if not details:
+            return None
+        details["BucketName"] = bucket_name
+        details["AccountId"] = account_id
+        return details
+    except AWSThrottledError:
+        raise
+    except Exception as e:
+        print(f"   ❌ [S3 ANALYSIS] Error analyzing bucket {bucket_name}: {e}")
+        return {
+            "BucketName": bucket_name,
+            "AccountId": account_id,
+            "error": str(e)
+        }
+
+def fetch_s3_data_page(
+    region: Optional[str] = None,
+    bucket_names: Optional[List[str]] = None,
+    page_size: int = S3_LIST_BUCKETS_PAGE_SIZE,
+    continuation_token: Optional[str] = None,
+    workers: Optional[int] = None,
+    age_edges: Optional[Sequence[int]] = None
+) -> Dict:
+    """
+    Analyze one ListBuckets page, its buckets concurrently on up to `workers` threads
+    (S3_BUCKET_WORKERS by default). Pass the returned "NextToken" back as
+    `continuation_token` for the next page; it is None after the last one.
+    `age_edges` (e.g. lifecycle transition days) get exact AgeHistogram totals.
+
+    Returns {"Buckets": [bucket dicts, in listing order], "Listed": buckets on the page,
+             "NextToken": str or None}
+    """
+    account_id = get_active_account_id()
+    buckets, next_token = next(iter_bucket_pages(page_size, continuation_token, bucket_region=region))
+    listed = len(buckets)
+    if bucket_names:
+        buckets = [b for b in buckets if b['Name'] in bucket_names]
+    # Region filter first: out-of-region buckets never get a per-bucket call
+    regions = resolve_bucket_regions(buckets, account_id, workers)
+    names = [b['Name'] for b in buckets if not region or regions[b['Name']] == region]
+    print(f"📊 [S3 ANALYSIS] Analyzing {len(names)} of {len(buckets)} buckets on this page")
+    results = bounded_map(
+        lambda name: _analyze_bucket(name, region, account_id, regions[name], age_edges),
+        names, workers or S3_BUCKET_WORKERS
+    )
+    return {"Buckets": [r for r in results if r], "Listed": listed, "NextToken": next_token}
+
 def fetch_s3_data(
     region: Optional[str] = None,
-    bucket_names: Optional[List[str]] = None
+    bucket_names: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+    age_edges: Optional[Sequence[int]] = None
 ) -> List[Dict]:
     """
     Fetches S3 bucket and their Lifecycle Management policies, along with its storage details.
     Filters by bucket_names if provided.
     Uses region override if passed.
-    Limits to first 10 buckets if no specific bucket names are provided.
+    Pages through every bucket (ListBuckets continuation tokens) and analyzes each page's
+    buckets concurrently on up to `workers` threads (S3_BUCKET_WORKERS by default).
+    Pass the lifecycle transition days as `age_edges` so bytes past each one are exact.
     
     Returns a list of dictionaries, one per bucket.
     """
@@ -250,57 +509,28 @@ def fetch_s3_data(
     print(f"🎯 [S3 ANALYSIS] Bucket filter: {bucket_names or 'all buckets'}")
     print(f"🌐 [S3 ANALYSIS] Using REAL AWS data (not mock data)")
     
-    all_buckets = get_all_buckets()
-
-    # If specific bucket names are provided, use those; otherwise limit to first 10
-    if bucket_names:
-        filtered_buckets = [b for b in all_buckets if b['Name'] in bucket_names]
-        print(f"📊 [S3 ANALYSIS] Filtered to {len(filtered_buckets)} specified buckets")
-    else:
-        filtered_buckets = all_buckets[:10]  # Limit to first 10 buckets
-        print(f"📊 [S3 ANALYSIS] Limited to first {len(filtered_buckets)} buckets")
-
+    timer = StageTimer("S3 scan")
     results = []
-    total_buckets = len(filtered_buckets)
-    analyzed_buckets = 0
-    total_current_cost = 0
-    total_potential_savings = 0
-    
-    for i, bucket in enumerate(filtered_buckets, 1):
-        bucket_name = bucket['Name']
-        print(f"\n📊 [S3 ANALYSIS] Progress: {i}/{total_buckets} buckets")
-        
-        try:
-            details = fetch_s3_bucket_details(bucket_name, region=region)
-            if details:
-                details["BucketName"] = bucket_name
-                results.append(details)
-                analyzed_buckets += 1
-                
-                # Accumulate cost data
-                cost_analysis = details.get("CostAnalysis", {})
-                total_current_cost += cost_analysis.get("CurrentMonthlyCost", 0)
-                total_potential_savings += cost_analysis.get("PotentialSavings", 0)
-                
-        except Exception as e:
-            print(f"   ❌ [S3 ANALYSIS] Error analyzing bucket {bucket_name}: {e}")
-            results.append({
-                "BucketName": bucket_name,
-                "error": str(e)
-            })
+    listed_buckets = 0
+    next_token = None
+    while True:
+        page = fetch_s3_data_page(region, bucket_names, continuation_token=next_token, workers=workers,
+                                  age_edges=age_edges)
+        results.extend(page["Buckets"])
+        listed_buckets += page["Listed"]
+        next_token = page["NextToken"]
+        if not next_token:
+            break
+
+    analyzed = [r for r in results if "error" not in r]
+    total_current_cost = sum(r.get("CostAnalysis", {}).get("CurrentMonthlyCost", 0) for r in analyzed)
+    total_potential_savings = sum(r.get("CostAnalysis", {}).get("PotentialSavings", 0) for r in analyzed)
 
     print(f"\n📊 [S3 ANALYSIS] Summary:")
-    print(f"   📈 Total buckets analyzed: {analyzed_buckets}")
+    print(f"   📈 Total buckets analyzed: {len(analyzed)} of {listed_buckets} listed")
     print(f"   💰 Total current monthly cost: ${total_current_cost:.2f}")
     print(f"   💡 Total potential savings: ${total_potential_savings:.2f}")
     print(f"   🎯 Buckets with optimization potential: {len([r for r in results if r.get('CostAnalysis', {}).get('PotentialSavings', 0) > 0])}")
-    if not bucket_names:
-        print(f"   🏆 Limited to first {len(filtered_buckets)} buckets")
+    timer.report()
     
     return results
-
-
-
-
-
-
@@ -0,0 +1,223 @@
+"""
+S3 Inventory ingestion for fo.ai
+Reads S3 Inventory reports (manifest.json plus CSV, ORC or Parquet data files) from a local
+copy or mount of the inventory destination bucket and aggregates them into ObjectStatistics
+without listing the bucket. Data files are streamed in fixed-size chunks, so memory stays
+bounded however many objects the bucket holds.
+
+Expected layout under S3_INVENTORY_DIR (the destination bucket's root):
+    <prefix>/<source bucket>/<config id>/<YYYY-MM-DDTHH-MMZ>/manifest.json
+    <prefix>/<source bucket>/<config id>/data/<file>.csv.gz | .orc | .parquet
+"""
+
+import csv
+import glob
+import gzip
+import io
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import unquote
+
+import numpy as np
+
+from data.aws.s3_stats import ObjectStatsAccumulator, top_level_groups
+
+try:
+    import pyarrow.orc as pa_orc  # optional - only needed for ORC / Parquet reports
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa_orc = None
+    pa_parquet = None
+
+# Local copy / mount of the inventory destination bucket (empty = always list)
+S3_INVENTORY_DIR = os.getenv("S3_INVENTORY_DIR", "")
+# Reports older than this are ignored (daily or weekly inventories)
+S3_INVENTORY_MAX_AGE_DAYS = int(os.getenv("S3_INVENTORY_MAX_AGE_DAYS", "8"))
+# Rows aggregated per chunk
+S3_INVENTORY_CHUNK_ROWS = int(os.getenv("S3_INVENTORY_CHUNK_ROWS", "200000"))
+
+# Manifest fileSchema names (CSV) and their ORC / Parquet column names
+INVENTORY_FIELDS = {
+    "Key": "key",
+    "Size": "size",
+    "LastModifiedDate": "last_modified_date",
+    "StorageClass": "storage_class",
+    "IsLatest": "is_latest",
+    "IsDeleteMarker": "is_delete_marker",
+}
+REQUIRED_FIELDS = ("Key", "Size", "LastModifiedDate")
+
+Chunk = Dict[str, np.ndarray]
+
+
+def find_inventory_manifest(bucket_name: str, inventory_dir: Optional[str] = None,
+                            max_age_days: int = S3_INVENTORY_MAX_AGE_DAYS) -> Optional[Tuple[str, Dict]]:
+    """
+    Newest manifest for `bucket_name` under inventory_dir that is recent enough and lists
+    the fields ObjectStatistics needs. Returns (manifest path, manifest) or None.
+    """
+    inventory_dir = inventory_dir or S3_INVENTORY_DIR
+    if not inventory_dir or not os.path.isdir(inventory_dir):
+        return None
+    pattern = os.path.join(glob.escape(inventory_dir), "**", glob.escape(bucket_name), "*", "*", "manifest.json")
+    oldest_ms = (time.time() - max_age_days * 86400) * 1000
+
+    newest = None
+    for path in glob.iglob(pattern, recursive=True):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  [S3 INVENTORY] Skipping unreadable manifest {path}: {e}")
+            continue
+        if manifest.get("sourceBucket") != bucket_name:
+            continue
+        created_ms = int(manifest.get("creationTimestamp", 0))
+        if created_ms < oldest_ms:
+            continue
+        if manifest.get("fileFormat", "CSV").upper() == "CSV":
+            schema = [name.strip() for name in manifest.get("fileSchema", "").split(",")]
+            if any(field not in schema for field in REQUIRED_FIELDS):
+                print(f"⚠️  [S3 INVENTORY] {path} lacks {', '.join(REQUIRED_FIELDS)}, ignoring it")
+                continue
+        if newest is None or created_ms > int(newest[1].get("creationTimestamp", 0)):
+            newest = (path, manifest)
+    return newest
+
+
+def _data_file_path(manifest_path: str, inventory_dir: str, key: str) -> str:
+    """Local path of a manifest data file: mirrored under inventory_dir, else next to the manifest"""
+    mirrored = os.path.join(inventory_dir, key)
+    if os.path.exists(mirrored):
+        return mirrored
+    config_dir = os.path.dirname(os.path.dirname(manifest_path))
+    return os.path.join(config_dir, "data", os.path.basename(key))
+
+
+def _parse_last_modified(values: np.ndarray) -> np.ndarray:
+    """ISO-8601 strings ('2024-01-31T10:00:00.000Z') -> epoch milliseconds"""
+    stripped = np.char.rstrip(values.astype(str), "Z")
+    return stripped.astype("datetime64[ms]").astype(np.int64)
+
+
+def _iter_csv_chunks(path: str, schema: List[str], chunk_rows: int) -> Iterator[Chunk]:
+    """CSV data file (optionally gzipped, no header) -> chunks of column arrays"""
+    columns = {field: schema.index(field) for field in INVENTORY_FIELDS if field in schema}
+    raw = gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+    with io.TextIOWrapper(io.BufferedReader(raw, buffer_size=1 << 20), encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        while True:
+            rows = [row for _, row in zip(range(chunk_rows), reader)]
+            if not rows:
+                return
+            values = list(zip(*rows))
+            chunk = {field: np.array(values[index], dtype=object) for field, index in columns.items()}
+            keys = chunk["Key"]
+            # CSV reports URL-encode keys
+            chunk["Key"] = np.array([unquote(key) for key in keys], dtype=object) if any("%" in key for key in keys) else keys
+            chunk["Size"] = np.array([size or 0 for size in chunk["Size"]], dtype=np.int64)
+            chunk["LastModifiedDate"] = _parse_last_modified(chunk["LastModifiedDate"])
+            for flag in ("IsLatest", "IsDeleteMarker"):
+                if flag in chunk:
+                    chunk[flag] = chunk[flag] == "true"
+            yield chunk
+
+
+def _columnar_chunk(table) -> Chunk:
+    """pyarrow Table/RecordBatch with ORC/Parquet inventory columns -> column arrays"""
+    names = set(table.schema.names)
+    chunk = {}
+    for field, column in INVENTORY_FIELDS.items():
+        if column not in names:
+            continue
+        values = table.column(table.schema.get_field_index(column))
+        if field == "LastModifiedDate":
+            chunk[field] = values.cast("timestamp[ms]").cast("int64").to_numpy(zero_copy_only=False)
+        elif field == "Size":
+            chunk[field] = values.fill_null(0).to_numpy(zero_copy_only=False).astype(np.int64)
+        elif field in ("IsLatest", "IsDeleteMarker"):
+            chunk[field] = values.fill_null(field == "IsLatest").to_numpy(zero_copy_only=False)
+        else:
+            chunk[field] = values.to_numpy(zero_copy_only=False)
+    return chunk
+
+
+def _iter_columnar_chunks(path: str, file_format: str, chunk_rows: int) -> Iterator[Chunk]:
+    if pa_parquet is None:
+        raise RuntimeError(f"pyarrow is required to read {file_format} inventory files")
+    if file_format == "PARQUET":
+        parquet_file = pa_parquet.ParquetFile(path)
+        columns = [column for column in INVENTORY_FIELDS.values() if column in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield _columnar_chunk(batch)
+    else:
+        orc_file = pa_orc.ORCFile(path)
+        columns = [column for column in INVENTORY_FIELDS.values() if column in orc_file.schema.names]
+        # ORC stripes are the natural chunk (typically ~64 MB each)
+        for stripe in range(orc_file.nstripes):
+            yield _columnar_chunk(orc_file.read_stripe(stripe, columns=columns))
+
+
+def iter_inventory_chunks(manifest_path: str, manifest: Dict, inventory_dir: Optional[str] = None,
+                          chunk_rows: int = S3_INVENTORY_CHUNK_ROWS) -> Iterator[Chunk]:
+    """Chunks of column arrays (Key, Size, LastModifiedDate as epoch ms, ...) across the manifest's files"""
+    inventory_dir = inventory_dir or S3_INVENTORY_DIR
+    file_format = manifest.get("fileFormat", "CSV").upper()
+    schema = [name.strip() for name in manifest.get("fileSchema", "").split(",")]
+    for entry in manifest.get("files", []):
+        path = _data_file_path(manifest_path, inventory_dir, entry["key"])
+        if file_format == "CSV":
+            yield from _iter_csv_chunks(path, schema, chunk_rows)
+        else:
+            yield from _iter_columnar_chunks(path, file_format, chunk_rows)
+
+
+def aggregate_inventory(manifest_path: str, manifest: Dict, prefix: Optional[str] = None,
+                        inventory_dir: Optional[str] = None,
+                        chunk_rows: int = S3_INVENTORY_CHUNK_ROWS) -> ObjectStatsAccumulator:
+    """
+    Aggregate an inventory report chunk by chunk. Only current versions count (delete
+    markers and noncurrent versions of versioned inventories are dropped), like a listing.
+    """
+    stats = ObjectStatsAccumulator()
+    for chunk in iter_inventory_chunks(manifest_path, manifest, inventory_dir, chunk_rows):
+        keep = np.ones(len(chunk["Key"]), dtype=bool)
+        if "IsLatest" in chunk:
+            keep &= chunk["IsLatest"].astype(bool)
+        if "IsDeleteMarker" in chunk:
+            keep &= ~chunk["IsDeleteMarker"].astype(bool)
+        if prefix:
+            keep &= np.fromiter((key.startswith(prefix) for key in chunk["Key"]), dtype=bool, count=len(keep))
+        if not keep.all():
+            chunk = {field: values[keep] for field, values in chunk.items()}
+        storage_classes = chunk.get("StorageClass")
+        if storage_classes is None:
+            storage_classes = np.full(len(chunk["Key"]), "STANDARD", dtype=object)
+        else:
+            storage_classes = np.array([storage_class or "STANDARD" for storage_class in storage_classes], dtype=object)
+        stats.add(chunk["Size"], storage_classes, chunk["LastModifiedDate"], top_level_groups(chunk["Key"]))
+    return stats
+
+
+def load_inventory_stats(bucket_name: str, prefix: Optional[str] = None,
+                         inventory_dir: Optional[str] = None,
+                         age_edges: Optional[Sequence[int]] = None) -> Optional[Dict]:
+    """
+    ObjectStatistics for a bucket from its newest local inventory report, or None when there
+    is no usable report (the caller falls back to listing). `age_edges` as for to_stats.
+    """
+    found = find_inventory_manifest(bucket_name, inventory_dir)
+    if found is None:
+        return None
+    manifest_path, manifest = found
+    created_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(int(manifest.get("creationTimestamp", 0)) / 1000))
+    print(f"      📦 [S3 INVENTORY] Using {manifest.get('fileFormat', 'CSV')} inventory from {created_at} "
+          f"({len(manifest.get('files', []))} data files)")
+    try:
+        stats = aggregate_inventory(manifest_path, manifest, prefix, inventory_dir)
+    except Exception as e:
+        print(f"⚠️  [S3 INVENTORY] Could not read inventory for {bucket_name}, listing instead: {e}")
+        return None
+    return stats.to_stats(source="inventory", extra={"InventoryCreatedAt": created_at}, age_edges=age_edges)
@@ -0,0 +1,273 @@
+"""
+Vectorized S3 object statistics for fo.ai
+Aggregates object listings or inventory rows in NumPy chunks into the ObjectStatistics
+shape. Memory stays constant however many objects a bucket holds: counts and bytes per
+storage class live in daily age histograms, the most recently modified top-level prefixes
+in a top-N table, and the number of distinct prefixes in a HyperLogLog sketch. Partial
+aggregates merge, so chunks, files and listing partitions can be summed independently.
+"""
+
+import heapq
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Daily age bins per storage class; objects older than this share the last bin
+S3_AGE_HISTOGRAM_DAYS = int(os.getenv("S3_AGE_HISTOGRAM_DAYS", "1095"))
+# Age bucket edges (days) reported in AgeHistogram; lifecycle transition days are exact at these
+S3_AGE_BUCKET_DAYS = [int(days) for days in os.getenv("S3_AGE_BUCKET_DAYS", "30,60,90,180,365,730").split(",") if days.strip()]
+# Most recently modified top-level prefixes kept for LastModifiedByGroup
+S3_RECENT_PREFIXES = int(os.getenv("S3_RECENT_PREFIXES", "20"))
+
+IST = timezone(timedelta(hours=5, minutes=30))
+GB = 1024 ** 3
+DAY_MS = 86_400_000
+NO_TIMESTAMP = np.iinfo(np.int64).min
+HLL_PRECISION = 14  # 2**14 one-byte registers, ~0.8% standard error
+
+
+def format_datetime_utc530(dt: datetime) -> str:
+    dt_ist = dt.astimezone(IST)
+    return dt_ist.strftime('%B %-d, %Y, %H:%M:%S (UTC+05:30)')
+
+
+def _from_epoch_ms(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+def top_level_groups(keys: np.ndarray) -> np.ndarray:
+    """First path segment of each key (the whole key when it has no '/')"""
+    # str.partition per key beats np.char.partition, which first copies keys to fixed-width unicode
+    return np.array([key.partition('/')[0] for key in keys], dtype=object)
+
+
+class HyperLogLog:
+    """Distinct-count sketch over 64-bit hashes, 2**precision bytes whatever the count"""
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        if not len(hashes):
+            return
+        hashes = np.asarray(hashes, dtype=np.int64).view(np.uint64)
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.intp)
+        rest = hashes & np.uint64((1 << width) - 1)
+        # rank = position of the first 1 bit in the remaining `width` bits (width + 1 when all zero)
+        _, bit_length = np.frexp(rest.astype(np.float64))
+        rank = (width - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def add(self, values: Iterable[str], count: int):
+        # str hashes are salted per process, which is fine: registers are never persisted
+        self.add_hashes(np.fromiter((hash(value) for value in values), dtype=np.int64, count=count))
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.exp2(-self.registers.astype(np.float64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class ObjectStatsAccumulator:
+    """
+    Running totals for one bucket (or one chunk / partition of it). Ages are whole UTC days
+    before the reference day (the day the accumulator was created).
+    """
+
+    __slots__ = ("object_count", "total_size", "reference_day", "age_objects", "age_bytes",
+                 "recent", "prefixes", "newest")
+
+    def __init__(self, reference_ms: Optional[int] = None):
+        self.object_count = 0
+        self.total_size = 0
+        self.reference_day = (int(time.time() * 1000) if reference_ms is None else reference_ms) // DAY_MS
+        self.age_objects: Dict[str, np.ndarray] = {}  # storage class -> objects per age in days
+        self.age_bytes: Dict[str, np.ndarray] = {}  # storage class -> bytes per age in days
+        self.recent: Dict[str, int] = {}  # top-level prefix -> epoch ms, S3_RECENT_PREFIXES newest only
+        self.prefixes = HyperLogLog()
+        self.newest = NO_TIMESTAMP
+
+    def _histograms(self, storage_class: str) -> Tuple[np.ndarray, np.ndarray]:
+        if storage_class not in self.age_objects:
+            self.age_objects[storage_class] = np.zeros(S3_AGE_HISTOGRAM_DAYS + 1, dtype=np.int64)
+            self.age_bytes[storage_class] = np.zeros(S3_AGE_HISTOGRAM_DAYS + 1, dtype=np.int64)
+        return self.age_objects[storage_class], self.age_bytes[storage_class]
+
+    def _update_recent(self, items: Iterable[Tuple[str, int]]):
+        for group, timestamp in items:
+            if timestamp > self.recent.get(group, NO_TIMESTAMP):
+                self.recent[group] = timestamp
+        if len(self.recent) > S3_RECENT_PREFIXES:
+            self.recent = dict(heapq.nlargest(S3_RECENT_PREFIXES, self.recent.items(), key=lambda item: item[1]))
+
+    def add(self, sizes: np.ndarray, storage_classes: np.ndarray, last_modified_ms: np.ndarray, groups: np.ndarray):
+        """
+        Add one chunk of objects given as parallel arrays: sizes (bytes), storage class names,
+        last modified (epoch ms, int64) and top-level group names.
+        """
+        count = len(sizes)
+        if not count:
+            return
+        sizes = np.asarray(sizes, dtype=np.int64)
+        last_modified_ms = np.asarray(last_modified_ms, dtype=np.int64)
+        groups = np.asarray(groups, dtype=object)
+        self.object_count += count
+        self.total_size += int(sizes.sum())
+        self.newest = max(self.newest, int(last_modified_ms.max()))
+
+        bins = S3_AGE_HISTOGRAM_DAYS + 1
+        classes, class_index = np.unique(np.asarray(storage_classes).astype(str), return_inverse=True)
+        ages = np.clip(self.reference_day - last_modified_ms // DAY_MS, 0, S3_AGE_HISTOGRAM_DAYS)
+        flat = class_index * bins + ages
+        objects = np.bincount(flat, minlength=len(classes) * bins).reshape(len(classes), bins)
+        # np.add.at keeps byte totals exact in int64 (bincount weights would go through float64)
+        byte_totals = np.zeros(len(classes) * bins, dtype=np.int64)
+        np.add.at(byte_totals, flat, sizes)
+        byte_totals = byte_totals.reshape(len(classes), bins)
+        for row, storage_class in enumerate(classes.tolist()):
+            age_objects, age_bytes = self._histograms(storage_class)
+            age_objects += objects[row]
+            age_bytes += byte_totals[row]
+
+        self.prefixes.add(groups, count)
+
+        # Only objects newer than the current N-th most recent prefix can change the table
+        if len(self.recent) >= S3_RECENT_PREFIXES:
+            newer = last_modified_ms > min(self.recent.values())
+            groups, last_modified_ms = groups[newer], last_modified_ms[newer]
+            if not len(groups):
+                return
+        names, group_index = np.unique(groups.astype(str), return_inverse=True)
+        latest = np.full(len(names), NO_TIMESTAMP, dtype=np.int64)
+        np.maximum.at(latest, group_index, last_modified_ms)
+        if len(names) > S3_RECENT_PREFIXES:
+            # A prefix beaten by N others within this chunk is beaten overall too
+            keep = np.argpartition(latest, -S3_RECENT_PREFIXES)[-S3_RECENT_PREFIXES:]
+            names, latest = names[keep], latest[keep]
+        self._update_recent(zip(names.tolist(), latest.tolist()))
+
+    def add_objects(self, objects: List[Dict]):
+        """Add a list_objects_v2 page's Contents"""
+        if not objects:
+            return
+        keys = np.array([obj['Key'] for obj in objects], dtype=object)
+        self.add(
+            np.fromiter((obj.get('Size', 0) for obj in objects), dtype=np.int64, count=len(objects)),
+            np.array([obj.get('StorageClass', 'STANDARD') for obj in objects], dtype=object),
+            np.fromiter((int(obj['LastModified'].timestamp() * 1000) for obj in objects), dtype=np.int64, count=len(objects)),
+            top_level_groups(keys),
+        )
+
+    def merge(self, other: "ObjectStatsAccumulator") -> "ObjectStatsAccumulator":
+        """Fold another partial aggregate into this one (re-aging it if its reference day differs)"""
+        self.object_count += other.object_count
+        self.total_size += other.total_size
+        self.newest = max(self.newest, other.newest)
+        shift = self.reference_day - other.reference_day
+        index = np.clip(np.arange(S3_AGE_HISTOGRAM_DAYS + 1) + shift, 0, S3_AGE_HISTOGRAM_DAYS)
+        for storage_class, other_objects in other.age_objects.items():
+            age_objects, age_bytes = self._histograms(storage_class)
+            if shift:
+                np.add.at(age_objects, index, other_objects)
+                np.add.at(age_bytes, index, other.age_bytes[storage_class])
+            else:
+                age_objects += other_objects
+                age_bytes += other.age_bytes[storage_class]
+        self.prefixes.merge(other.prefixes)
+        self._update_recent(other.recent.items())
+        return self
+
+    def size_by_class(self) -> Dict[str, int]:
+        return {storage_class: int(age_bytes.sum()) for storage_class, age_bytes in self.age_bytes.items()}
+
+    def objects_by_class(self) -> Dict[str, int]:
+        return {storage_class: int(age_objects.sum()) for storage_class, age_objects in self.age_objects.items()}
+
+    def bytes_older_than(self, days: int, storage_class: str = "STANDARD") -> int:
+        """Exact bytes of `storage_class` last modified at least `days` days ago (up to S3_AGE_HISTOGRAM_DAYS)"""
+        age_bytes = self.age_bytes.get(storage_class)
+        if age_bytes is None:
+            return 0
+        return int(age_bytes[min(max(days, 0), S3_AGE_HISTOGRAM_DAYS):].sum())
+
+    def age_buckets(self, edges: Sequence[int]) -> Dict[str, Dict[str, List[int]]]:
+        """
+        Objects and bytes per storage class in age buckets [0, e1), [e1, e2), ..., [eN, oldest].
+        Edges beyond S3_AGE_HISTOGRAM_DAYS fall back to the histogram's last bin.
+        """
+        bounds = np.array([0] + [min(edge, S3_AGE_HISTOGRAM_DAYS) for edge in edges] + [S3_AGE_HISTOGRAM_DAYS + 1])
+        buckets = {}
+        for storage_class, age_objects in self.age_objects.items():
+            objects = np.concatenate([[0], np.cumsum(age_objects)])
+            age_bytes = np.concatenate([[0], np.cumsum(self.age_bytes[storage_class])])
+            buckets[storage_class] = {
+                "Objects": (objects[bounds[1:]] - objects[bounds[:-1]]).tolist(),
+                "Bytes": (age_bytes[bounds[1:]] - age_bytes[bounds[:-1]]).tolist(),
+            }
+        return buckets
+
+    def last_modified_by_group(self) -> Dict[str, datetime]:
+        """The most recently modified top-level prefixes, newest first"""
+        ordered = sorted(self.recent.items(), key=lambda item: -item[1])
+        return {group: _from_epoch_ms(timestamp) for group, timestamp in ordered}
+
+    def to_stats(self, source: str = "listing", extra: Optional[Dict] = None,
+                 age_edges: Optional[Sequence[int]] = None) -> Dict:
+        """
+        The ObjectStatistics dict get_object_stats returns. `age_edges` (e.g. the configured
+        lifecycle transition days) are added to S3_AGE_BUCKET_DAYS so totals at them are exact.
+        """
+        edges = sorted(set(S3_AGE_BUCKET_DAYS) | set(age_edges or ()))
+        return {
+            "TotalObjects": self.object_count,
+            "TotalSizeBytes": self.total_size,
+            "TotalSizeGB": self.total_size / GB,
+            "SizeByStorageClass": self.size_by_class(),
+            "ObjectsByStorageClass": self.objects_by_class(),
+            "LastModifiedByGroup": {
+                group: format_datetime_utc530(dt) for group, dt in self.last_modified_by_group().items()
+            },
+            "LastModifiedAt": _from_epoch_ms(self.newest).isoformat() if self.object_count else None,
+            "EstimatedPrefixCount": self.prefixes.estimate(),
+            "AgeHistogram": {
+                "ReferenceDate": _from_epoch_ms(self.reference_day * DAY_MS).date().isoformat(),
+                "EdgesDays": edges,
+                "ByStorageClass": self.age_buckets(edges),
+            },
+            "Source": source,
+            **(extra or {}),
+        }
+
+
+def bytes_older_than(object_stats: Dict, days: int, storage_class: str = "STANDARD") -> Optional[int]:
+    """
+    Exact bytes of `storage_class` at least `days` old from an ObjectStatistics dict's AgeHistogram.
+    None when the stats carry no histogram or `days` is not one of its edges (pass it as
+    age_edges when the stats are built) or is past S3_AGE_HISTOGRAM_DAYS.
+    """
+    histogram = object_stats.get("AgeHistogram")
+    if not histogram:
+        return None
+    edges = histogram.get("EdgesDays", [])
+    if days not in edges or days > S3_AGE_HISTOGRAM_DAYS:
+        return None
+    position = edges.index(days)
+    by_class = histogram.get("ByStorageClass", {}).get(storage_class)
+    if by_class is None:
+        return 0
+    return int(sum(by_class["Bytes"][position + 1:]))
@@ -1,6 +1,15 @@
 import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
 import boto3
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
 from dotenv import load_dotenv
+from data.aws.concurrency import ENRICHMENT_WORKERS
+from data.aws.rate_limiter import install_rate_limiter
 
 load_dotenv()  # Load from .env or .envrc
 
@@ -11,33 +20,180 @@ AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 # AWS_SESSION_TOKEN = os.getenv("AWS_SESSION_TOKEN")
 ENABLE_TRUSTED_ADVISOR = os.getenv("ENABLE_TRUSTED_ADVISOR", "false").lower() == "true"
 
+# Connection pool per client sized to the enrichment worker count. botocore only gets a few
+# standard-mode retries: pacing and throttling backoff belong to rate_limiter (token buckets
+# plus call_with_backoff), and stacking adaptive retries underneath would multiply attempts.
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", str(max(ENRICHMENT_WORKERS, 10))))
+AWS_RETRY_MAX_ATTEMPTS = int(os.getenv("AWS_RETRY_MAX_ATTEMPTS", "3"))
+AWS_CLIENT_CONFIG = Config(
+    max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+    retries={"max_attempts": AWS_RETRY_MAX_ATTEMPTS, "mode": "standard"},
+)
 
-def get_boto3_client(service: str, region: str = None):
+# Cross-account scans assume this role in each member account
+ORG_ROLE_NAME = os.getenv("ORG_ROLE_NAME", "OrganizationAccountAccessRole")
+ORG_ROLE_SESSION_SECONDS = int(os.getenv("ORG_ROLE_SESSION_SECONDS", "3600"))
+
+# Sessions are validated once and clients are reused; boto3 clients are thread-safe,
+# sessions are not, so client creation happens under the pool lock.
+_sessions = {}  # credentials key -> {"session": boto3.Session, "identity": dict}
+_clients = {}   # (service, region, credentials key) -> client
+_session_locks = {}  # credentials key -> lock serializing that session's creation
+_pool_lock = threading.RLock()
+
+AMBIENT_CREDENTIALS = "ambient"
+
+# Credentials used by get_boto3_client in the current context (see use_account)
+_active_credentials: ContextVar[str] = ContextVar("foai_aws_credentials", default=AMBIENT_CREDENTIALS)
+
+
+def _assumed_role_credentials_key(account_id: str, role_name: str) -> str:
+    return f"{account_id}/{role_name}"
+
+
+def _create_assumed_role_session(credentials_key: str) -> boto3.Session:
     """
-    Returns a boto3 client for the given AWS service.
-    Supports override region (e.g., 'us-west-2').
+    Session for `account_id/role_name` whose STS credentials refresh themselves
+    before they expire, so long scans and pooled clients never see an expired token.
     """
-    try:
-        selected_region = region or AWS_REGION
-        
-        # if all([AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_SESSION_TOKEN]):
+    account_id, role_name = credentials_key.split("/", 1)
+    role_arn = f"arn:aws:iam::{account_id}:role/{role_name}"
+    ambient_sts = get_boto3_client("sts", credentials_key=AMBIENT_CREDENTIALS)
+
+    def refresh() -> dict:
+        if DEBUG:
+            print(f"[AWS] Assuming {role_arn}")
+        credentials = ambient_sts.assume_role(
+            RoleArn=role_arn,
+            RoleSessionName=f"foai-{account_id}",
+            DurationSeconds=ORG_ROLE_SESSION_SECONDS,
+        )["Credentials"]
+        expiration = credentials["Expiration"]
+        if isinstance(expiration, datetime):
+            expiration = expiration.astimezone(timezone.utc).isoformat()
+        return {
+            "access_key": credentials["AccessKeyId"],
+            "secret_key": credentials["SecretAccessKey"],
+            "token": credentials["SessionToken"],
+            "expiry_time": expiration,
+        }
+
+    botocore_session = botocore.session.get_session()
+    botocore_session._credentials = RefreshableCredentials.create_from_metadata(
+        metadata=refresh(), refresh_using=refresh, method="sts-assume-role"
+    )
+    return boto3.Session(botocore_session=botocore_session, region_name=AWS_REGION)
+
+
+def _get_session_entry(credentials_key: str = AMBIENT_CREDENTIALS) -> dict:
+    entry = _sessions.get(credentials_key)
+    if entry is not None:
+        return entry
+
+    # One lock per credentials key, so accounts assume their roles in parallel
+    with _pool_lock:
+        session_lock = _session_locks.setdefault(credentials_key, threading.Lock())
+
+    with session_lock:
+        entry = _sessions.get(credentials_key)
+        if entry is not None:
+            return entry
+
+        if credentials_key != AMBIENT_CREDENTIALS:
+            session = _create_assumed_role_session(credentials_key)
+        # elif all([AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_SESSION_TOKEN]):
         #     session = boto3.Session(
         #         aws_access_key_id=AWS_ACCESS_KEY_ID,
         #         aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
         #         aws_session_token=AWS_SESSION_TOKEN,
-        #         region_name=selected_region
+        #         region_name=AWS_REGION
         #     )
-        # else:
-        session = boto3.Session(region_name=selected_region)
+        else:
+            session = boto3.Session(region_name=AWS_REGION)
 
-        # Validate credentials
-        sts = session.client("sts")
+        # Validate credentials once per session
+        sts = session.client("sts", config=AWS_CLIENT_CONFIG)
         identity = sts.get_caller_identity()
         if DEBUG:
             print(f"[AWS] Authenticated as: {identity['Arn']}")
 
-        return session.client(service)
+        entry = {"session": session, "identity": identity}
+        with _pool_lock:
+            _sessions[credentials_key] = entry
+        return entry
+
+
+@contextmanager
+def use_account(account_id: str, role_name: str = None):
+    """
+    Route every get_boto3_client call in this context (and in worker threads started
+    through data.aws.concurrency) to `account_id` via an assumed role.
+    """
+    token = _active_credentials.set(_assumed_role_credentials_key(account_id, role_name or ORG_ROLE_NAME))
+    try:
+        yield
+    finally:
+        _active_credentials.reset(token)
+
+
+def get_boto3_session(credentials_key: str = None) -> boto3.Session:
+    """Returns the pooled, already-validated boto3 session"""
+    return _get_session_entry(credentials_key or _active_credentials.get())["session"]
+
+
+def get_caller_identity(credentials_key: str = None) -> dict:
+    """Returns the cached STS identity (Account, Arn, UserId) of the pooled session"""
+    return _get_session_entry(credentials_key or _active_credentials.get())["identity"]
+
+
+def get_active_account_id() -> str:
+    """Account ID the current context's clients operate in"""
+    return get_caller_identity().get("Account", "unknown")
+
+
+def get_boto3_client(service: str, region: str = None, credentials_key: str = None):
+    """
+    Returns a boto3 client for the given AWS service.
+    Supports override region (e.g., 'us-west-2').
+    Clients are pooled per (service, region, credentials key) and shared across threads,
+    so the ambient identity and an assumed role in the same account never share a client;
+    every request they send goes through the process-wide rate limiter.
+    Uses the account selected with use_account(), ambient credentials otherwise.
+    """
+    try:
+        selected_region = region or AWS_REGION
+        credentials_key = credentials_key or _active_credentials.get()
+        entry = _get_session_entry(credentials_key)
+        client_key = (service, selected_region, credentials_key)
+
+        with _pool_lock:
+            client = _clients.get(client_key)
+            if client is None:
+                client = entry["session"].client(service, region_name=selected_region, config=AWS_CLIENT_CONFIG)
+                install_rate_limiter(client)
+                _clients[client_key] = client
+        return client
 
     except Exception as e:
         raise RuntimeError(f"[AWS Error] Could not create {service} client: {e}")
 
+
+def clear_boto3_pool():
+    """Drop all pooled sessions and clients (e.g. after credentials change)"""
+    with _pool_lock:
+        _sessions.clear()
+        _clients.clear()
+    print("[AWS] Client pool cleared")
+
+
+def get_boto3_pool_stats() -> dict:
+    """Get client pool statistics"""
+    with _pool_lock:
+        return {
+            "sessions": len(_sessions),
+            "clients": len(_clients),
+            "client_keys": [f"{service}/{region}/{credentials}" for service, region, credentials in _clients],
+            "max_pool_connections": AWS_MAX_POOL_CONNECTIONS,
+            "retry_mode": "standard",
+            "retry_max_attempts": AWS_RETRY_MAX_ATTEMPTS,
+        }
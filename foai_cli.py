@@ -175,6 +175,8 @@ Examples:
   python foai_cli.py prefs set --user vedanta --cpu-threshold 5 --uptime 100
   python foai_cli.py server start all
   python foai_cli.py logs api
+  python foai_cli.py pricing ingest index.csv --region us-east-1
+  python foai_cli.py org-scan --accounts 111111111111 222222222222 --role OrganizationAccountAccessRole
   
 Alias:
     Set alias for this script in your shell:
@@ -228,6 +230,24 @@ explain_cmd = subparsers.add_parser("explain-prefs", help="Use LLM to explain cu
 explain_cmd.add_argument("--user", default="default_user", help="User ID (default: 'default_user')")
 explain_cmd.add_argument("--persona", default="engineer", help="Persona style (e.g., engineer, finance, executive)")
 
+# Pricing catalog
+pricing_cmd = subparsers.add_parser("pricing", help="Manage the local EC2 price catalog")
+pricing_sub = pricing_cmd.add_subparsers(dest="pricing_command")
+
+pricing_ingest = pricing_sub.add_parser("ingest", help="Build the catalog from a downloaded EC2 offer file (.csv, or .json with ijson)")
+pricing_ingest.add_argument("file", help="Path to the regional AmazonEC2 offer file")
+pricing_ingest.add_argument("--region", help="Only index this region code (e.g. us-east-1)")
+
+pricing_stats = pricing_sub.add_parser("stats", help="Show catalog statistics")
+
+# Organization scan
+org_cmd = subparsers.add_parser("org-scan", help="Scan EC2/S3 across several AWS accounts via an assumed role")
+org_cmd.add_argument("--accounts", nargs="+", help="Account IDs to scan (default: ORG_ACCOUNT_IDS)")
+org_cmd.add_argument("--role", help="Role name to assume in each account (default: ORG_ROLE_NAME)")
+org_cmd.add_argument("--services", nargs="+", choices=["ec2", "s3"], help="Collectors to run (default: ec2 s3)")
+org_cmd.add_argument("--regions", nargs="+", help="EC2 regions to scan, or 'all' (default: EC2_SCAN_REGIONS)")
+org_cmd.add_argument("--concurrency", type=int, help="Max (account, service) scans in flight")
+
 # === Execution ===
 args = parser.parse_args()
 
@@ -282,6 +302,33 @@ elif args.command == "prefs":
             print("[fo.ai] Preferences saved successfully.")
         except Exception as e:
             print(f"[fo.ai] Error saving preferences: {e}")
+elif args.command == "pricing":
+    from data.aws.pricing_catalog import ingest_offer_file, get_catalog_stats
+    if args.pricing_command == "ingest":
+        try:
+            ingest_offer_file(args.file, region=args.region)
+        except Exception as e:
+            print(f"[fo.ai] Error ingesting offer file: {e}")
+    elif args.pricing_command == "stats":
+        print(json.dumps(get_catalog_stats(), indent=2))
+    else:
+        pricing_cmd.print_help()
+elif args.command == "org-scan":
+    from data.aws.org_scan import scan_organization
+    from data.aws.ec2 import summarize_cost_by_region
+    try:
+        result = scan_organization(
+            account_ids=args.accounts, role_name=args.role, services=args.services,
+            regions=args.regions, max_concurrency=args.concurrency
+        )
+        if "ec2" in result:
+            print(json.dumps(summarize_cost_by_region(result["ec2"], by_account=True), indent=2))
+        if result.get("s3"):
+            print(f"[fo.ai] S3 buckets analyzed: {len(result['s3'])}")
+        for error in result["errors"]:
+            print(f"[fo.ai] {error['AccountId']} {error['Service']}: {error['error']}")
+    except Exception as e:
+        print(f"[fo.ai] Error running organization scan: {e}")
 elif args.command == "explain-prefs":
     explain_prefs(user_id=args.user, persona=args.persona)
 else:
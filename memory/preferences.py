@@ -32,6 +32,8 @@ def set_user_preferences(user_id: str, preferences: dict) -> None:
     Save user preferences to Redis in the expected format:
     Key:   user:{user_id}:prefs
     Value: JSON string like {"cpu_threshold": 10, "min_uptime_hours": 0, "min_savings_usd": 0, "s3_standard_to_ia_days": 30}
+    Optional pricing keys ("stop_cpu_threshold", "reserved_option", "max_projected_cpu") make
+    EC2 recommendations re-price the fleet with data.aws.price_matrix before filtering.
     """
     key = f"user:{user_id}:prefs"
     value = json.dumps(preferences)
@@ -0,0 +1,191 @@
+# memory/tiered_cache.py
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from memory.redis_memory import r
+
+_MISSING = object()
+REDIS_RETRY_SECONDS = 30  # how long to stay local-only after a Redis error
+
+
+class TieredCache:
+    """
+    Two-tier cache: an in-process LRU in front of a shared Redis tier.
+    Every entry carries a TTL in both tiers, so all workers see the same values
+    and nothing is lost on restart. Redis outages degrade to the local tier only.
+    Redis keys: {namespace}:{key}, values are JSON encoded.
+    """
+
+    def __init__(self, namespace: str, max_entries: int = 2048, ttl_seconds: int = 86400):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._local = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._warming = False
+        self._redis_down_until = 0.0
+        self._stats = {"hits": 0, "redis_hits": 0, "misses": 0, "sets": 0,
+                       "evictions": 0, "expirations": 0, "warm_loaded": 0, "redis_errors": 0}
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _redis_available(self) -> bool:
+        return time.time() >= self._redis_down_until
+
+    def _redis_failed(self, e: Exception):
+        with self._lock:
+            self._stats["redis_errors"] += 1
+            was_available = self._redis_available()
+            self._redis_down_until = time.time() + REDIS_RETRY_SECONDS
+        if was_available:
+            print(f"[CACHE] Redis unavailable for {self.namespace}, using local cache only: {e}")
+
+    def _store_local(self, key: str, value: Any, expires_at: float):
+        # Caller holds the lock
+        self._local[key] = (value, expires_at)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def warm(self):
+        """
+        Cold-start load: pull every live entry for this namespace from Redis into the local tier.
+        If Redis is unreachable the load is retried on a later get, after REDIS_RETRY_SECONDS.
+        """
+        with self._lock:
+            if self._loaded or self._warming:
+                return
+            self._warming = True
+        try:
+            if not self._redis_available():
+                return
+            loaded = 0
+            keys = list(r.scan_iter(match=self._redis_key("*"), count=500))
+            prefix_len = len(self.namespace) + 1
+            now = time.time()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                pipe = r.pipeline()
+                for redis_key in chunk:
+                    pipe.get(redis_key)
+                    pipe.pttl(redis_key)
+                results = pipe.execute()
+                with self._lock:
+                    for i, redis_key in enumerate(chunk):
+                        raw, pttl = results[2 * i], results[2 * i + 1]
+                        if raw is None or pttl is None or pttl == -2:
+                            continue
+                        expires_at = now + (pttl / 1000 if pttl > 0 else self.ttl_seconds)
+                        self._store_local(redis_key[prefix_len:], json.loads(raw), expires_at)
+                        self._stats["warm_loaded"] += 1
+                        loaded += 1
+            with self._lock:
+                self._loaded = True
+            if loaded:
+                print(f"[CACHE] Warmed {self.namespace} with {loaded} entries from Redis")
+        except Exception as e:
+            self._redis_failed(e)
+        finally:
+            with self._lock:
+                self._warming = False
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value for key, checking local then Redis"""
+        if not self._loaded:
+            self.warm()
+
+        with self._lock:
+            entry = self._local.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at > time.time():
+                    self._local.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._local[key]
+                self._stats["expirations"] += 1
+
+        if self._redis_available():
+            try:
+                pipe = r.pipeline()
+                pipe.get(self._redis_key(key))
+                pipe.pttl(self._redis_key(key))
+                raw, pttl = pipe.execute()
+                if raw is not None:
+                    value = json.loads(raw)
+                    expires_at = time.time() + (pttl / 1000 if pttl and pttl > 0 else self.ttl_seconds)
+                    with self._lock:
+                        self._store_local(key, value, expires_at)
+                        self._stats["redis_hits"] += 1
+                    return value
+            except Exception as e:
+                self._redis_failed(e)
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return default
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None):
+        """Store value in both tiers with a TTL (defaults to the cache TTL)"""
+        ttl = ttl_seconds or self.ttl_seconds
+        with self._lock:
+            self._store_local(key, value, time.time() + ttl)
+            self._stats["sets"] += 1
+        if self._redis_available():
+            try:
+                r.setex(self._redis_key(key), ttl, json.dumps(value))
+            except Exception as e:
+                self._redis_failed(e)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self) -> list:
+        with self._lock:
+            now = time.time()
+            return [k for k, (_, expires_at) in self._local.items() if expires_at > now]
+
+    def clear(self, shared: bool = True):
+        """Clear the local tier and, unless shared=False, this namespace in Redis"""
+        with self._lock:
+            self._local.clear()
+            for counter in self._stats:
+                self._stats[counter] = 0
+        if shared and self._redis_available():
+            try:
+                keys = list(r.scan_iter(match=self._redis_key("*"), count=500))
+                for start in range(0, len(keys), 500):
+                    r.delete(*keys[start:start + 500])
+            except Exception as e:
+                self._redis_failed(e)
+
+    def redis_size(self) -> Optional[int]:
+        """Number of entries in the shared tier, or None if Redis is unreachable"""
+        if not self._redis_available():
+            return None
+        try:
+            return sum(1 for _ in r.scan_iter(match=self._redis_key("*"), count=500))
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            local_size = len(self._local)
+        lookups = stats["hits"] + stats["redis_hits"] + stats["misses"]
+        stats.update({
+            "namespace": self.namespace,
+            "local_size": local_size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hit_rate": round((stats["hits"] + stats["redis_hits"]) / lookups, 4) if lookups else 0.0,
+        })
+        return stats
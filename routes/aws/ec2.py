@@ -1,20 +1,23 @@
 # src/routes/aws/ec2.py
 from fastapi import APIRouter
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from fastapi.responses import JSONResponse
 
-from data.aws.ec2 import fetch_ec2_instances, summarize_cost_by_region
+from data.aws.ec2 import collect_ec2_inventory, fetch_ec2_instances_multi_region, summarize_cost_by_region
 
 router = APIRouter()
 
 class RegionSummaryRequest(BaseModel):
-    region: str
+    region: Optional[str] = None  # "all" scans every enabled region
+    regions: Optional[List[str]] = None  # scan these regions concurrently
 
 class RegionSummaryItem(BaseModel):
     region: str
     instance_count: int
     estimated_hourly_cost: float
+    estimated_monthly_cost: float = 0.0
+    estimated_monthly_savings: float = 0.0
 
 class RegionSummaryResponse(BaseModel):
     summary: List[RegionSummaryItem]
@@ -23,13 +26,17 @@ class RegionSummaryResponse(BaseModel):
 def ec2_region_summary(request: RegionSummaryRequest):
     """
     Summarize EC2 cost concentration by region.
+    Pass `regions` (or region="all") to scan several regions in parallel.
+    Counts and on-demand costs come from the metrics-free inventory, so savings are 0 here;
+    run an analysis for savings.
     """
     try:
-        ec2_data = fetch_ec2_instances(region=request.region)
+        if request.regions or (request.region or "").lower() == "all":
+            ec2_data = fetch_ec2_instances_multi_region(regions=request.regions or ["all"], inventory_only=True)
+        else:
+            ec2_data = collect_ec2_inventory(region=request.region)
         if not ec2_data:
             return JSONResponse(status_code=404, content={"message": "No EC2 instances found."})
-        else:
-            print(ec2_data)
         summary = summarize_cost_by_region(ec2_data)
         return {"summary": summary}
     except Exception as e: